@@ -3,23 +3,52 @@
 文件名：app.py
 """
 
-from flask import Flask, jsonify, request, g
+from flask import Flask, jsonify, request, g, has_app_context, has_request_context, make_response
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import pymysql
 from datetime import datetime, timedelta
 import time
-import random
+import threading
+import hashlib
 import json
 import os
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dotenv import load_dotenv
 import jwt
-import requests
+
+from db_pool import ConnectionPool, ScopedConnection
+from db_router import ReplicaRouter
+from batch_loader import load_children, attach_children
+from stock_reservation import StockReservations, StockReservationError
+from id_generator import SnowflakeGenerator, WorkerIdLease, WorkerIdUnavailable
+from idempotency import DbIdempotencyStore, MemoryIdempotencyStore, IdempotencyConflict, IdempotencyMismatch
+from order_scheduler import OrderAutoCancelScheduler
+from order_state import OrderStateMachine
+from pagination import keyset_condition, paginate, InvalidCursor
+from totals import TotalsCache, parse_total_mode
+from catalog import ProductCatalog
+from search_index import ProductSearchIndex, NoteSearchIndex
+from suggest import SuggestEngine, RecentQueries
+from search_history import SearchHistoryBuffer
+from token_cache import TokenCache
+import refresh_tokens
+from passwords import PasswordHasher, PasswordHasherBusy, needs_rehash
+from login_throttle import LoginThrottle
+from wx_client import WeChatClient
+import migrations
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Last-Write'])
+
+# 服务前的可信反向代理层数：设置后按 X-Forwarded-For 取客户端 IP（0 表示直接对外、不经代理）；
+# 未设置时无法确定真实客户端 IP（代理后 remote_addr 是代理地址），登录限流不按 IP 计数
+TRUSTED_PROXIES = os.getenv('TRUSTED_PROXIES')
+if TRUSTED_PROXIES and int(TRUSTED_PROXIES) > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(TRUSTED_PROXIES))
 
 app.config['SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-here-change-in-production')
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -41,63 +70,299 @@ db_config = {
 
 WX_APP_ID = os.getenv('WX_APP_ID', '')
 WX_APP_SECRET = os.getenv('WX_APP_SECRET', '')
+# JWT_EXPIRE_DAYS 为 refresh token 有效期；access token 短期有效，过期后用 refresh token 换新
 JWT_EXPIRE_DAYS = int(os.getenv('JWT_EXPIRE_DAYS', 7))
-
-def init_db_schema():
-    try:
-        import hashlib
-        conn = pymysql.connect(**db_config)
-        with conn.cursor() as cursor:
-            cursor.execute("DESCRIBE users")
-            existing_columns = {row['Field'] for row in cursor.fetchall()}
-            
-            required_columns = {
-                'password': "VARCHAR(255) DEFAULT ''",
-                'login_attempts': "INT DEFAULT 0",
-                'locked_until': "TIMESTAMP NULL"
-            }
-            
-            for col_name, col_def in required_columns.items():
-                if col_name not in existing_columns:
-                    cursor.execute(f"ALTER TABLE users ADD COLUMN {col_name} {col_def}")
-                    print(f"  ✅ 添加字段: {col_name}")
-            
-            default_password = hashlib.sha256('123456'.encode()).hexdigest()
-            cursor.execute("UPDATE users SET password = %s WHERE password IS NULL OR password = ''", (default_password,))
-            if cursor.rowcount > 0:
-                print(f"  ✅ 已为{cursor.rowcount}个用户设置默认密码: 123456")
-            
-            conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"数据库初始化警告: {e}")
-
-init_db_schema()
-
-def get_db_connection():
+ACCESS_TOKEN_MINUTES = int(os.getenv('ACCESS_TOKEN_MINUTES', 30))
+
+# 连接池配置：max_size 为单进程最多持有的连接数，多进程部署时注意不要超过 MySQL max_connections
+db_pool_settings = {
+    'min_idle': int(os.getenv('DB_POOL_MIN_IDLE', 2)),
+    'max_idle': int(os.getenv('DB_POOL_MAX_IDLE', 10)),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 20)),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+    'recycle_uses': int(os.getenv('DB_POOL_RECYCLE_USES', 1000)),
+    'recycle_seconds': int(os.getenv('DB_POOL_RECYCLE_SECONDS', 3600)),
+    'ping_idle_seconds': int(os.getenv('DB_POOL_PING_IDLE_SECONDS', 30))
+}
+db_pool = ConnectionPool(db_config, **db_pool_settings)
+
+# 读写分离：DB_REPLICAS 形如 "10.0.0.2:3306,10.0.0.3:3306"，为空时所有读请求走主库
+db_router = ReplicaRouter.from_dsn_list(
+    os.getenv('DB_REPLICAS', ''),
+    db_config,
+    pool_kwargs=db_pool_settings,
+    max_lag_seconds=float(os.getenv('DB_REPLICA_MAX_LAG', 3)),
+    strategy=os.getenv('DB_READ_STRATEGY', 'least_loaded'),
+    secret=app.config['SECRET_KEY']
+)
+# 写入标记：有提交的请求在响应头（及 Cookie）中返回，客户端在后续请求中原样带回，任一进程都会让该用户的读请求走主库
+WRITE_MARKER_HEADER = 'X-Last-Write'
+WRITE_MARKER_COOKIE = 'last_write'
+
+# 待支付订单的支付时限，超时由后台线程自动取消
+ORDER_PAYMENT_WINDOW_SECONDS = int(os.getenv('ORDER_PAYMENT_WINDOW_SECONDS', 1800))
+
+# 库存预占：下单时扣减，取消或超时未支付时回补；HOT_SKU_IDS 形如 "12,35"，这些商品的扣减走进程内合并队列
+stock_reservations = StockReservations(
+    db_pool,
+    hold_seconds=ORDER_PAYMENT_WINDOW_SECONDS,
+    hot_product_ids=[int(x) for x in os.getenv('HOT_SKU_IDS', '').split(',') if x.strip()]
+)
+
+# 订单状态流转统一经状态机执行，库存预占随流转在同一事务内确认/释放
+order_states = OrderStateMachine()
+
+@order_states.subscribe(actions=['pay'])
+def confirm_stock_on_pay(cursor, transition):
+    stock_reservations.confirm(cursor, transition.order_ids)
+
+@order_states.subscribe(actions=['cancel', 'expire'])
+def release_stock_on_cancel(cursor, transition):
+    stock_reservations.release(cursor, transition.order_ids)
+
+order_scheduler = OrderAutoCancelScheduler(
+    db_pool,
+    order_states,
+    payment_window=ORDER_PAYMENT_WINDOW_SECONDS,
+    batch_size=int(os.getenv('ORDER_CANCEL_BATCH_SIZE', 200)),
+    # 多进程只由持有命名锁的主节点执行取消，主节点每 ORDER_CANCEL_RESCAN_SECONDS 秒扫描其他进程创建的订单
+    leader_lock='pet_platform_order_auto_cancel',
+    rehydrate_interval=int(os.getenv('ORDER_CANCEL_RESCAN_SECONDS', 60))
+)
+
+# 订单号生成：每个进程首次下单时在 worker_id_leases 表中租用唯一的机器号（0~1023），
+# WORKER_ID 只是优先尝试的机器号，被其他进程占用时自动改用空闲机器号
+order_id_generator = SnowflakeGenerator(lease=WorkerIdLease(
+    db_pool,
+    ttl=int(os.getenv('WORKER_ID_LEASE_SECONDS', 60)),
+    preferred=int(os.environ['WORKER_ID']) if os.getenv('WORKER_ID') else None
+))
+
+# 幂等键：客户端重试时携带相同的 Idempotency-Key 头，重放直接返回首次响应
+# 默认存储在数据库（idempotency_keys 表，多进程共享）；IDEMPOTENCY_STORE=memory 仅用于单进程开发环境
+if os.getenv('IDEMPOTENCY_STORE', 'db') == 'memory':
+    idempotency_store = MemoryIdempotencyStore(ttl=int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 86400)))
+else:
+    idempotency_store = DbIdempotencyStore(db_pool, ttl=int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 86400)))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 5))
+
+# 列表总数缓存：相同过滤条件的 COUNT(*) 在 TOTALS_CACHE_TTL 秒内复用，相关写入后失效
+totals_cache = TotalsCache(ttl=int(os.getenv('TOTALS_CACHE_TTL', 30)))
+
+# 商品目录常驻内存，按 products.updated_at 增量刷新；首次加载完成前相关接口仍查库
+product_catalog = ProductCatalog(
+    db_pool,
+    poll_interval=float(os.getenv('CATALOG_POLL_INTERVAL', 5)),
+    full_reload_interval=int(os.getenv('CATALOG_FULL_RELOAD_INTERVAL', 600))
+)
+
+# 商品/笔记搜索倒排索引：商品随目录变更更新，笔记按 updated_at 增量拉取；就绪前搜索仍走 LIKE
+product_search = ProductSearchIndex()
+product_catalog.subscribe(product_search.apply)
+note_search = NoteSearchIndex(db_pool, poll_interval=float(os.getenv('NOTE_SEARCH_POLL_INTERVAL', 5)))
+
+# 搜索联想：商品名/热门搜索词前缀树 + 按用户的最近搜索词 LRU
+suggest_engine = SuggestEngine(
+    db_pool,
+    popular_refresh_interval=int(os.getenv('SUGGEST_POPULAR_REFRESH_SECONDS', 300))
+)
+product_catalog.subscribe(suggest_engine.apply_products)
+
+# 搜索历史：写后缓冲，后台每 SEARCH_HISTORY_FLUSH_SECONDS 秒批量 upsert，每个用户保留最近 SEARCH_HISTORY_KEEP 条；
+# 联想使用的最近历史缓存在内存中，RECENT_QUERIES_TTL_SECONDS 秒后重新加载；历史列表接口每次读库
+SEARCH_HISTORY_KEEP = int(os.getenv('SEARCH_HISTORY_KEEP', 50))
+search_history_buffer = SearchHistoryBuffer(
+    db_pool,
+    flush_interval=float(os.getenv('SEARCH_HISTORY_FLUSH_SECONDS', 2)),
+    keep_per_user=SEARCH_HISTORY_KEEP
+)
+recent_queries = RecentQueries(max_users=int(os.getenv('RECENT_QUERIES_MAX_USERS', 10000)),
+                               per_user=SEARCH_HISTORY_KEEP,
+                               ttl=float(os.getenv('RECENT_QUERIES_TTL_SECONDS', 30)))
+
+# 已验证 access token 缓存 + 按用户的 token 代数：access token 的校验不查库，代数过时的 token 拒绝
+token_cache = TokenCache(
+    max_entries=int(os.getenv('TOKEN_CACHE_SIZE', 50000)),
+    token_lifetime=ACCESS_TOKEN_MINUTES * 60
+)
+
+# 密码哈希（scrypt/PBKDF2）在独立进程池中计算，PASSWORD_HASH_WORKERS=0 时在请求线程内计算
+password_hasher = PasswordHasher(workers=int(os.getenv('PASSWORD_HASH_WORKERS', 2)))
+
+# 登录失败计数在内存滑动窗口中（按手机号与 IP），只有锁定时才写 users.locked_until
+LOGIN_LOCK_SECONDS = int(os.getenv('LOGIN_LOCK_SECONDS', 1800))
+login_throttle = LoginThrottle(
+    max_failures=int(os.getenv('LOGIN_MAX_FAILURES', 5)),
+    lock_seconds=LOGIN_LOCK_SECONDS,
+    ip_max_failures=int(os.getenv('LOGIN_IP_MAX_FAILURES', 50))
+)
+
+# 微信接口客户端：长连接池 + 熔断 + 并发上限 + code 结果短期缓存；WX_API_BASE 可指向 wx_fake_server.py
+wx_client = WeChatClient(
+    WX_APP_ID,
+    WX_APP_SECRET,
+    base_url=os.getenv('WX_API_BASE', 'https://api.weixin.qq.com'),
+    max_concurrent=int(os.getenv('WX_MAX_CONCURRENT', 10))
+)
+
+# 统一搜索的子检索线程池：商品与笔记并行，单路超过 SEARCH_SOURCE_TIMEOUT_MS 时返回部分结果
+search_executor = ThreadPoolExecutor(max_workers=int(os.getenv('SEARCH_WORKERS', 8)), thread_name_prefix='search')
+SEARCH_SOURCE_TIMEOUT_MS = int(os.getenv('SEARCH_SOURCE_TIMEOUT_MS', 250))
+
+def get_db_connection(read_only=False):
+    """
+    获取数据库连接：请求内首次调用时从连接池借出并挂在 g 上，之后的调用（包括各 helper）共用同一连接，
+    请求结束时由 release_db_connection 统一归还；不在应用上下文中时（如后台线程）直接借出，需自行 close()。
+    read_only=True 表示调用方只做查询，可路由到从库；本请求已持有主库连接或用户刚写入过时仍走主库。
+    """
     try:
-        connection = pymysql.connect(**db_config)
-        return connection
+        if not has_app_context():
+            return _borrow_read_connection(None) if read_only else db_pool.connection()
+        conn = g.get('_db_conn')
+        if read_only:
+            conn = conn or g.get('_db_read_conn')
+            if conn is None:
+                conn = g._db_read_conn = ScopedConnection(
+                    _borrow_read_connection(g.get('user_id'), _request_write_marker()))
+            return conn
+        if conn is None:
+            conn = g._db_conn = ScopedConnection(db_pool.connection())
+        return conn
     except Exception as e:
         print(f"数据库连接失败: {e}")
         return None
 
-def generate_jwt_token(user_id):
+def _request_write_marker():
+    if not has_request_context():
+        return None
+    return request.headers.get(WRITE_MARKER_HEADER) or request.cookies.get(WRITE_MARKER_COOKIE)
+
+def _borrow_read_connection(user_id, marker=None):
+    """只读连接：优先从库，未配置从库、从库不可用或用户刚写入过时使用主库"""
+    if db_router.enabled and not db_router.must_read_primary(user_id, marker):
+        replica = db_router.pick()
+        if replica is not None:
+            try:
+                conn = replica.connection()
+                db_router.count_replica_read()
+                return conn
+            except Exception as e:
+                db_router.mark_unhealthy(replica, e)
+    return db_pool.connection()
+
+@app.after_request
+def attach_write_marker(response):
+    """本请求提交过写入时返回写入标记，客户端带回后即使落到其他进程也能读到自己的写入"""
+    conn = g.get('_db_conn')
+    if conn is not None and conn.committed:
+        marker = db_router.issue_write_marker()
+        if marker:
+            response.headers[WRITE_MARKER_HEADER] = marker
+            response.set_cookie(WRITE_MARKER_COOKIE, marker, max_age=int(db_router.sticky_seconds) + 1,
+                                httponly=True, samesite='Lax')
+    return response
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    """请求结束时归还连接；未提交的事务会在归还时回滚，有提交的请求记为该用户的近期写入"""
+    read_conn = g.pop('_db_read_conn', None)
+    if read_conn is not None:
+        read_conn.release()
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        if conn.committed:
+            db_router.mark_write(g.get('user_id'))
+        conn.release()
+
+# 结构迁移由部署时的 `python migrations.py` 一次性完成，worker 启动时不做 DDL；
+# 每个进程只在首个请求时读取一次版本号，落后时给出提示
+_schema_check = {'done': False, 'lock': threading.Lock()}
+
+@app.before_request
+def check_schema_version_once():
+    if _schema_check['done']:
+        return
+    with _schema_check['lock']:
+        if _schema_check['done']:
+            return
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            current = migrations.get_schema_version(conn)
+        except Exception as e:
+            print(f"⚠️  读取数据库结构版本失败: {e}")
+            return
+        if current < migrations.latest_version():
+            print(f"⚠️  数据库结构版本 {current} 落后于 {migrations.latest_version()}，请执行: python migrations.py")
+        _schema_check['done'] = True
+
+@app.before_request
+def start_background_workers():
+    # 首个请求时启动（而不是导入时），避免多进程服务器 fork 前启动的线程在子进程中丢失
+    order_scheduler.start()
+    product_catalog.start()
+    note_search.start()
+    suggest_engine.start()
+    search_history_buffer.start()
+
+def generate_jwt_token(user_id, generation=0, token_type='access', jti=None, now=None):
+    """签发 token；gen 为用户当前的 token_generation，退出登录/修改密码后旧代数的 token 失效"""
+    now = now or datetime.utcnow()
+    if token_type == 'refresh':
+        expires = now + timedelta(days=JWT_EXPIRE_DAYS)
+    else:
+        expires = now + timedelta(minutes=ACCESS_TOKEN_MINUTES)
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(days=JWT_EXPIRE_DAYS),
-        'iat': datetime.utcnow()
+        'type': token_type,
+        'gen': generation,
+        'exp': expires,
+        'iat': now
     }
+    if jti:
+        payload['jti'] = jti
     return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
 
+def issue_tokens(cursor, user_id, generation=0):
+    """
+    登录/刷新时返回的 token 组：token 为 access token，refreshToken 用于 POST /api/auth/refresh。
+    refresh token 的 jti 通过 cursor 登记到 refresh_tokens 表，调用方负责提交事务
+    """
+    now = datetime.utcnow()
+    jti = refresh_tokens.new_jti()
+    refresh_tokens.register(cursor, user_id, jti, now + timedelta(days=JWT_EXPIRE_DAYS))
+    return {
+        'token': generate_jwt_token(user_id, generation, now=now),
+        'refreshToken': generate_jwt_token(user_id, generation, 'refresh', jti=jti, now=now),
+        'expiresIn': ACCESS_TOKEN_MINUTES * 60
+    }
+
 def verify_jwt_token(token):
+    """校验 access token，只用内存（签名 + 代数），不查库"""
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
     try:
         payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload['user_id']
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    # refresh token 不能当作 access token 使用；没有 type 的为升级前签发的旧 token（有效期 JWT_EXPIRE_DAYS），需重新登录
+    if payload.get('type') != 'access':
+        return None
+    if not token_cache.put(token, payload['user_id'], payload.get('exp'), payload.get('gen', 0)):
+        return None
+    return payload['user_id']
+
+def bump_token_generation(cursor, user_id):
+    """用户 token 代数加一（此前签发的 access/refresh token 全部失效），返回新代数"""
+    cursor.execute("UPDATE users SET token_generation = token_generation + 1 WHERE id = %s", (user_id,))
+    refresh_tokens.revoke_user(cursor, user_id)
+    cursor.execute("SELECT token_generation FROM users WHERE id = %s", (user_id,))
+    row = cursor.fetchone()
+    return row['token_generation'] if row else 0
 
 def auth_required(f):
     def decorated(*args, **kwargs):
@@ -128,16 +393,72 @@ def auth_required(f):
     decorated.__name__ = f.__name__
     return decorated
 
-def wx_code2session(code):
+def idempotent(f):
+    """
+    支持 Idempotency-Key 请求头（需放在 auth_required 之后）：同一用户、同一接口、同一键的重复请求返回首次的响应；
+    首次请求处理中时重复请求等待其完成，超时返回 409；只缓存成功（2xx/3xx）的响应，
+    4xx/5xx 响应和异常会释放幂等键，客户端修正后可用同一键重试。
+    幂等键占位与业务写入使用同一个请求连接、同一个事务。
+    """
+    def decorated(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({
+                'code': 400,
+                'message': 'Idempotency-Key 过长'
+            }), 400
+
+        scoped_key = f'{g.user_id}:{request.method}:{request.path}:{key}'
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        conn = get_db_connection()
+        try:
+            cached = idempotency_store.begin(scoped_key, fingerprint, IDEMPOTENCY_WAIT_SECONDS, conn=conn)
+        except IdempotencyConflict:
+            return jsonify({
+                'code': 409,
+                'message': '相同请求正在处理中，请稍后重试'
+            }), 409
+        except IdempotencyMismatch:
+            return jsonify({
+                'code': 422,
+                'message': 'Idempotency-Key 已用于内容不同的请求'
+            }), 422
+
+        if cached is not None:
+            body, status, mimetype = cached
+            response = app.response_class(body, status=status, mimetype=mimetype)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency_store.abort(scoped_key, conn=conn)
+            raise
+        if response.status_code >= 400:
+            idempotency_store.abort(scoped_key, conn=conn)
+        else:
+            idempotency_store.complete(scoped_key, (response.get_data(), response.status_code, response.mimetype),
+                                       conn=conn)
+        return response
+
+    decorated.__name__ = f.__name__
+    return decorated
+
+def run_after_commit(description, func, *args):
+    """
+    数据已提交后更新内存索引等附属结构：失败只记日志，不影响已成功的响应（后台轮询会修正索引），
+    避免客户端把已保存的数据当作失败重试而重复提交
+    """
     try:
-        url = f'https://api.weixin.qq.com/sns/jscode2session?appid={WX_APP_ID}&secret={WX_APP_SECRET}&js_code={code}&grant_type=authorization_code'
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        if 'errcode' in data:
-            return None, data.get('errmsg', '微信登录失败')
-        return data, None
+        func(*args)
     except Exception as e:
-        return None, str(e)
+        print(f"⚠️  {description}失败（等待后台刷新修正）: {e}")
+
+def wx_code2session(code):
+    return wx_client.code2session(code)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -169,13 +490,28 @@ def health_check():
                 'data': {
                     'status': 'running',
                     'database': 'connected',
+                    'pool': db_pool.stats(),
+                    'replication': db_router.stats() if db_router.enabled else None,
+                    'stock': stock_reservations.stats(),
+                    'idempotency': idempotency_store.stats(),
+                    'order_auto_cancel': order_scheduler.stats(),
+                    'totals_cache': totals_cache.stats(),
+                    'catalog': product_catalog.stats(),
+                    'search_index': {'products': product_search.stats(), 'notes': note_search.stats()},
+                    'suggest': {'engine': suggest_engine.stats(), 'recent_queries': recent_queries.stats()},
+                    'search_history': search_history_buffer.stats(),
+                    'token_cache': token_cache.stats(),
+                    'password_hasher': password_hasher.stats(),
+                    'login_throttle': login_throttle.stats(),
+                    'wechat': wx_client.stats(),
                     'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 }
             })
         else:
             return jsonify({
                 'code': 500,
-                'message': '数据库连接失败'
+                'message': '数据库连接失败',
+                'data': {'pool': db_pool.stats()}
             }), 500
     except Exception as e:
         return jsonify({
@@ -472,7 +808,6 @@ def complete_vaccine(vaccine_id):
 @app.route('/api/auth/login', methods=['POST'])
 def phone_login():
     try:
-        import hashlib
         from datetime import datetime, timedelta
         
         data = request.json
@@ -491,6 +826,20 @@ def phone_login():
                 'message': '密码不能为空'
             }), 400
 
+        # 已锁定的手机号/IP 不查库；未配置 TRUSTED_PROXIES 时只按手机号限流
+        client_ip = request.remote_addr if TRUSTED_PROXIES is not None else None
+        blocked = login_throttle.check(phone, client_ip)
+        if blocked:
+            if blocked[0] == 'ip':
+                return jsonify({
+                    'code': 429,
+                    'message': '登录失败次数过多，请稍后再试'
+                }), 429
+            return jsonify({
+                'code': 403,
+                'message': f'账户已锁定，请{LOGIN_LOCK_SECONDS // 60}分钟后再试'
+            }), 403
+
         conn = get_db_connection()
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM users WHERE phone = %s", (phone,))
@@ -498,53 +847,58 @@ def phone_login():
 
             if not user:
                 conn.close()
+                login_throttle.record_failure(phone, client_ip, count_phone=False)
                 return jsonify({
                     'code': 404,
                     'message': '用户不存在'
                 }), 404
 
             if user.get('locked_until') and user['locked_until'] > datetime.now():
+                # 其他进程写入的锁定：记入内存，锁定期内后续尝试不再查库
                 conn.close()
+                login_throttle.lock(phone, user['locked_until'].timestamp())
                 return jsonify({
                     'code': 403,
-                    'message': '账户已锁定，请30分钟后再试'
+                    'message': f'账户已锁定，请{LOGIN_LOCK_SECONDS // 60}分钟后再试'
                 }), 403
 
-            password_hash = hashlib.sha256(password.encode()).hexdigest()
-            
-            if user.get('password') != password_hash:
-                attempts = (user.get('login_attempts') or 0) + 1
-                if attempts >= 5:
-                    cursor.execute("""
-                        UPDATE users SET login_attempts = %s, locked_until = %s WHERE id = %s
-                    """, (attempts, datetime.now() + timedelta(minutes=30), user['id']))
+            if not password_hasher.verify(password, user.get('password')):
+                remaining, locked = login_throttle.record_failure(phone, client_ip)
+                if locked:
+                    cursor.execute("UPDATE users SET locked_until = %s WHERE id = %s",
+                                   (datetime.now() + timedelta(seconds=LOGIN_LOCK_SECONDS), user['id']))
                     conn.commit()
                     conn.close()
                     return jsonify({
                         'code': 403,
-                        'message': '密码错误次数过多，账户已锁定30分钟'
+                        'message': f'密码错误次数过多，账户已锁定{LOGIN_LOCK_SECONDS // 60}分钟'
                     }), 403
-                else:
-                    cursor.execute("UPDATE users SET login_attempts = %s WHERE id = %s", (attempts, user['id']))
-                    conn.commit()
-                    conn.close()
-                    return jsonify({
-                        'code': 401,
-                        'message': f'密码错误，还剩{5-attempts}次机会'
-                    }), 401
+                conn.close()
+                return jsonify({
+                    'code': 401,
+                    'message': f'密码错误，还剩{remaining}次机会'
+                }), 401
 
-            cursor.execute("UPDATE users SET login_attempts = 0, locked_until = NULL WHERE id = %s", (user['id'],))
+            login_throttle.record_success(phone)
+            # 旧 sha256 哈希或成本参数已调高：登录成功时按当前参数重新哈希
+            if needs_rehash(user.get('password')):
+                cursor.execute("UPDATE users SET password = %s WHERE id = %s",
+                               (password_hasher.hash(password), user['id']))
+            # 只在行上残留旧的失败计数/锁定时清理，正常登录不写 users
+            if user.get('login_attempts') or user.get('locked_until'):
+                cursor.execute("UPDATE users SET login_attempts = 0, locked_until = NULL WHERE id = %s", (user['id'],))
+            tokens = issue_tokens(cursor, user['id'], user.get('token_generation') or 0)
             conn.commit()
 
-            token = generate_jwt_token(user['id'])
-
         conn.close()
 
         return jsonify({
             'code': 0,
             'message': '登录成功',
             'data': {
-                'token': token,
+                'token': tokens['token'],
+                'refreshToken': tokens['refreshToken'],
+                'expiresIn': tokens['expiresIn'],
                 'userInfo': {
                     'id': user['id'],
                     'phone': user['phone'],
@@ -554,17 +908,104 @@ def phone_login():
             }
         })
 
+    except PasswordHasherBusy:
+        return jsonify({
+            'code': 503,
+            'message': '系统繁忙，请稍后重试'
+        }), 503
     except Exception as e:
         return jsonify({
             'code': 500,
             'message': f'登录失败: {str(e)}'
         }), 500
 
+@app.route('/api/auth/refresh', methods=['POST'])
+def refresh_token():
+    """
+    用 refresh token 换新的 access/refresh token；此处查库确认 token 代数未过时，
+    并在同一事务中作废本 refresh token（每个 refresh token 只能使用一次，重放返回 401）
+    """
+    try:
+        data = request.json or {}
+        token = data.get('refreshToken')
+        if not token:
+            return jsonify({
+                'code': 400,
+                'message': '缺少refreshToken参数'
+            }), 400
+
+        try:
+            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            payload = None
+        if not payload or payload.get('type') != 'refresh':
+            return jsonify({
+                'code': 401,
+                'message': '无效或过期的refreshToken，请重新登录'
+            }), 401
+
+        user_id = payload['user_id']
+        conn = get_db_connection()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT token_generation FROM users WHERE id = %s", (user_id,))
+            user = cursor.fetchone()
+            if not user:
+                conn.close()
+                return jsonify({
+                    'code': 401,
+                    'message': '用户不存在，请重新登录'
+                }), 401
+            generation = user['token_generation'] or 0
+            # 顺带把数据库中的代数同步到本进程，其他进程的退出登录在这里生效
+            token_cache.set_generation(user_id, generation)
+            if payload.get('gen', 0) != generation or not refresh_tokens.consume(cursor, user_id, payload.get('jti')):
+                conn.rollback()
+                conn.close()
+                return jsonify({
+                    'code': 401,
+                    'message': '登录状态已失效，请重新登录'
+                }), 401
+            tokens = issue_tokens(cursor, user_id, generation)
+            conn.commit()
+        conn.close()
+
+        return jsonify({
+            'code': 0,
+            'message': '刷新成功',
+            'data': tokens
+        })
+
+    except Exception as e:
+        return jsonify({
+            'code': 500,
+            'message': f'刷新token失败: {str(e)}'
+        }), 500
+
+@app.route('/api/auth/logout', methods=['POST'])
+@auth_required
+def logout():
+    """退出登录：token 代数加一，该用户此前签发的 access/refresh token 全部失效"""
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cursor:
+            generation = bump_token_generation(cursor, g.user_id)
+            conn.commit()
+        conn.close()
+        token_cache.set_generation(g.user_id, generation)
+        return jsonify({
+            'code': 0,
+            'message': '已退出登录',
+            'data': None
+        })
+    except Exception as e:
+        return jsonify({
+            'code': 500,
+            'message': f'退出登录失败: {str(e)}'
+        }), 500
+
 @app.route('/api/auth/register', methods=['POST'])
 def phone_register():
     try:
-        import hashlib
-        
         data = request.json
         phone = (data.get('phone') or '').strip()
         password = data.get('password', '')
@@ -588,7 +1029,7 @@ def phone_register():
                 'message': '密码长度需为6-20位'
             }), 400
 
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
+        password_hash = password_hasher.hash(password)
 
         conn = get_db_connection()
         with conn.cursor() as cursor:
@@ -605,16 +1046,17 @@ def phone_register():
                 VALUES (%s, %s, %s, %s)
             """, (phone, password_hash, nickname, f'phone_{phone}'))
             user_id = cursor.lastrowid
+            tokens = issue_tokens(cursor, user_id)
             conn.commit()
-
-            token = generate_jwt_token(user_id)
         conn.close()
 
         return jsonify({
             'code': 0,
             'message': '注册成功',
             'data': {
-                'token': token,
+                'token': tokens['token'],
+                'refreshToken': tokens['refreshToken'],
+                'expiresIn': tokens['expiresIn'],
                 'userInfo': {
                     'id': user_id,
                     'phone': phone,
@@ -624,6 +1066,11 @@ def phone_register():
             }
         })
 
+    except PasswordHasherBusy:
+        return jsonify({
+            'code': 503,
+            'message': '系统繁忙，请稍后重试'
+        }), 503
     except Exception as e:
         return jsonify({
             'code': 500,
@@ -674,11 +1121,11 @@ def user_login():
                 cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
                 user = cursor.fetchone()
 
+            tokens = issue_tokens(cursor, user['id'], user.get('token_generation') or 0)
             conn.commit()
 
         conn.close()
 
-        token = generate_jwt_token(user['id'])
         return jsonify({
             'code': 0,
             'message': '登录成功',
@@ -689,7 +1136,9 @@ def user_login():
                     'avatarUrl': user['avatar_url'],
                     'phone': user['phone']
                 },
-                'token': token
+                'token': tokens['token'],
+                'refreshToken': tokens['refreshToken'],
+                'expiresIn': tokens['expiresIn']
             }
         })
 
@@ -782,8 +1231,6 @@ def update_user_info():
 @auth_required
 def update_password():
     try:
-        import hashlib
-        
         data = request.json
         old_password = data.get('old_password', '')
         new_password = data.get('new_password', '')
@@ -817,25 +1264,34 @@ def update_password():
                     'message': '用户不存在'
                 }), 404
 
-            old_password_hash = hashlib.sha256(old_password.encode()).hexdigest()
-            if user.get('password') and user['password'] != old_password_hash:
+            if user.get('password') and not password_hasher.verify(old_password, user['password']):
                 conn.close()
                 return jsonify({
                     'code': 401,
                     'message': '原密码错误'
                 }), 401
 
-            new_password_hash = hashlib.sha256(new_password.encode()).hexdigest()
+            new_password_hash = password_hasher.hash(new_password)
             cursor.execute("UPDATE users SET password = %s, updated_at = NOW() WHERE id = %s", 
                          (new_password_hash, g.user_id))
+            generation = bump_token_generation(cursor, g.user_id)
+            # 此前签发的 token 全部失效，返回新 token 供当前设备继续使用
+            tokens = issue_tokens(cursor, g.user_id, generation)
             conn.commit()
         conn.close()
+        token_cache.set_generation(g.user_id, generation)
 
         return jsonify({
             'code': 0,
-            'message': '密码修改成功'
+            'message': '密码修改成功',
+            'data': tokens
         })
 
+    except PasswordHasherBusy:
+        return jsonify({
+            'code': 503,
+            'message': '系统繁忙，请稍后重试'
+        }), 503
     except Exception as e:
         return jsonify({
             'code': 500,
@@ -1275,8 +1731,12 @@ def add_to_cart():
 
         conn = get_db_connection()
         with conn.cursor() as cursor:
-            cursor.execute("SELECT id, stock, status FROM products WHERE id = %s", (product_id,))
-            product = cursor.fetchone()
+            record = product_catalog.get(product_id)
+            if record:
+                product = {'id': record.id, 'stock': record.stock, 'status': record.status}
+            else:
+                cursor.execute("SELECT id, stock, status FROM products WHERE id = %s", (product_id,))
+                product = cursor.fetchone()
 
             if not product:
                 return jsonify({
@@ -1447,6 +1907,8 @@ def get_orders():
         status = request.args.get('status', '')
         page = request.args.get('page', 1, type=int)
         page_size = request.args.get('pageSize', 10, type=int)
+        # 传入 cursor（上一页返回的 nextCursor）时按游标翻页，忽略 page
+        keyset_sql, keyset_params = keyset_condition(request.args.get('cursor'))
 
         offset = (page - 1) * page_size
 
@@ -1468,32 +1930,43 @@ def get_orders():
                 sql += " AND status = %s"
                 params.append(status)
 
-            sql += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
-            params.extend([page_size, offset])
+            if keyset_sql:
+                sql += f" AND {keyset_sql} ORDER BY created_at DESC, id DESC LIMIT %s"
+                params.extend(keyset_params + [page_size + 1])
+            else:
+                sql += " ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s"
+                params.extend([page_size + 1, offset])
 
             cursor.execute(sql, params)
-            orders = cursor.fetchall()
+            orders, next_cursor = paginate(cursor.fetchall(), page_size, created_key='createdAt')
 
-            for order in orders:
-                cursor.execute("""
-                    SELECT 
-                        id, product_id as productId,
-                        product_name as name,
-                        spec, price, quantity,
-                        image_url as image
-                    FROM order_items 
-                    WHERE order_id = %s
-                """, (order['id'],))
-                order['items'] = cursor.fetchall()
+            # 整页订单的商品一次查回，按订单分组，避免每个订单一条查询
+            items_by_order = load_children(cursor, """
+                SELECT 
+                    order_id, id, product_id as productId,
+                    product_name as name,
+                    spec, price, quantity,
+                    image_url as image
+                FROM order_items 
+                WHERE order_id IN ({ids})
+                ORDER BY order_id, id
+            """, [order['id'] for order in orders], key='order_id')
+            attach_children(orders, items_by_order, 'items')
 
         conn.close()
 
         return jsonify({
             'code': 0,
             'message': 'success',
-            'data': orders
+            'data': orders,
+            'nextCursor': next_cursor
         })
 
+    except InvalidCursor as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'code': 500,
@@ -1551,6 +2024,7 @@ def get_order_detail(order_id):
 
 @app.route('/api/orders', methods=['POST'])
 @auth_required
+@idempotent
 def create_order():
     try:
         data = request.json
@@ -1579,19 +2053,33 @@ def create_order():
 
             total_amount = 0
             order_items_data = []
+            reserve_lines = {}
+
+            # 结算价格与上下架状态在订单事务内一次查库，不用内存目录（目录按轮询刷新，改价/下架可能尚未生效）
+            product_ids = list(dict.fromkeys(item['productId'] for item in items))
+            cursor.execute(
+                f"SELECT * FROM products WHERE id IN ({', '.join(['%s'] * len(product_ids))})",
+                product_ids
+            )
+            products_by_id = {str(p['id']): p for p in cursor.fetchall()}
 
             for item in items:
-                cursor.execute("SELECT * FROM products WHERE id = %s", (item['productId'],))
-                product = cursor.fetchone()
+                product = products_by_id.get(str(item['productId']))
 
                 if not product:
                     return jsonify({
                         'code': 400,
                         'message': f'商品不存在: {item["productId"]}'
                     }), 400
+                if product.get('status') is not None and product['status'] != 1:
+                    return jsonify({
+                        'code': 400,
+                        'message': f'商品已下架: {product["name"]}'
+                    }), 400
 
                 item_total = product['price'] * item['quantity']
                 total_amount += item_total
+                reserve_lines[product['id']] = reserve_lines.get(product['id'], 0) + int(item['quantity'])
 
                 order_items_data.append({
                     'product_id': product['id'],
@@ -1617,7 +2105,7 @@ def create_order():
 
             total_amount -= coupon_discount
 
-            order_number = f'OD{datetime.now().strftime("%Y%m%d%H%M%S")}{random.randint(1000, 9999)}'
+            order_number = f'OD{order_id_generator.next_id()}'
             address_info = json.dumps({
                 'name': address['name'],
                 'phone': address['phone'],
@@ -1634,12 +2122,24 @@ def create_order():
             """, (order_number, g.user_id, total_amount, 'pending', address_info, remark))
             order_id = cursor.lastrowid
 
-            for item_data in order_items_data:
-                cursor.execute("""
+            # 条件扣减库存，任何一件不足则整单回滚
+            try:
+                hot_taken = stock_reservations.reserve(cursor, order_id, reserve_lines)
+            except StockReservationError as e:
+                conn.rollback()
+                product = products_by_id.get(str(e.product_id)) or {}
+                return jsonify({
+                    'code': 400,
+                    'message': f'{e}: {product.get("name", e.product_id)}'
+                }), 400
+
+            try:
+                # executemany 会把多行合并成一条 INSERT ... VALUES (...), (...) 发送
+                cursor.executemany("""
                     INSERT INTO order_items 
                     (order_id, product_id, product_name, spec, price, quantity, image_url)
                     VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
+                """, [(
                     order_id,
                     item_data['product_id'],
                     item_data['product_name'],
@@ -1647,18 +2147,24 @@ def create_order():
                     item_data['price'],
                     item_data['quantity'],
                     item_data['image_url']
-                ))
+                ) for item_data in order_items_data])
 
-            for item in items:
-                cursor.execute("DELETE FROM cart WHERE user_id = %s AND product_id = %s",
-                             (g.user_id, item['productId']))
-
-            conn.commit()
+                cursor.execute(
+                    f"DELETE FROM cart WHERE user_id = %s AND product_id IN ({', '.join(['%s'] * len(product_ids))})",
+                    [g.user_id] + product_ids
+                )
+                conn.commit()
+            except Exception:
+                # 热门商品的库存在独立事务中已扣减，订单没落库时要补回去
+                conn.rollback()
+                stock_reservations.compensate(hot_taken)
+                raise
 
             cursor.execute("SELECT * FROM orders WHERE id = %s", (order_id,))
             new_order = cursor.fetchone()
 
         conn.close()
+        run_after_commit('订单超时取消登记', order_scheduler.schedule, order_id, new_order['created_at'])
 
         return jsonify({
             'code': 0,
@@ -1666,14 +2172,33 @@ def create_order():
             'data': new_order
         })
 
+    except WorkerIdUnavailable as e:
+        print(f"⚠️  订单号机器号不可用: {e}")
+        return jsonify({
+            'code': 503,
+            'message': '系统繁忙，请稍后重试'
+        }), 503
     except Exception as e:
         return jsonify({
             'code': 500,
             'message': f'创建订单失败: {str(e)}'
         }), 500
 
+def order_transition_error(result, invalid_state_message):
+    """订单状态流转失败时的统一响应"""
+    if result.reason == 'not_found':
+        return jsonify({
+            'code': 404,
+            'message': '订单不存在或无权限'
+        }), 404
+    return jsonify({
+        'code': 400,
+        'message': invalid_state_message
+    }), 400
+
 @app.route('/api/orders/pay', methods=['POST'])
 @auth_required
+@idempotent
 def pay_order():
     try:
         data = request.json
@@ -1688,32 +2213,14 @@ def pay_order():
 
         conn = get_db_connection()
         with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, status FROM orders 
-                WHERE id = %s AND user_id = %s
-            """, (order_id, g.user_id))
-            order = cursor.fetchone()
-
-            if not order:
-                return jsonify({
-                    'code': 404,
-                    'message': '订单不存在或无权限'
-                }), 404
-
-            if order['status'] != 'pending':
-                return jsonify({
-                    'code': 400,
-                    'message': '订单状态不允许支付'
-                }), 400
-
-            cursor.execute("""
-                UPDATE orders 
-                SET status = 'paid', payment_method = %s, payment_status = 1
-                WHERE id = %s
-            """, (payment_method, order_id))
+            result = order_states.transition(cursor, order_id, 'pay', user_id=g.user_id,
+                                             payment_method=payment_method, payment_status=1)
+            if not result.ok:
+                return order_transition_error(result, '订单状态不允许支付')
             conn.commit()
 
         conn.close()
+        run_after_commit('订单超时取消登记', order_scheduler.discard, result.order_id)
 
         return jsonify({
             'code': 0,
@@ -1742,28 +2249,13 @@ def cancel_order():
 
         conn = get_db_connection()
         with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, status FROM orders 
-                WHERE id = %s AND user_id = %s
-            """, (order_id, g.user_id))
-            order = cursor.fetchone()
-
-            if not order:
-                return jsonify({
-                    'code': 404,
-                    'message': '订单不存在或无权限'
-                }), 404
-
-            if order['status'] not in ['pending', 'paid']:
-                return jsonify({
-                    'code': 400,
-                    'message': '订单无法取消'
-                }), 400
-
-            cursor.execute("UPDATE orders SET status = 'canceled' WHERE id = %s", (order_id,))
+            result = order_states.transition(cursor, order_id, 'cancel', user_id=g.user_id)
+            if not result.ok:
+                return order_transition_error(result, '订单无法取消')
             conn.commit()
 
         conn.close()
+        run_after_commit('订单超时取消登记', order_scheduler.discard, result.order_id)
 
         return jsonify({
             'code': 0,
@@ -1792,25 +2284,9 @@ def confirm_order():
 
         conn = get_db_connection()
         with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, status FROM orders 
-                WHERE id = %s AND user_id = %s
-            """, (order_id, g.user_id))
-            order = cursor.fetchone()
-
-            if not order:
-                return jsonify({
-                    'code': 404,
-                    'message': '订单不存在或无权限'
-                }), 404
-
-            if order['status'] != 'paid':
-                return jsonify({
-                    'code': 400,
-                    'message': '订单状态不允许确认收货'
-                }), 400
-
-            cursor.execute("UPDATE orders SET status = 'completed' WHERE id = %s", (order_id,))
+            result = order_states.transition(cursor, order_id, 'confirm', user_id=g.user_id)
+            if not result.ok:
+                return order_transition_error(result, '订单状态不允许确认收货')
             conn.commit()
 
         conn.close()
@@ -1901,6 +2377,20 @@ def add_note():
             ))
             note_id = cursor.lastrowid
             conn.commit()
+        totals_cache.invalidate(f'pet_notes:{g.user_id}')
+        now = datetime.now()
+        run_after_commit('笔记搜索索引更新', note_search.upsert, {
+            'id': note_id,
+            'user_id': g.user_id,
+            'title': data['title'],
+            'content': data.get('content', ''),
+            'category': data.get('category', 'daily'),
+            'images': json.dumps(data.get('images', []), ensure_ascii=False),
+            'tags': json.dumps(data.get('tags', []), ensure_ascii=False),
+            'status': 1,
+            'created_at': now,
+            'updated_at': now
+        })
 
         conn.close()
 
@@ -1938,6 +2428,8 @@ def delete_note(note_id):
 
             cursor.execute("UPDATE pet_notes SET status = 0 WHERE id = %s", (note_id,))
             conn.commit()
+        totals_cache.invalidate(f'pet_notes:{g.user_id}')
+        run_after_commit('笔记搜索索引更新', note_search.remove, note_id)
 
         conn.close()
 
@@ -2277,8 +2769,10 @@ def add_favorite_handler():
 
         conn = get_db_connection()
         with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM products WHERE id = %s", (product_id,))
-            product = cursor.fetchone()
+            product = product_catalog.get(product_id)
+            if not product:
+                cursor.execute("SELECT id FROM products WHERE id = %s", (product_id,))
+                product = cursor.fetchone()
 
             if not product:
                 return jsonify({
@@ -2498,67 +2992,76 @@ def get_products():
         category = request.args.get('category', '')
         sort_type = request.args.get('sortType', 'default')
         keyword = request.args.get('keyword', '')
+        total_mode = parse_total_mode(request.args)
 
         offset = (page - 1) * page_size
 
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            count_sql = "SELECT COUNT(*) as total FROM products p WHERE p.status = 1"
-            count_params = []
-
-            if category:
-                count_sql += " AND p.category = %s"
-                count_params.append(category)
-            if keyword:
-                count_sql += " AND (p.name LIKE %s OR p.description LIKE %s)"
-                keyword_pattern = f"%{keyword}%"
-                count_params.extend([keyword_pattern, keyword_pattern])
-
-            cursor.execute(count_sql, count_params)
-            total_result = cursor.fetchone()
-            total = total_result['total'] if total_result else 0
-
-            sql = "SELECT p.*, pc.icon as categoryIcon FROM products p LEFT JOIN pet_categories pc ON p.category = pc.name WHERE p.status = 1"
-            params = []
-
-            if category:
-                sql += " AND p.category = %s"
-                params.append(category)
-            if keyword:
-                sql += " AND (p.name LIKE %s OR p.description LIKE %s)"
-                keyword_pattern = f"%{keyword}%"
-                params.extend([keyword_pattern, keyword_pattern])
-
-            if sort_type == 'price_asc':
-                sql += " ORDER BY p.price ASC"
-            elif sort_type == 'price_desc':
-                sql += " ORDER BY p.price DESC"
-            elif sort_type == 'sales':
-                sql += " ORDER BY p.sales DESC"
-            elif sort_type == 'rating':
-                sql += " ORDER BY p.rating DESC"
-            else:
-                sql += " ORDER BY p.created_at DESC"
+        if not keyword and product_catalog.ready:
+            # 非关键词查询直接由内存目录中预排好序的 ID 列表分页，关键词检索仍走 SQL
+            records, total = product_catalog.list(category, sort_type, offset, page_size)
+            products = [record.to_dict(with_category_icon=True) for record in records]
+            has_more = offset + len(products) < total
+        else:
+            conn = get_db_connection(read_only=True)
+            with conn.cursor() as cursor:
+                count_sql = "SELECT COUNT(*) as total FROM products p WHERE p.status = 1"
+                count_params = []
+
+                if category:
+                    count_sql += " AND p.category = %s"
+                    count_params.append(category)
+                if keyword:
+                    count_sql += " AND (p.name LIKE %s OR p.description LIKE %s)"
+                    keyword_pattern = f"%{keyword}%"
+                    count_params.extend([keyword_pattern, keyword_pattern])
+
+                total = totals_cache.total(cursor, count_sql, count_params, tags=['products'], mode=total_mode)
+
+                sql = "SELECT p.*, pc.icon as categoryIcon FROM products p LEFT JOIN pet_categories pc ON p.category = pc.name WHERE p.status = 1"
+                params = []
+
+                if category:
+                    sql += " AND p.category = %s"
+                    params.append(category)
+                if keyword:
+                    sql += " AND (p.name LIKE %s OR p.description LIKE %s)"
+                    keyword_pattern = f"%{keyword}%"
+                    params.extend([keyword_pattern, keyword_pattern])
+
+                if sort_type == 'price_asc':
+                    sql += " ORDER BY p.price ASC"
+                elif sort_type == 'price_desc':
+                    sql += " ORDER BY p.price DESC"
+                elif sort_type == 'sales':
+                    sql += " ORDER BY p.sales DESC"
+                elif sort_type == 'rating':
+                    sql += " ORDER BY p.rating DESC"
+                else:
+                    sql += " ORDER BY p.created_at DESC"
 
-            sql += " LIMIT %s OFFSET %s"
-            params.extend([page_size, offset])
+                # 多取一条判断是否还有下一页，不依赖总数
+                sql += " LIMIT %s OFFSET %s"
+                params.extend([page_size + 1, offset])
 
-            cursor.execute(sql, params)
-            products = cursor.fetchall()
+                cursor.execute(sql, params)
+                products = cursor.fetchall()
+                has_more = len(products) > page_size
+                products = products[:page_size]
 
-            for product in products:
-                if product.get('price'):
-                    product['price'] = f"{float(product['price']):.2f}"
-                if product.get('original_price'):
-                    product['original_price'] = f"{float(product['original_price']):.2f}"
+            conn.close()
 
-        conn.close()
+        for product in products:
+            if product.get('price'):
+                product['price'] = f"{float(product['price']):.2f}"
+            if product.get('original_price'):
+                product['original_price'] = f"{float(product['original_price']):.2f}"
 
         response_data = {
             'data': products,
             'total': total,
             'page': page,
-            'pageSize': page_size
+            'pageSize': page_size,
+            'hasMore': has_more
         }
 
         return jsonify({
@@ -2575,12 +3078,16 @@ def get_products():
 @app.route('/api/products/<int:product_id>')
 def get_product_detail(product_id):
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM products WHERE id = %s", (product_id,))
-            product = cursor.fetchone()
+        record = product_catalog.get(product_id)
+        if record:
+            product = record.to_dict()
+        else:
+            conn = get_db_connection(read_only=True)
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT * FROM products WHERE id = %s", (product_id,))
+                product = cursor.fetchone()
 
-        conn.close()
+            conn.close()
 
         if product:
             return jsonify({
@@ -2602,31 +3109,57 @@ def get_product_detail(product_id):
 # ==================== 统一搜索功能 ====================
 # 首页与商城共用：跨类型检索商品+笔记，相关性排序，搜索建议，搜索历史，响应 <300ms
 
-def _search_products(conn, keyword, limit, offset):
-    """检索商品：相关性排序（名称完全匹配 > 名称前缀 > 名称/描述包含），保证速度"""
+def _search_products(conn, keyword, limit, offset, total_mode='exact'):
+    """
+    检索商品：相关性排序（名称完全匹配 > 名称前缀 > 名称/描述包含），倒排索引就绪时不查库。
+    返回 (本页结果, 总数, 是否还有更多)；total_mode 见 totals.py，为 none 时总数为 None
+    """
     kw = (keyword or '').strip()
     if not kw:
-        return [], 0
-    pattern = f"%{kw}%"
-    pattern_start = f"{kw}%"
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT COUNT(*) AS total FROM products
-            WHERE status = 1 AND (name LIKE %s OR description LIKE %s)
-        """, (pattern, pattern))
-        total = (cur.fetchone() or {}).get('total', 0) or 0
-        cur.execute("""
-            SELECT id, name, price, original_price, image_url AS imageUrl, category, sales, description
-            FROM products
-            WHERE status = 1 AND (name LIKE %s OR description LIKE %s)
-            ORDER BY
-                (name = %s) DESC,
-                (name LIKE %s) DESC,
-                (name LIKE %s OR description LIKE %s) DESC,
-                sales DESC
-            LIMIT %s OFFSET %s
-        """, (pattern, pattern, kw, pattern_start, pattern, pattern, limit, offset))
-        rows = cur.fetchall()
+        return [], 0, False
+    if product_search.ready:
+        # 倒排索引：同档内按 BM25 相关度，再按销量
+        index = product_search.index
+        ranked = []
+        for pid, score in index.search(kw):
+            record = product_catalog.get(pid)
+            if record is not None:
+                ranked.append((index.match_tier(pid, 'name', kw), -score, -(record.sales or 0), -pid, record))
+        ranked.sort(key=lambda item: item[:4])
+        total = None if total_mode == 'none' else len(ranked)
+        has_more = len(ranked) > offset + limit
+        rows = [{
+            'id': record.id,
+            'name': record.name,
+            'price': record.price,
+            'original_price': record.original_price,
+            'imageUrl': record.image_url,
+            'category': record.category,
+            'sales': record.sales,
+            'description': record.description
+        } for *_, record in ranked[offset:offset + limit]]
+    else:
+        pattern = f"%{kw}%"
+        pattern_start = f"{kw}%"
+        with conn.cursor() as cur:
+            total = totals_cache.total(cur, """
+                SELECT COUNT(*) AS total FROM products
+                WHERE status = 1 AND (name LIKE %s OR description LIKE %s)
+            """, (pattern, pattern), tags=['products'], mode=total_mode)
+            cur.execute("""
+                SELECT id, name, price, original_price, image_url AS imageUrl, category, sales, description
+                FROM products
+                WHERE status = 1 AND (name LIKE %s OR description LIKE %s)
+                ORDER BY
+                    (name = %s) DESC,
+                    (name LIKE %s) DESC,
+                    (name LIKE %s OR description LIKE %s) DESC,
+                    sales DESC
+                LIMIT %s OFFSET %s
+            """, (pattern, pattern, kw, pattern_start, pattern, pattern, limit + 1, offset))
+            rows = cur.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
     for r in rows:
         if r.get('price') is not None:
             r['price'] = f"{float(r['price']):.2f}"
@@ -2634,36 +3167,60 @@ def _search_products(conn, keyword, limit, offset):
             r['original_price'] = f"{float(r['original_price']):.2f}"
         r['type'] = 'product'
         r['link'] = f"/pages/product/detail?id={r['id']}"
-    return rows, total
+    return rows, total, has_more
 
 
-def _search_notes(conn, user_id, keyword, limit, offset):
-    """检索当前用户笔记：标题/内容/标签匹配，相关性排序"""
+def _search_notes(conn, user_id, keyword, limit, offset, total_mode='exact'):
+    """检索当前用户笔记：标题/内容/标签匹配，相关性排序；返回值同 _search_products"""
     kw = (keyword or '').strip()
     if not kw:
-        return [], 0
-    pattern = f"%{kw}%"
-    pattern_start = f"{kw}%"
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT COUNT(*) AS total FROM pet_notes
-            WHERE status = 1 AND user_id = %s
-            AND (title LIKE %s OR content LIKE %s OR tags LIKE %s)
-        """, (user_id, pattern, pattern, pattern))
-        total = (cur.fetchone() or {}).get('total', 0) or 0
-        cur.execute("""
-            SELECT id, title, content, category, images, tags, created_at AS createdAt
-            FROM pet_notes
-            WHERE status = 1 AND user_id = %s
-            AND (title LIKE %s OR content LIKE %s OR tags LIKE %s)
-            ORDER BY
-                (title = %s) DESC,
-                (title LIKE %s) DESC,
-                (title LIKE %s OR content LIKE %s) DESC,
-                created_at DESC
-            LIMIT %s OFFSET %s
-        """, (user_id, pattern, pattern, pattern, kw, pattern_start, pattern, pattern, limit, offset))
-        rows = cur.fetchall()
+        return [], 0, False
+    if note_search.ready:
+        # 倒排索引：标题完全匹配 > 标题前缀 > 标题/内容包含 > 仅标签包含，同档内按 BM25 相关度，再按创建时间倒序
+        index = note_search.index
+        ranked = []
+        for note_id, score in index.search(kw, scope=user_id):
+            note = note_search.get(note_id)
+            if note is not None:
+                created = note['created_at'].timestamp() if note.get('created_at') else 0
+                tier = index.match_tier(note_id, 'title', kw, contains=('title', 'content'))
+                ranked.append((tier, -score, -created, -note_id, note))
+        ranked.sort(key=lambda item: item[:4])
+        total = None if total_mode == 'none' else len(ranked)
+        has_more = len(ranked) > offset + limit
+        rows = [{
+            'id': note['id'],
+            'title': note['title'],
+            'content': note['content'],
+            'category': note['category'],
+            'images': note['images'],
+            'tags': note['tags'],
+            'createdAt': note['created_at']
+        } for *_, note in ranked[offset:offset + limit]]
+    else:
+        pattern = f"%{kw}%"
+        pattern_start = f"{kw}%"
+        with conn.cursor() as cur:
+            total = totals_cache.total(cur, """
+                SELECT COUNT(*) AS total FROM pet_notes
+                WHERE status = 1 AND user_id = %s
+                AND (title LIKE %s OR content LIKE %s OR tags LIKE %s)
+            """, (user_id, pattern, pattern, pattern), tags=[f'pet_notes:{user_id}'], mode=total_mode)
+            cur.execute("""
+                SELECT id, title, content, category, images, tags, created_at AS createdAt
+                FROM pet_notes
+                WHERE status = 1 AND user_id = %s
+                AND (title LIKE %s OR content LIKE %s OR tags LIKE %s)
+                ORDER BY
+                    (title = %s) DESC,
+                    (title LIKE %s) DESC,
+                    (title LIKE %s OR content LIKE %s) DESC,
+                    created_at DESC
+                LIMIT %s OFFSET %s
+            """, (user_id, pattern, pattern, pattern, kw, pattern_start, pattern, pattern, limit + 1, offset))
+            rows = cur.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
     for r in rows:
         if r.get('images'):
             r['images'] = json.loads(r['images']) if isinstance(r['images'], str) else r['images']
@@ -2672,7 +3229,45 @@ def _search_notes(conn, user_id, keyword, limit, offset):
         r['contentSnippet'] = (r.get('content') or '')[:80].replace('\n', ' ') if r.get('content') else ''
         r['type'] = 'note'
         r['link'] = f"/pages/note/detail?id={r['id']}"
-    return rows, total
+    return rows, total, has_more
+
+
+def _search_source(func, needs_db, user_id, args):
+    """在线程池中执行的单路检索：需要查库时借用独立的只读连接，用完归还"""
+    conn = _borrow_read_connection(user_id) if needs_db else None
+    try:
+        return func(conn, *args)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def _run_search_sources(sources, user_id):
+    """
+    并行执行各路检索。sources: {名称: (检索函数, 是否需要查库, 参数)}，检索函数签名为 func(conn, *参数)。
+    返回 ({名称: (结果, 总数, 是否还有更多)}, 未能按时返回的名称列表)；超时或出错的一路按空结果返回。
+    各路都走内存索引时直接在当前线程执行，省去线程切换。
+    """
+    if not any(needs_db for _, needs_db, _ in sources.values()):
+        return {name: func(None, *args) for name, (func, _, args) in sources.items()}, []
+
+    futures = {name: search_executor.submit(_search_source, func, needs_db, user_id, args)
+               for name, (func, needs_db, args) in sources.items()}
+    deadline = time.monotonic() + SEARCH_SOURCE_TIMEOUT_MS / 1000
+    results, partial = {}, []
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeout:
+            # 已在执行的查询无法中断，完成后连接自行归还；尚未开始的直接取消
+            future.cancel()
+            partial.append(name)
+            results[name] = ([], None, False)
+        except Exception as e:
+            print(f"⚠️  搜索子任务 {name} 失败: {e}")
+            partial.append(name)
+            results[name] = ([], None, False)
+    return results, partial
 
 
 @app.route('/api/search/unified', methods=['GET'])
@@ -2681,7 +3276,7 @@ def search_unified():
     """
     统一搜索：同时检索商城商品与当前用户笔记，用于首页/商城搜索框。
     返回商品与笔记分块，带 type、link，便于前端区分展示与跳转。
-    响应控制在 300ms 内（限制单次数量）。
+    响应控制在 300ms 内（限制单次数量，两路并行且各有超时）。
     """
     try:
         keyword = (request.args.get('keyword') or '').strip()
@@ -2696,46 +3291,44 @@ def search_unified():
             }), 400
 
         start = time.perf_counter()
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'code': 500, 'message': '数据库连接失败'}), 500
-
-        try:
-            poff = (page - 1) * product_limit
-            noff = (page - 1) * note_limit
-            products, total_products = _search_products(conn, keyword, product_limit, poff)
-            notes, total_notes = _search_notes(conn, g.user_id, keyword, note_limit, noff)
-
-            # 写入搜索历史（去重：同一用户同一关键词仅保留最近一条）
-            try:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "INSERT INTO search_history (user_id, keyword) VALUES (%s, %s)",
-                        (g.user_id, keyword[:100])
-                    )
-                    conn.commit()
-            except Exception:
-                conn.rollback()
-
-            elapsed = (time.perf_counter() - start) * 1000
-            response_data = {
-                'keyword': keyword,
-                'products': products,
-                'notes': notes,
-                'totalProducts': total_products,
-                'totalNotes': total_notes,
-                'page': page,
-                'productLimit': product_limit,
-                'noteLimit': note_limit,
-                '_meta': {'responseMs': round(elapsed, 2)}
-            }
-            return jsonify({
-                'code': 0,
-                'message': 'success',
-                'data': response_data
-            })
-        finally:
-            conn.close()
+        poff = (page - 1) * product_limit
+        noff = (page - 1) * note_limit
+        total_mode = parse_total_mode(request.args)
+        # 商品与笔记并行检索，各自使用独立连接；超过 SEARCH_SOURCE_TIMEOUT_MS 的一路返回空结果并在 _meta.partial 中标出
+        results, partial = _run_search_sources({
+            'products': (_search_products, not product_search.ready,
+                         (keyword, product_limit, poff, total_mode)),
+            'notes': (_search_notes, not note_search.ready,
+                      (g.user_id, keyword, note_limit, noff, total_mode)),
+        }, g.user_id)
+        products, total_products, more_products = results['products']
+        notes, total_notes, more_notes = results['notes']
+
+        # 写入搜索历史（去重：同一用户同一关键词仅保留最近一条）：进入写后缓冲，不在请求内写库
+        searched_at = datetime.now()
+        search_history_buffer.record(g.user_id, keyword, searched_at)
+        recent_queries.record(g.user_id, keyword[:100], searched_at)
+        suggest_engine.record_query(keyword)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        response_data = {
+            'keyword': keyword,
+            'products': products,
+            'notes': notes,
+            'totalProducts': total_products,
+            'totalNotes': total_notes,
+            'hasMoreProducts': more_products,
+            'hasMoreNotes': more_notes,
+            'page': page,
+            'productLimit': product_limit,
+            'noteLimit': note_limit,
+            '_meta': {'responseMs': round(elapsed, 2), 'partial': partial}
+        }
+        return jsonify({
+            'code': 0,
+            'message': 'success',
+            'data': response_data
+        })
     except Exception as e:
         return jsonify({
             'code': 500,
@@ -2746,8 +3339,8 @@ def search_unified():
 @app.route('/api/search/suggest', methods=['GET'])
 def search_suggest():
     """
-    搜索建议：根据当前输入返回联想词（商品名、笔记标题、历史关键词前缀匹配）。
-    不要求登录；若已登录则包含个人搜索历史。
+    搜索建议：根据当前输入返回联想词（商品名、笔记标题、历史关键词、热门搜索词）。
+    不要求登录；若已登录则包含个人笔记标题与搜索历史。商品名与热门搜索词来自内存前缀树，历史来自内存 LRU。
     """
     try:
         keyword = (request.args.get('keyword') or '').strip()
@@ -2756,24 +3349,34 @@ def search_suggest():
         if not keyword or len(keyword) < 1:
             return jsonify({'code': 0, 'message': 'success', 'data': {'suggestions': []}})
 
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'code': 0, 'message': 'success', 'data': {'suggestions': []}})
-
         suggestions = []
-        pattern = f"{keyword}%"
-        pattern_any = f"%{keyword}%"
+        seen = set()
 
-        with conn.cursor() as cur:
-            # 商品名称前缀/包含
-            cur.execute("""
-                SELECT DISTINCT name AS text, 'product' AS source
-                FROM products
-                WHERE status = 1 AND (name LIKE %s OR name LIKE %s)
-                LIMIT %s
-            """, (pattern, pattern_any, limit))
-            for row in cur.fetchall():
-                suggestions.append({'text': row['text'], 'source': 'product'})
+        def add(texts, source):
+            for text in texts:
+                if len(suggestions) >= limit:
+                    return
+                if text and text not in seen:
+                    seen.add(text)
+                    suggestions.append({'text': text, 'source': source})
+
+        conn = None
+        try:
+            # 商品名称前缀（从词首/汉字处开始的后缀也可命中），按销量
+            if suggest_engine.products_ready:
+                add(suggest_engine.complete_products(keyword, limit), 'product')
+            else:
+                conn = get_db_connection(read_only=True)
+                if not conn:
+                    return jsonify({'code': 0, 'message': 'success', 'data': {'suggestions': []}})
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT DISTINCT name AS text, 'product' AS source
+                        FROM products
+                        WHERE status = 1 AND (name LIKE %s OR name LIKE %s)
+                        LIMIT %s
+                    """, (f"{keyword}%", f"%{keyword}%", limit))
+                    add([row['text'] for row in cur.fetchall()], 'product')
 
             # 若已登录：笔记标题 + 搜索历史
             user_id = None
@@ -2786,27 +3389,16 @@ def search_suggest():
                     pass
 
             if user_id and len(suggestions) < limit:
-                cur.execute("""
-                    SELECT DISTINCT title AS text FROM pet_notes
-                    WHERE status = 1 AND user_id = %s AND (title LIKE %s OR title LIKE %s)
-                    LIMIT %s
-                """, (user_id, pattern, pattern_any, limit - len(suggestions)))
-                for row in cur.fetchall():
-                    suggestions.append({'text': row['text'], 'source': 'note'})
+                add(_suggest_note_titles(user_id, keyword, limit - len(suggestions)), 'note')
             if user_id and len(suggestions) < limit:
-                cur.execute("""
-                    SELECT keyword AS text FROM search_history
-                    WHERE user_id = %s AND keyword LIKE %s
-                    GROUP BY keyword
-                    ORDER BY MAX(created_at) DESC
-                    LIMIT %s
-                """, (user_id, pattern_any, limit - len(suggestions)))
-                for row in cur.fetchall():
-                    item = {'text': row['text'], 'source': 'history'}
-                    if not any(s['text'] == item['text'] for s in suggestions):
-                        suggestions.append(item)
+                needle = keyword.lower()
+                add([kw for kw in recent_queries.keywords(user_id, _load_recent_queries) if needle in kw.lower()], 'history')
+            if len(suggestions) < limit:
+                add(suggest_engine.complete_queries(keyword, limit), 'popular')
+        finally:
+            if conn:
+                conn.close()
 
-        conn.close()
         return jsonify({
             'code': 0,
             'message': 'success',
@@ -2819,23 +3411,58 @@ def search_suggest():
         }), 500
 
 
+def _suggest_note_titles(user_id, keyword, limit):
+    """用户笔记中标题包含关键词的标题；笔记索引就绪时不查库"""
+    if note_search.ready:
+        index = note_search.index
+        needle = keyword.lower()
+        ranked = []
+        for note_id, _ in index.search(keyword, scope=user_id):
+            note = note_search.get(note_id)
+            if note is not None and needle in (note['title'] or '').lower():
+                created = note['created_at'].timestamp() if note.get('created_at') else 0
+                ranked.append((index.match_tier(note_id, 'title', keyword), -created, note['title']))
+        ranked.sort()
+        return [title for *_, title in ranked[:limit]]
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return []
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT title AS text FROM pet_notes
+            WHERE status = 1 AND user_id = %s AND (title LIKE %s OR title LIKE %s)
+            LIMIT %s
+        """, (user_id, f"{keyword}%", f"%{keyword}%", limit))
+        return [row['text'] for row in cur.fetchall()]
+
+
+def _load_recent_queries(user_id):
+    """最近搜索记录（新的在前，按关键词去重）：本进程写后缓冲中尚未落库的在前，库中的在后"""
+    pending = [{'id': None, 'keyword': keyword, 'createdAt': searched_at}
+               for keyword, searched_at in search_history_buffer.pending_for(user_id)]
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return pending
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, keyword, created_at AS createdAt
+            FROM search_history
+            WHERE user_id = %s
+            ORDER BY created_at DESC
+            LIMIT %s
+        """, (user_id, recent_queries.per_user))
+        rows = cur.fetchall()
+    seen = {item['keyword'] for item in pending}
+    return pending + [row for row in rows if row['keyword'] not in seen]
+
+
 @app.route('/api/search/history', methods=['GET'])
 @auth_required
 def search_history_list():
-    """获取当前用户搜索历史（按时间倒序）"""
+    """获取当前用户搜索历史（按时间倒序；本进程尚未落库的记录在前，id 为 null）"""
     try:
         limit = min(50, max(1, request.args.get('limit', 10, type=int)))
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, keyword, created_at AS createdAt
-                FROM search_history
-                WHERE user_id = %s
-                ORDER BY created_at DESC
-                LIMIT %s
-            """, (g.user_id, limit))
-            rows = cursor.fetchall()
-        conn.close()
+        rows = _load_recent_queries(g.user_id)[:limit]
         return jsonify({
             'code': 0,
             'message': 'success',
@@ -2854,9 +3481,14 @@ def search_history_clear():
     """清空当前用户搜索历史"""
     try:
         conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("DELETE FROM search_history WHERE user_id = %s", (g.user_id,))
-            conn.commit()
+
+        def delete():
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM search_history WHERE user_id = %s", (g.user_id,))
+                conn.commit()
+
+        search_history_buffer.clear_user(g.user_id, delete)
+        recent_queries.clear(g.user_id)
         conn.close()
         return jsonify({
             'code': 0,
@@ -2887,7 +3519,7 @@ def search():
 
         offset = (page - 1) * page_size
 
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         with conn.cursor() as cursor:
             if type == 'product':
                 sql = """
@@ -2935,7 +3567,7 @@ def search():
 @app.route('/api/pets/categories')
 def get_pet_categories():
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         with conn.cursor() as cursor:
             cursor.execute("""
                 SELECT id, name, icon, sort_order, status 
@@ -2969,7 +3601,7 @@ def get_faq_list():
     try:
         category = request.args.get('category', '')
         
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         with conn.cursor() as cursor:
             sql = """
                 SELECT id, category, question, answer, sort_order, created_at
@@ -3082,6 +3714,7 @@ def submit_feedback():
             """, (g.user_id, feedback_type, content, contact, images_json))
             feedback_id = cursor.lastrowid
             conn.commit()
+        totals_cache.invalidate(f'feedback:{g.user_id}')
         
         conn.close()
         
@@ -3111,6 +3744,7 @@ def get_feedback_list():
         page_size = min(50, max(1, request.args.get('pageSize', 10, type=int)))
         status = request.args.get('status', '')
         feedback_type = request.args.get('type', '')
+        keyset_sql, keyset_params = keyset_condition(request.args.get('cursor'))
         
         offset = (page - 1) * page_size
         
@@ -3132,20 +3766,30 @@ def get_feedback_list():
             
             # 获取总数
             count_sql = f"SELECT COUNT(*) as total FROM feedback WHERE {where_sql}"
-            cursor.execute(count_sql, params)
-            total = cursor.fetchone()['total']
+            total = totals_cache.total(cursor, count_sql, params, tags=[f'feedback:{g.user_id}'],
+                                       mode=parse_total_mode(request.args))
             
-            # 获取列表
-            sql = f"""
-                SELECT id, type, content, contact, images, status, reply, reply_at, created_at
-                FROM feedback
-                WHERE {where_sql}
-                ORDER BY created_at DESC
-                LIMIT %s OFFSET %s
-            """
-            params.extend([page_size, offset])
+            # 获取列表：有游标时按游标定位，否则沿用 page 偏移
+            if keyset_sql:
+                sql = f"""
+                    SELECT id, type, content, contact, images, status, reply, reply_at, created_at
+                    FROM feedback
+                    WHERE {where_sql} AND {keyset_sql}
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """
+                params.extend(keyset_params + [page_size + 1])
+            else:
+                sql = f"""
+                    SELECT id, type, content, contact, images, status, reply, reply_at, created_at
+                    FROM feedback
+                    WHERE {where_sql}
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s OFFSET %s
+                """
+                params.extend([page_size + 1, offset])
             cursor.execute(sql, params)
-            feedback_list = cursor.fetchall()
+            feedback_list, next_cursor = paginate(cursor.fetchall(), page_size)
             
             # 格式化数据
             for item in feedback_list:
@@ -3171,9 +3815,16 @@ def get_feedback_list():
                 'list': feedback_list,
                 'total': total,
                 'page': page,
-                'pageSize': page_size
+                'pageSize': page_size,
+                'hasMore': next_cursor is not None,
+                'nextCursor': next_cursor
             }
         })
+    except InvalidCursor as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'code': 500,
@@ -3243,8 +3894,9 @@ def get_news_list():
         page = request.args.get('page', 1, type=int)
         size = request.args.get('size', 10, type=int)
         offset = (page - 1) * size
+        keyset_sql, keyset_params = keyset_condition(request.args.get('cursor'))
 
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         with conn.cursor() as cursor:
             where_clause = "WHERE status = 1"
             params = []
@@ -3254,20 +3906,24 @@ def get_news_list():
                 params.append(news_type)
 
             count_sql = f"SELECT COUNT(*) as total FROM news {where_clause}"
-            cursor.execute(count_sql, params)
-            total = cursor.fetchone()['total']
+            total = totals_cache.total(cursor, count_sql, params, tags=['news'],
+                                       mode=parse_total_mode(request.args))
 
+            if keyset_sql:
+                where_clause += f" AND {keyset_sql}"
+                params.extend(keyset_params)
+                offset = 0
             sql = f"""
                 SELECT id, title, summary, type, image_url, author,
                        view_count as viewCount, like_count as likeCount,
                        comment_count as commentCount, created_at as createdAt
                 FROM news {where_clause}
-                ORDER BY created_at DESC
+                ORDER BY created_at DESC, id DESC
                 LIMIT %s OFFSET %s
             """
-            params.extend([size, offset])
+            params.extend([size + 1, offset])
             cursor.execute(sql, params)
-            news_list = cursor.fetchall()
+            news_list, next_cursor = paginate(cursor.fetchall(), size, created_key='createdAt')
         conn.close()
 
         return jsonify({
@@ -3277,10 +3933,17 @@ def get_news_list():
                 'list': news_list,
                 'total': total,
                 'page': page,
-                'size': size
+                'size': size,
+                'hasMore': next_cursor is not None,
+                'nextCursor': next_cursor
             }
         })
 
+    except InvalidCursor as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'code': 500,
@@ -3330,22 +3993,28 @@ def get_news_comments(news_id):
         page = request.args.get('page', 1, type=int)
         size = request.args.get('size', 20, type=int)
         offset = (page - 1) * size
+        keyset_sql, keyset_params = keyset_condition(request.args.get('cursor'), 'c.created_at', 'c.id')
 
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         with conn.cursor() as cursor:
-            cursor.execute("""
+            if keyset_sql:
+                keyset_sql = f" AND {keyset_sql}"
+                offset = 0
+            cursor.execute(f"""
                 SELECT c.id, c.content, c.like_count as likeCount, c.created_at as createdAt,
                        u.id as userId, u.nickname as userName, u.avatar_url as userAvatar
                 FROM news_comments c
                 LEFT JOIN users u ON c.user_id = u.id
-                WHERE c.news_id = %s AND c.status = 1
-                ORDER BY c.created_at DESC
+                WHERE c.news_id = %s AND c.status = 1{keyset_sql or ''}
+                ORDER BY c.created_at DESC, c.id DESC
                 LIMIT %s OFFSET %s
-            """, (news_id, size, offset))
-            comments = cursor.fetchall()
+            """, [news_id] + keyset_params + [size + 1, offset])
+            comments, next_cursor = paginate(cursor.fetchall(), size, created_key='createdAt')
 
-            cursor.execute("SELECT COUNT(*) as total FROM news_comments WHERE news_id = %s AND status = 1", (news_id,))
-            total = cursor.fetchone()['total']
+            total = totals_cache.total(
+                cursor, "SELECT COUNT(*) as total FROM news_comments WHERE news_id = %s AND status = 1", (news_id,),
+                tags=[f'news_comments:{news_id}'], mode=parse_total_mode(request.args)
+            )
         conn.close()
 
         return jsonify({
@@ -3353,10 +4022,17 @@ def get_news_comments(news_id):
             'message': 'success',
             'data': {
                 'list': comments,
-                'total': total
+                'total': total,
+                'hasMore': next_cursor is not None,
+                'nextCursor': next_cursor
             }
         })
 
+    except InvalidCursor as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'code': 500,
@@ -3395,6 +4071,7 @@ def add_news_comment(news_id):
             cursor.execute("UPDATE news SET comment_count = comment_count + 1 WHERE id = %s", (news_id,))
             conn.commit()
         conn.close()
+        totals_cache.invalidate(f'news_comments:{news_id}')
 
         return jsonify({
             'code': 0,
@@ -3449,6 +4126,7 @@ def get_available_coupons():
 
 @app.route('/api/coupons/<int:coupon_id>/receive', methods=['POST'])
 @auth_required
+@idempotent
 def receive_coupon(coupon_id):
     try:
         conn = get_db_connection()
@@ -3551,6 +4229,7 @@ def not_found_handler(e):
 
 @app.route('/api/funeral/bookings', methods=['POST'])
 @auth_required
+@idempotent
 def create_funeral_booking():
     try:
         data = request.json
@@ -3702,7 +4381,7 @@ def cancel_funeral_booking(booking_id):
 @app.route('/api/notices', methods=['GET'])
 def get_notices():
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         with conn.cursor() as cursor:
             cursor.execute("""
                 SELECT id, icon, title, content, create_time as createTime
@@ -3741,4 +4420,14 @@ if __name__ == '__main__':
     print(f"📦 订单: GET http://localhost:5000/api/orders (需要认证)")
     print("=" * 60)
 
+    # 本地开发直接启动时顺带执行迁移；生产环境请在部署流程中单独执行 python migrations.py
+    try:
+        dev_conn = migrations.connect_from_env()
+        try:
+            migrations.run_migrations(dev_conn)
+        finally:
+            dev_conn.close()
+    except Exception as e:
+        print(f"数据库初始化警告: {e}")
+
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,33 @@
+"""
+宠物平台 - 子集合批量加载
+文件名：batch_loader.py
+
+列表接口加载子集合（订单 -> 订单商品等）时，用一条 IN 查询取回整页父记录的全部子记录，
+在内存中按父 ID 分组，替代“每个父记录一条查询”的 N+1 写法。
+"""
+
+
+def load_children(cursor, sql, parent_ids, key, chunk_size=500, keep_key=False):
+    """
+    批量加载子记录，返回 {父ID: [子记录, ...]}。
+
+    sql 中用 {ids} 占位 IN 列表，并且 SELECT 中必须包含分组列 key，例如：
+        SELECT order_id, id, product_name FROM order_items WHERE order_id IN ({ids})
+    父 ID 超过 chunk_size 时分批查询；keep_key=False 时从子记录中移除分组列，保持原有返回字段不变。
+    """
+    ids = list(dict.fromkeys(pid for pid in parent_ids if pid is not None))
+    grouped = {pid: [] for pid in ids}
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        cursor.execute(sql.format(ids=', '.join(['%s'] * len(chunk))), chunk)
+        for row in cursor.fetchall():
+            parent_id = row[key] if keep_key else row.pop(key)
+            grouped.setdefault(parent_id, []).append(row)
+    return grouped
+
+
+def attach_children(parents, grouped, field, parent_key='id'):
+    """把 load_children 的结果挂到父记录的 field 字段上，没有子记录的父记录得到空列表"""
+    for parent in parents:
+        parent[field] = grouped.get(parent[parent_key], [])
+    return parents
@@ -0,0 +1,164 @@
+"""
+宠物平台 - 商品列表性能对比
+文件名：bench_listing.py
+
+对比内存排序索引（listing_index.py）与 get_products 当前 SQL（ORDER BY + LEFT JOIN pet_categories）的分页耗时。
+用法：
+    python bench_listing.py                      仅测内存索引，默认 100 万商品
+    python bench_listing.py --rows 200000        指定商品数
+    python bench_listing.py --sql                同时在数据库中建临时表 bench_products 灌入相同数据测 SQL，结束后删除
+"""
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from catalog import ProductRecord
+from listing_index import ListingIndex, SORT_KEY_FUNCS
+
+
+CATEGORIES = ['狗粮', '猫粮', '零食', '玩具', '用品', '保健', '服饰', '洗护', '出行', '医疗']
+
+SQL_ORDER_BY = {
+    'price_asc': 'p.price ASC',
+    'price_desc': 'p.price DESC',
+    'sales': 'p.sales DESC',
+    'rating': 'p.rating DESC',
+    'default': 'p.created_at DESC',
+}
+
+
+def make_rows(count, seed=42):
+    rnd = random.Random(seed)
+    base = datetime(2022, 1, 1)
+    for i in range(1, count + 1):
+        yield {
+            'id': i,
+            'name': f'商品{i}',
+            'category': rnd.choice(CATEGORIES),
+            'price': Decimal(rnd.randint(100, 99999)) / 100,
+            'original_price': None,
+            'image_url': '',
+            'description': '',
+            'stock': rnd.randint(0, 500),
+            'sales': rnd.randint(0, 100000),
+            'rating': Decimal(rnd.randint(0, 500)) / 100,
+            'is_hot': False,
+            'is_new': False,
+            'status': 1 if rnd.random() > 0.05 else 0,
+            'created_at': base + timedelta(seconds=rnd.randint(0, 3 * 365 * 86400)),
+            'updated_at': base,
+        }
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def report(title, samples_ms):
+    print(f"  {title:<28} p50 {percentile(samples_ms, 0.5):8.3f} ms   p99 {percentile(samples_ms, 0.99):8.3f} ms")
+
+
+def page_cases(rnd, count, pages=(1, 10, 100, 1000)):
+    cases = []
+    for _ in range(count):
+        cases.append((rnd.choice([None] + CATEGORIES), rnd.choice(list(SORT_KEY_FUNCS)), rnd.choice(pages)))
+    return cases
+
+
+def bench_memory(rows, cases, page_size):
+    print(f"📦 内存索引：{len(rows)} 个商品")
+    t = time.perf_counter()
+    records = {r['id']: ProductRecord(r) for r in rows}
+    print(f"  构建记录 {time.perf_counter() - t:.2f} s")
+    t = time.perf_counter()
+    index = ListingIndex.build(records.values())
+    print(f"  构建有序数组 {time.perf_counter() - t:.2f} s（{len(SORT_KEY_FUNCS)} 种排序 × {len(CATEGORIES) + 1} 个分组）")
+
+    samples = []
+    for category, sort_type, page in cases:
+        t = time.perf_counter()
+        ids, _ = index.page(category, sort_type, (page - 1) * page_size, page_size)
+        [records[pid].to_dict(with_category_icon=True) for pid in ids]
+        samples.append((time.perf_counter() - t) * 1000)
+    report('分页（含组装响应字典）', samples)
+
+    rnd = random.Random(7)
+    samples = []
+    for _ in range(2000):
+        old = records[rnd.randint(1, len(records))]
+        row = old.to_dict()
+        row['price'] = Decimal(rnd.randint(100, 99999)) / 100
+        row['sales'] = (old.sales or 0) + 1
+        new = ProductRecord(row)
+        t = time.perf_counter()
+        index.update(old, new)
+        samples.append((time.perf_counter() - t) * 1000)
+        records[new.id] = new
+    report('单个商品变更（增量维护）', samples)
+
+
+def bench_sql(rows, cases, page_size):
+    from migrations import connect_from_env
+
+    print(f"🗄️  SQL：临时表 bench_products，{len(rows)} 个商品")
+    conn = connect_from_env()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS bench_products")
+            cursor.execute("CREATE TABLE bench_products LIKE products")
+            columns = ('id', 'name', 'category', 'price', 'image_url', 'description', 'stock',
+                       'sales', 'rating', 'status', 'created_at')
+            sql = (f"INSERT INTO bench_products ({', '.join(columns)}) "
+                   f"VALUES ({', '.join(['%s'] * len(columns))})")
+            t = time.perf_counter()
+            for i in range(0, len(rows), 5000):
+                cursor.executemany(sql, [tuple(r[c] for c in columns) for r in rows[i:i + 5000]])
+                conn.commit()
+            cursor.execute("ANALYZE TABLE bench_products")
+            cursor.fetchall()
+            print(f"  灌入数据 {time.perf_counter() - t:.1f} s")
+
+            samples = []
+            for category, sort_type, page in cases:
+                query = ("SELECT p.*, pc.icon as categoryIcon FROM bench_products p "
+                         "LEFT JOIN pet_categories pc ON p.category = pc.name WHERE p.status = 1")
+                params = []
+                if category:
+                    query += " AND p.category = %s"
+                    params.append(category)
+                query += f" ORDER BY {SQL_ORDER_BY[sort_type]} LIMIT %s OFFSET %s"
+                params.extend([page_size, (page - 1) * page_size])
+                t = time.perf_counter()
+                cursor.execute(query, params)
+                cursor.fetchall()
+                samples.append((time.perf_counter() - t) * 1000)
+            report('分页（当前 SQL）', samples)
+    finally:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS bench_products")
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def main(argv):
+    count = 1000000
+    if '--rows' in argv:
+        count = int(argv[argv.index('--rows') + 1])
+    page_size = 20
+    rows = list(make_rows(count))
+    rnd = random.Random(1)
+    bench_memory(rows, page_cases(rnd, 2000), page_size)
+    if '--sql' in argv:
+        # SQL 单次耗时较长，用较少的样本
+        bench_sql(rows, page_cases(random.Random(1), 100), page_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
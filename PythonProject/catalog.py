@@ -0,0 +1,245 @@
+"""
+宠物平台 - 商品目录缓存
+文件名：catalog.py
+
+商品数据一天只变动几次，却被列表、详情、加购、下单、收藏等接口反复查询。
+这里把全部商品常驻进程内存（__slots__ 记录），按 ID 建索引，分类与各排序方式的有序数组由 listing_index.py 维护；
+后台线程按 products.updated_at 水位增量拉取变更，定期全量重载以发现物理删除与分类图标变更。
+
+库存（stock）同样随增量拉取更新，但只用于展示；下单扣减仍以数据库的条件 UPDATE 为准。
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from listing_index import ListingIndex
+
+
+# products 表的已知字段；库中多出的字段保存在 extra 中，to_dict() 时原样输出
+PRODUCT_FIELDS = ('id', 'name', 'category', 'price', 'original_price', 'image_url', 'description',
+                  'stock', 'sales', 'rating', 'is_hot', 'is_new', 'status', 'created_at', 'updated_at')
+
+# 影响分类索引与排序的字段；只有这些字段变化时才需要重排
+ORDERING_FIELDS = ('category', 'price', 'sales', 'rating', 'status', 'created_at')
+
+# 表中没有任何 updated_at 时的初始水位
+_EPOCH = datetime(1970, 1, 2)
+
+
+class ProductRecord:
+    __slots__ = PRODUCT_FIELDS + ('category_icon', 'extra')
+
+    def __init__(self, row):
+        row = dict(row)
+        self.category_icon = row.pop('categoryIcon', None)
+        for field in PRODUCT_FIELDS:
+            setattr(self, field, row.pop(field, None))
+        self.extra = row
+
+    def to_dict(self, with_category_icon=False):
+        """与 SELECT * FROM products 的行格式一致；with_category_icon 时附带 categoryIcon（列表接口）"""
+        data = {field: getattr(self, field) for field in PRODUCT_FIELDS}
+        data.update(self.extra)
+        if with_category_icon:
+            data['categoryIcon'] = self.category_icon
+        return data
+
+    def ordering_key(self):
+        return tuple(getattr(self, field) for field in ORDERING_FIELDS)
+
+    def same_as(self, other):
+        """全部字段（含分类图标与额外字段）都相同"""
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+
+class ProductCatalog:
+    """
+    pool：加载商品使用的连接池
+    poll_interval：增量拉取间隔（秒）
+    full_reload_interval：全量重载间隔（秒）
+    lookback_seconds：增量拉取时水位回退的秒数，覆盖 updated_at 已写入但事务尚未提交的行
+    """
+
+    LOAD_SQL = """
+        SELECT p.*, pc.icon AS categoryIcon
+        FROM products p
+        LEFT JOIN pet_categories pc ON p.category = pc.name
+    """
+
+    # 一次刷新中需要调整排序的商品超过该数时，在锁外生成新的排序数组再替换，避免长时间阻塞列表读取
+    INPLACE_UPDATE_LIMIT = 32
+
+    def __init__(self, pool, poll_interval=5, full_reload_interval=600, lookback_seconds=5):
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.full_reload_interval = full_reload_interval
+        self.lookback_seconds = lookback_seconds
+        self._by_id = {}
+        self._listing = ListingIndex()
+        self._watermark = None
+        self._last_full_reload = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listeners = []
+        self._stats = {'full_reloads': 0, 'incremental_refreshes': 0, 'rows_applied': 0,
+                       'reindexed': 0, 'errors': 0, 'last_refresh_at': None}
+
+    @property
+    def ready(self):
+        return self._watermark is not None
+
+    # ---------- 读取 ----------
+
+    def get(self, product_id):
+        """按 ID 取商品记录（含已下架）；未加载或不存在时返回 None"""
+        try:
+            return self._by_id.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def list(self, category=None, sort_type='default', offset=0, limit=20):
+        """返回 (本页在售商品记录, 总数)"""
+        with self._lock:
+            ids, total = self._listing.page(category, sort_type, offset, limit)
+            by_id = self._by_id
+            return [by_id[pid] for pid in ids if pid in by_id], total
+
+    def subscribe(self, callback):
+        """
+        订阅商品变更：callback(changes)，changes 为 [(旧记录或 None, 新记录或 None)]，在刷新线程中、锁外调用。
+        首次加载时旧记录全为 None；之后只带上有变化的商品（全量重载时与上次加载逐字段比较，含物理删除），
+        由订阅方自行比较需要关心的字段。
+        """
+        self._listeners.append(callback)
+        return callback
+
+    def _notify(self, changes):
+        for callback in self._listeners:
+            try:
+                callback(changes)
+            except Exception as e:
+                print(f"⚠️  商品变更订阅处理失败: {e}")
+
+    # ---------- 加载 ----------
+
+    def refresh(self):
+        """到期时全量重载，否则按水位增量拉取；返回本次应用的行数"""
+        if not self.ready or time.monotonic() - self._last_full_reload >= self.full_reload_interval:
+            return self._full_reload()
+        return self._incremental_refresh()
+
+    def _query(self, where='', params=()):
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(self.LOAD_SQL + where, params)
+                rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        finally:
+            conn.close()
+
+    def _full_reload(self):
+        rows = self._query()
+        by_id = {}
+        watermark = None
+        for row in rows:
+            record = ProductRecord(row)
+            by_id[record.id] = record
+            if record.updated_at is not None and (watermark is None or record.updated_at > watermark):
+                watermark = record.updated_at
+
+        old_by_id = self._by_id
+        changed = [(old_by_id.get(pid), r) for pid, r in by_id.items()
+                   if pid not in old_by_id or old_by_id[pid].ordering_key() != r.ordering_key()]
+        changed.extend((old, None) for pid, old in old_by_id.items() if pid not in by_id)
+        # 首次加载或变化较多时整体构建；否则（定期重载的常见情况）只增量调整变化的商品
+        first_load = not self.ready
+        rebuild = first_load or len(changed) > max(1000, len(by_id) // 20)
+        if rebuild:
+            listing = ListingIndex.build(by_id.values())
+        elif len(changed) > self.INPLACE_UPDATE_LIMIT:
+            listing = self._listing.updated(changed)
+        else:
+            listing = None
+
+        with self._lock:
+            if listing is not None:
+                self._listing = listing
+            else:
+                for old, new in changed:
+                    self._listing.update(old, new)
+            self._by_id = by_id
+            self._watermark = watermark or self._watermark or _EPOCH
+            self._last_full_reload = time.monotonic()
+            self._stats['full_reloads'] += 1
+            self._stats['reindexed'] += len(changed)
+            self._stats['rows_applied'] += len(rows)
+            self._stats['last_refresh_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        if self._listeners:
+            changes = [(old_by_id.get(pid), r) for pid, r in by_id.items()
+                       if pid not in old_by_id or not old_by_id[pid].same_as(r)]
+            changes.extend((old, None) for pid, old in old_by_id.items() if pid not in by_id)
+            # 首次加载即使没有商品也通知一次，订阅方据此标记就绪
+            if changes or first_load:
+                self._notify(changes)
+        return len(rows)
+
+    def _incremental_refresh(self):
+        since = self._watermark - timedelta(seconds=self.lookback_seconds)
+        rows = self._query(" WHERE p.updated_at >= %s ORDER BY p.updated_at", (since,))
+        # _by_id 与 _listing 只由刷新线程替换/修改，锁外读取是安全的；只有写入需要与列表读取互斥
+        changes = []
+        for row in rows:
+            record = ProductRecord(row)
+            changes.append((self._by_id.get(record.id), record))
+        # 只有排序相关字段变化时才调整有序数组；库存等变化只替换记录
+        reindex = [(old, new) for old, new in changes if old is None or old.ordering_key() != new.ordering_key()]
+        listing = self._listing.updated(reindex) if len(reindex) > self.INPLACE_UPDATE_LIMIT else None
+
+        with self._lock:
+            if listing is not None:
+                self._listing = listing
+            else:
+                for old, new in reindex:
+                    self._listing.update(old, new)
+            for _, record in changes:
+                self._by_id[record.id] = record
+                if record.updated_at is not None and record.updated_at > self._watermark:
+                    self._watermark = record.updated_at
+            self._stats['reindexed'] += len(reindex)
+            self._stats['incremental_refreshes'] += 1
+            self._stats['rows_applied'] += len(rows)
+            self._stats['last_refresh_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        if changes and self._listeners:
+            self._notify(changes)
+        return len(rows)
+
+    # ---------- 后台线程 ----------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='product-catalog', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"⚠️  商品目录刷新失败: {e}")
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['ready'] = self.ready
+            s['products'] = len(self._by_id)
+            s['watermark'] = self._watermark.strftime('%Y-%m-%d %H:%M:%S') if self._watermark else None
+        return s
@@ -35,7 +35,9 @@ class PetDatabase:
             'feedback', 'faq', 'search_history', 'coupons', 'vaccines', 'favorites', 'addresses',
             'user_pets', 'pet_notes', 'order_items', 'orders',
             'cart', 'cart_items', 'news', 'products', 'pet_breeds',
-            'pet_categories', 'product_categories', 'user_addresses', 'users', 'pets', 'banners'
+            'pet_categories', 'product_categories', 'user_addresses', 'users', 'pets', 'banners',
+            'schema_version', 'stock_reservations', 'worker_id_leases',
+            'idempotency_keys', 'refresh_tokens'
         ]
         for table in tables:
             try:
@@ -594,6 +596,7 @@ def main():
         print("3. 获取订单: GET /api/orders (需要认证)")
         print("4. 获取笔记: GET /api/notes (需要认证)")
         print("5. 获取地址: GET /api/addresses (需要认证)")
+        print("⚠️  启动服务前请执行结构迁移: python migrations.py")
         print("=" * 60)
 
     except KeyboardInterrupt:
@@ -0,0 +1,354 @@
+"""
+宠物平台 - MySQL 连接池
+文件名：db_pool.py
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+
+# 借出耗时直方图的桶上界（毫秒），最后一个桶收纳所有更慢的借出
+CHECKOUT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+
+class PoolTimeoutError(Exception):
+    """等待空闲连接超时"""
+
+
+class _PoolEntry:
+    """池内的一条物理连接及其使用记录"""
+
+    __slots__ = ('raw', 'created_at', 'last_used', 'uses')
+
+    def __init__(self, raw):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used = now
+        self.uses = 0
+
+
+class PooledConnection:
+    """
+    借出的连接代理：用法与 pymysql 连接一致，
+    close() 会把连接归还连接池而不是断开；同一代理重复 close() 无副作用。
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def __getattr__(self, name):
+        entry = self.__dict__.get('_entry')
+        if entry is None:
+            raise pymysql.err.InterfaceError(0, '连接已归还连接池')
+        return getattr(entry.raw, name)
+
+    @property
+    def open(self):
+        return self._entry is not None and self._entry.raw.open
+
+    def close(self):
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry)
+
+    def discard(self):
+        """连接已不可用（如网络中断）时调用：直接断开，不再放回池中"""
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry, discard=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    有界连接池：
+    - max_size 限制同时存在的物理连接数（空闲 + 借出），超出时借用方排队等待，最多等 timeout 秒
+    - min_idle / max_idle 控制空闲连接数量，由后台巡检线程补足或回收
+    - 连接使用 recycle_uses 次或存活 recycle_seconds 秒后重建
+    - 空闲超过 ping_idle_seconds 的连接在借出前先 ping 一次确认存活
+    """
+
+    def __init__(self, connect_kwargs, min_idle=2, max_idle=10, max_size=20, timeout=5.0,
+                 recycle_uses=1000, recycle_seconds=3600, ping_idle_seconds=30,
+                 housekeeping_interval=30, name='primary'):
+        if max_size < 1:
+            raise ValueError('max_size 必须大于 0')
+        self.connect_kwargs = dict(connect_kwargs)
+        self.name = name
+        self.max_size = max_size
+        self.max_idle = max(0, min(max_idle, max_size))
+        self.min_idle = max(0, min(min_idle, self.max_idle))
+        self.timeout = timeout
+        self.recycle_uses = recycle_uses
+        self.recycle_seconds = recycle_seconds
+        self.ping_idle_seconds = ping_idle_seconds
+        self.housekeeping_interval = housekeeping_interval
+
+        self._cond = threading.Condition(threading.Lock())
+        self._reset_state()
+
+    def _reset_state(self):
+        # 后进先出：优先复用最近归还的“热”连接，多余的冷连接自然老化被回收
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiters = 0
+        self._pid = os.getpid()
+        self._housekeeper = None
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'checkouts': 0,
+            'timeouts': 0,
+            'max_waiters': 0,
+            'checkout_ms_total': 0.0,
+        }
+        self._histogram = [0] * (len(CHECKOUT_BUCKETS_MS) + 1)
+
+    # ---------- 借出 / 归还 ----------
+
+    def connection(self, timeout=None):
+        """借出一个连接，返回 PooledConnection；超时抛出 PoolTimeoutError"""
+        start = time.perf_counter()
+        wait = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + wait
+
+        with self._cond:
+            self._check_fork()
+            if self._closed:
+                raise pymysql.err.InterfaceError(0, '连接池已关闭')
+            self._start_housekeeper()
+            entry = None
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # 先占位再在锁外建连，避免握手期间阻塞其他借用方
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(f'等待数据库连接超时（{wait}s）')
+                self._waiters += 1
+                self._stats['max_waiters'] = max(self._stats['max_waiters'], self._waiters)
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+            self._in_use += 1
+
+        try:
+            entry = self._prepare(entry)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        entry.uses += 1
+        self._record_checkout((time.perf_counter() - start) * 1000)
+        return PooledConnection(self, entry)
+
+    def _prepare(self, entry):
+        """确保借出的连接可用：新建、按寿命重建或 ping 探活"""
+        if entry is None:
+            return self._create()
+        if self._expired(entry):
+            self._close_raw(entry, recycled=True)
+            return self._create()
+        if time.monotonic() - entry.last_used >= self.ping_idle_seconds:
+            try:
+                entry.raw.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._stats['ping_failures'] += 1
+                self._close_raw(entry)
+                return self._create()
+        return entry
+
+    def _release(self, entry, discard=False):
+        entry.last_used = time.monotonic()
+        if not discard and entry.raw.open:
+            try:
+                # 未提交的事务（包括只读的一致性快照）必须回滚，否则下一个借用方会读到旧快照
+                if entry.raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    entry.raw.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            keep = (not discard and not self._closed and os.getpid() == self._pid
+                    and len(self._idle) < self.max_idle and not self._expired(entry))
+            if keep:
+                self._idle.append(entry)
+            else:
+                self._size -= 1
+            self._cond.notify()
+        if not keep:
+            self._close_raw(entry, recycled=not discard and self._expired(entry))
+
+    # ---------- 物理连接 ----------
+
+    def _create(self):
+        raw = pymysql.connect(**self.connect_kwargs)
+        with self._cond:
+            self._stats['created'] += 1
+        return _PoolEntry(raw)
+
+    def _close_raw(self, entry, recycled=False):
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['closed'] += 1
+            if recycled:
+                self._stats['recycled'] += 1
+
+    def _expired(self, entry):
+        if self.recycle_uses and entry.uses >= self.recycle_uses:
+            return True
+        if self.recycle_seconds and time.monotonic() - entry.created_at >= self.recycle_seconds:
+            return True
+        return False
+
+    def _check_fork(self):
+        """gunicorn 等 fork 后子进程不能复用父进程的套接字，丢弃继承来的状态（需持有锁）"""
+        if os.getpid() != self._pid:
+            self._reset_state()
+
+    # ---------- 后台巡检 ----------
+
+    def _start_housekeeper(self):
+        if self._housekeeper is not None or not self.housekeeping_interval:
+            return
+        t = threading.Thread(target=self._housekeeping_loop, name=f'db-pool-{self.name}', daemon=True)
+        self._housekeeper = t
+        t.start()
+
+    def _housekeeping_loop(self):
+        pid = os.getpid()
+        while not self._closed and os.getpid() == pid:
+            time.sleep(self.housekeeping_interval)
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f"⚠️  连接池巡检失败: {e}")
+
+    def maintain(self):
+        """回收过期的空闲连接，并把空闲连接补足到 min_idle"""
+        with self._cond:
+            stale = [e for e in self._idle if self._expired(e)]
+            for e in stale:
+                self._idle.remove(e)
+                self._size -= 1
+        for e in stale:
+            self._close_raw(e, recycled=True)
+
+        while True:
+            with self._cond:
+                if self._closed or len(self._idle) >= self.min_idle or self._size >= self.max_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._create()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.appendleft(entry)
+                self._cond.notify()
+
+    def close(self):
+        """关闭连接池：断开全部空闲连接，借出中的连接归还时断开"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for e in idle:
+            self._close_raw(e)
+
+    # ---------- 统计 ----------
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def _record_checkout(self, elapsed_ms):
+        idx = len(CHECKOUT_BUCKETS_MS)
+        for i, bound in enumerate(CHECKOUT_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                idx = i
+                break
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['checkout_ms_total'] += elapsed_ms
+            self._histogram[idx] += 1
+
+    def stats(self):
+        """连接池状态快照，供 /api/health 展示"""
+        with self._cond:
+            s = dict(self._stats)
+            histogram = list(self._histogram)
+            s.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiters': self._waiters,
+                'max_size': self.max_size,
+                'min_idle': self.min_idle,
+                'max_idle': self.max_idle,
+            })
+        checkouts = s.pop('checkout_ms_total')
+        s['avg_checkout_ms'] = round(checkouts / s['checkouts'], 3) if s['checkouts'] else 0.0
+        labels = [f'<={b}ms' for b in CHECKOUT_BUCKETS_MS] + [f'>{CHECKOUT_BUCKETS_MS[-1]}ms']
+        s['checkout_histogram'] = dict(zip(labels, histogram))
+        return s
+
+
+class ScopedConnection:
+    """
+    作用域内共享的连接（如一次 HTTP 请求）：
+    业务代码里的 close() 不会归还连接，统一由作用域结束时调用 release() 归还，
+    这样提前 return 的分支即使漏掉 close() 也不会泄漏连接。
+    """
+
+    def __init__(self, pooled):
+        self._pooled = pooled
+        self.committed = False
+
+    def __getattr__(self, name):
+        return getattr(self._pooled, name)
+
+    def commit(self):
+        self._pooled.commit()
+        self.committed = True
+
+    def close(self):
+        pass
+
+    def release(self):
+        self._pooled.close()
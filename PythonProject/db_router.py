@@ -0,0 +1,185 @@
+"""
+宠物平台 - 读写分离路由
+文件名：db_router.py
+
+读己之写：用户写入后 sticky_seconds 内的读请求走主库。进程内记录的最近写入只对同一进程有效，
+多进程部署时靠客户端回传的写入标记：有提交的请求在响应中带上签名的写入时间（issue_write_marker），
+客户端在之后的请求中原样带回，任何进程都能据此判断该用户刚写入过。
+"""
+
+import hashlib
+import hmac
+import itertools
+import threading
+import time
+
+from db_pool import ConnectionPool
+
+
+class ReplicaRouter:
+    """
+    只读流量路由：在从库连接池之间按策略挑选，复制延迟超过 max_lag_seconds 或探测失败的从库会被摘除，
+    没有可用从库时返回 None，由调用方回退主库。
+    strategy: round_robin 轮询；least_loaded 选借出连接占比最低的从库（相同则轮询）
+    """
+
+    def __init__(self, replica_pools, max_lag_seconds=3, lag_check_interval=5,
+                 strategy='least_loaded', sticky_seconds=None, secret=None):
+        self.replicas = list(replica_pools)
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_interval = lag_check_interval
+        self.strategy = strategy
+        # 用户写入后这段时间内的读请求走主库，保证“读己之写”；默认与可容忍的复制延迟一致
+        self.sticky_seconds = max_lag_seconds if sticky_seconds is None else sticky_seconds
+        # 写入标记的签名密钥，为空时不签发也不接受标记
+        self._secret = secret.encode() if isinstance(secret, str) else secret
+
+        self._rr = itertools.count()
+        self._lock = threading.Lock()
+        # 首次探测完成前不路由到从库
+        self._status = {p.name: {'healthy': False, 'lag': None, 'error': None, 'checked_at': None}
+                        for p in self.replicas}
+        self._recent_writers = {}
+        self._monitor = None
+        self._stats = {'replica_reads': 0, 'primary_fallbacks': 0, 'sticky_reads': 0}
+
+    @classmethod
+    def from_dsn_list(cls, dsn_list, base_config, pool_kwargs=None, **kwargs):
+        """根据 "host:port,host:port" 形式的配置创建从库连接池，账号、库名沿用主库配置"""
+        pools = []
+        for i, item in enumerate(x.strip() for x in (dsn_list or '').split(',')):
+            if not item:
+                continue
+            host, _, port = item.partition(':')
+            config = dict(base_config, host=host, port=int(port or base_config.get('port', 3306)))
+            pools.append(ConnectionPool(config, name=f'replica{i}', **(pool_kwargs or {})))
+        return cls(pools, **kwargs)
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    # ---------- 路由 ----------
+
+    def pick(self):
+        """挑选一个健康的从库连接池；没有可用从库时返回 None"""
+        if not self.replicas:
+            return None
+        self._start_monitor()
+        healthy = [p for p in self.replicas if self._status[p.name]['healthy']]
+        if not healthy:
+            self._count('primary_fallbacks')
+            return None
+        offset = next(self._rr)
+        ordered = healthy[offset % len(healthy):] + healthy[:offset % len(healthy)]
+        if self.strategy == 'least_loaded':
+            return min(ordered, key=lambda p: p.in_use / p.max_size)
+        return ordered[0]
+
+    def mark_write(self, user_id):
+        """记录用户刚发生写入"""
+        if user_id is None or not self.replicas:
+            return
+        with self._lock:
+            self._recent_writers[user_id] = time.monotonic()
+            if len(self._recent_writers) > 10000:
+                cutoff = time.monotonic() - self.sticky_seconds
+                self._recent_writers = {k: v for k, v in self._recent_writers.items() if v > cutoff}
+
+    def must_read_primary(self, user_id, marker=None):
+        """该用户近期写入过（本进程记录或客户端带回的写入标记），读请求需要走主库"""
+        ts = self._recent_writers.get(user_id) if user_id is not None else None
+        if (ts is not None and time.monotonic() - ts < self.sticky_seconds) or self._marker_is_recent(marker):
+            self._count('sticky_reads')
+            return True
+        return False
+
+    def _sign(self, payload):
+        return hmac.new(self._secret, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def issue_write_marker(self, now=None):
+        """签发写入标记 "<毫秒时间戳>.<签名>"，未配置从库或密钥时返回 None"""
+        if not self.replicas or not self._secret:
+            return None
+        payload = str(int((now or time.time()) * 1000))
+        return f'{payload}.{self._sign(payload)}'
+
+    def _marker_is_recent(self, marker, now=None):
+        if not marker or not self._secret:
+            return False
+        payload, _, signature = marker.partition('.')
+        if not payload.isdigit() or not hmac.compare_digest(signature, self._sign(payload)):
+            return False
+        age = (now or time.time()) - int(payload) / 1000
+        # 允许少量时钟偏差（标记由其他机器签发时）
+        return -1 <= age < self.sticky_seconds
+
+    def mark_unhealthy(self, pool, error):
+        """借连接失败时立即摘除，等下一轮延迟探测再恢复"""
+        with self._lock:
+            self._status[pool.name].update(healthy=False, error=str(error))
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def count_replica_read(self):
+        self._count('replica_reads')
+
+    # ---------- 复制延迟探测 ----------
+
+    def _start_monitor(self):
+        if self._monitor is not None:
+            return
+        with self._lock:
+            if self._monitor is not None:
+                return
+            self._monitor = threading.Thread(target=self._monitor_loop, name='db-replica-monitor', daemon=True)
+        self._monitor.start()
+
+    def _monitor_loop(self):
+        while True:
+            self.check_lag()
+            time.sleep(self.lag_check_interval)
+
+    def check_lag(self):
+        """探测每个从库的复制延迟并更新健康状态"""
+        for pool in self.replicas:
+            lag, error = None, None
+            try:
+                lag = self._read_lag(pool)
+            except Exception as e:
+                error = str(e)
+            healthy = error is None and lag is not None and lag <= self.max_lag_seconds
+            with self._lock:
+                self._status[pool.name].update(healthy=healthy, lag=lag, error=error,
+                                               checked_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+
+    @staticmethod
+    def _read_lag(pool):
+        conn = pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except Exception:
+                    # MySQL 8.0.22 之前的版本
+                    cursor.execute("SHOW SLAVE STATUS")
+                row = cursor.fetchone()
+        finally:
+            conn.close()
+        if not row:
+            # 不是从库（如开发环境直接指向主库），视为无延迟
+            return 0
+        lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+        # 复制线程停止时 lag 为 NULL，视为不可用
+        return None if lag is None else int(lag)
+
+    def stats(self):
+        with self._lock:
+            replicas = {name: dict(s) for name, s in self._status.items()}
+            s = dict(self._stats)
+        for pool in self.replicas:
+            replicas[pool.name]['pool'] = pool.stats()
+        s['replicas'] = replicas
+        return s
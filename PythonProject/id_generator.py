@@ -0,0 +1,236 @@
+"""
+宠物平台 - 分布式 ID 生成
+文件名：id_generator.py
+
+Snowflake 结构的 64 位 ID：41 位毫秒时间戳（自 EPOCH_MS 起）+ 10 位机器号 + 12 位序列号，
+单进程每毫秒最多 4096 个，生成时不访问数据库；不同进程/节点只要机器号不同就不会重复，且随时间单调递增。
+
+机器号必须在所有同时运行的进程间唯一。多进程部署时由 WorkerIdLease 在 worker_id_leases 表中租用：
+主键保证同一时刻一个机器号只有一个持有者，后台线程定期续租，进程退出后租约过期即可被复用；
+租约在本地判定可能已过期时停止发号并重新租用。
+"""
+
+import atexit
+import os
+import socket
+import threading
+import time
+import uuid
+
+
+# 2024-01-01 00:00:00 UTC
+EPOCH_MS = 1704067200000
+
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+
+# 时钟回拨不超过该值（毫秒）时等待追平，超过则报错，避免生成重复 ID
+MAX_CLOCK_BACKWARD_MS = 5
+
+
+class ClockMovedBackwardsError(Exception):
+    """系统时钟回拨过多"""
+
+
+class WorkerIdUnavailable(Exception):
+    """无法取得唯一的机器号（租约表已满、数据库不可用，或固定机器号的生成器被 fork 到了子进程）"""
+
+
+class WorkerIdLease:
+    """
+    在 worker_id_leases 表中租用机器号。
+    ttl：租约时长（秒），后台线程每 ttl/3 续租一次；本地超过 ttl/2 未续租成功即视为失效，停止使用该机器号
+    preferred：优先尝试的机器号（如配置的 WORKER_ID），被占用时改用其他空闲机器号
+    """
+
+    def __init__(self, pool, ttl=60, preferred=None):
+        self.pool = pool
+        self.ttl = ttl
+        self.preferred = preferred
+        self.worker_id = None
+        self._owner = None
+        self._pid = None
+        self._valid_until = 0
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._registered_exit = False
+
+    def valid(self):
+        return self.worker_id is not None and self._pid == os.getpid() and time.monotonic() < self._valid_until
+
+    def acquire(self):
+        """租用一个机器号并启动续租线程，返回机器号；没有空闲机器号时抛出 WorkerIdUnavailable"""
+        with self._lock:
+            if self.valid():
+                return self.worker_id
+            self._pid = os.getpid()
+            self.worker_id = None
+            self._heartbeat = None
+            self._owner = f'{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}'
+            conn = self.pool.connection()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT worker_id FROM worker_id_leases WHERE expires_at > NOW()")
+                    busy = {row['worker_id'] for row in cursor.fetchall()}
+                    conn.commit()
+                    for candidate in self._candidates(busy):
+                        started = time.monotonic()
+                        if self._claim(cursor, candidate):
+                            conn.commit()
+                            self.worker_id = candidate
+                            self._valid_until = started + self.ttl / 2
+                            break
+                        conn.commit()
+            finally:
+                conn.close()
+            if self.worker_id is None:
+                raise WorkerIdUnavailable('没有空闲的机器号可租用')
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, args=(self._owner,),
+                                               name='worker-id-lease', daemon=True)
+            self._heartbeat.start()
+            if not self._registered_exit:
+                atexit.register(self.release)
+                self._registered_exit = True
+            print(f"🆔 租用机器号 {self.worker_id}（{self._owner}）")
+            return self.worker_id
+
+    def _candidates(self, busy):
+        start = self.preferred if self.preferred is not None else os.getpid() % (MAX_WORKER_ID + 1)
+        for offset in range(MAX_WORKER_ID + 1):
+            candidate = (start + offset) % (MAX_WORKER_ID + 1)
+            if candidate not in busy:
+                yield candidate
+
+    def _claim(self, cursor, worker_id):
+        # 空闲行直接插入；已存在的行只在租约过期时改为本进程持有（MySQL 按从左到右的顺序赋值）
+        cursor.execute("""
+            INSERT INTO worker_id_leases (worker_id, owner, expires_at)
+            VALUES (%s, %s, NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE
+                owner = IF(expires_at <= NOW(), VALUES(owner), owner),
+                expires_at = IF(owner = VALUES(owner), VALUES(expires_at), expires_at)
+        """, (worker_id, self._owner, self.ttl))
+        cursor.execute("SELECT owner FROM worker_id_leases WHERE worker_id = %s", (worker_id,))
+        row = cursor.fetchone()
+        return row is not None and row['owner'] == self._owner
+
+    def renew(self):
+        """续租，返回是否仍持有该机器号"""
+        if self.worker_id is None or self._pid != os.getpid():
+            return False
+        started = time.monotonic()
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE worker_id_leases SET expires_at = NOW() + INTERVAL %s SECOND
+                    WHERE worker_id = %s AND owner = %s
+                """, (self.ttl, self.worker_id, self._owner))
+                cursor.execute("SELECT owner FROM worker_id_leases WHERE worker_id = %s", (self.worker_id,))
+                row = cursor.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        held = row is not None and row['owner'] == self._owner
+        if held:
+            self._valid_until = started + self.ttl / 2
+        return held
+
+    def _heartbeat_loop(self, owner):
+        while self._owner == owner and self._pid == os.getpid():
+            time.sleep(self.ttl / 3)
+            if self._owner != owner:
+                return
+            try:
+                if not self.renew():
+                    print(f"⚠️  机器号 {self.worker_id} 的租约已丢失，下次发号时重新租用")
+                    self._valid_until = 0
+                    return
+            except Exception as e:
+                print(f"⚠️  机器号续租失败: {e}")
+
+    def release(self):
+        """进程退出时归还租约"""
+        if self.worker_id is None or self._pid != os.getpid():
+            return
+        owner, self._owner = self._owner, None
+        try:
+            conn = self.pool.connection()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("DELETE FROM worker_id_leases WHERE worker_id = %s AND owner = %s",
+                                   (self.worker_id, owner))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception:
+            pass
+        self.worker_id = None
+
+
+class SnowflakeGenerator:
+    """
+    线程安全的 Snowflake ID 生成器。
+    worker_id：固定机器号，只适用于单进程（脚本、测试）；被 fork 到子进程后拒绝发号，避免父子进程生成相同 ID
+    lease：WorkerIdLease，多进程部署使用；每个进程在首次发号时租用自己的机器号，fork 后的子进程重新租用
+    """
+
+    def __init__(self, worker_id=None, lease=None):
+        if (worker_id is None) == (lease is None):
+            raise ValueError('需要且只能指定 worker_id 或 lease 之一')
+        if worker_id is not None and not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'worker_id 取值范围为 0~{MAX_WORKER_ID}')
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.worker_id = worker_id
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _ensure_worker_id(self):
+        if self.lease is None:
+            if os.getpid() != self._pid:
+                raise WorkerIdUnavailable('固定机器号的生成器不能在 fork 出的子进程中使用，请改用 WorkerIdLease')
+            return
+        if not self.lease.valid():
+            worker_id = self.lease.acquire()
+            if worker_id != self.worker_id or os.getpid() != self._pid:
+                self._pid = os.getpid()
+                self.worker_id = worker_id
+                self._last_ms = -1
+                self._sequence = 0
+
+    @staticmethod
+    def _now_ms():
+        return time.time_ns() // 1_000_000
+
+    def next_id(self):
+        with self._lock:
+            self._ensure_worker_id()
+            now = self._now_ms()
+            if now < self._last_ms:
+                backward = self._last_ms - now
+                if backward > MAX_CLOCK_BACKWARD_MS:
+                    raise ClockMovedBackwardsError(f'系统时钟回拨 {backward}ms，拒绝生成 ID')
+                time.sleep(backward / 1000)
+                now = max(self._now_ms(), self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    # 本毫秒序列号用完，等到下一毫秒
+                    while now <= self._last_ms:
+                        now = self._now_ms()
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return ((now - EPOCH_MS) << (WORKER_ID_BITS + SEQUENCE_BITS)) \
+                | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+
+def parse_id(value):
+    """拆解 ID，便于排查：返回 (生成时间戳毫秒, 机器号, 序列号)"""
+    return ((value >> (WORKER_ID_BITS + SEQUENCE_BITS)) + EPOCH_MS,
+            (value >> SEQUENCE_BITS) & MAX_WORKER_ID,
+            value & SEQUENCE_MASK)
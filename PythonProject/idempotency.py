@@ -0,0 +1,259 @@
+"""
+宠物平台 - 幂等键存储
+文件名：idempotency.py
+
+客户端对同一次操作重试时携带相同的 Idempotency-Key：首个请求正常执行并缓存响应，
+之后的重放直接返回缓存；首个请求仍在执行时，并发的重复请求等待其结果，超时返回冲突。
+
+DbIdempotencyStore：键记录在 idempotency_keys 表中，在请求自己的事务里插入占位，随业务数据一起提交或回滚，
+多进程/多节点共享；并发的重复请求在唯一键上等待首个请求的事务结束。
+MemoryIdempotencyStore：进程内存储，仅用于单进程开发环境。
+两者接口相同：begin / complete / abort 的 conn 参数为请求使用的数据库连接（内存存储忽略）。
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+
+class IdempotencyConflict(Exception):
+    """同一幂等键的请求仍在处理中"""
+
+
+class IdempotencyMismatch(Exception):
+    """同一幂等键被用于不同的请求内容"""
+
+
+class _Entry:
+    __slots__ = ('fingerprint', 'response', 'done', 'expires_at')
+
+    def __init__(self, fingerprint, expires_at):
+        self.fingerprint = fingerprint
+        self.response = None
+        self.done = threading.Event()
+        self.expires_at = expires_at
+
+
+class MemoryIdempotencyStore:
+    """
+    进程内幂等键存储。
+    ttl：已完成响应的缓存时长（秒）
+    pending_ttl：处理中记录的最长保留时间，防止进程异常导致键被永久占用
+    """
+
+    def __init__(self, ttl=86400, pending_ttl=60, max_entries=100000):
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._ops = 0
+        self._stats = {'executed': 0, 'replayed': 0, 'conflicts': 0, 'mismatches': 0}
+
+    def begin(self, key, fingerprint, wait_timeout=5.0, conn=None):
+        """
+        开始处理幂等键：返回 None 表示调用方需执行请求并调用 complete()/abort()；
+        返回缓存的响应表示这是重放。
+        """
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            with self._lock:
+                self._maybe_sweep()
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires_at <= time.monotonic():
+                    del self._entries[key]
+                    entry = None
+                if entry is None:
+                    self._entries[key] = _Entry(fingerprint, time.monotonic() + self.pending_ttl)
+                    self._stats['executed'] += 1
+                    return None
+                if entry.fingerprint != fingerprint:
+                    self._stats['mismatches'] += 1
+                    raise IdempotencyMismatch(key)
+                if entry.done.is_set():
+                    self._stats['replayed'] += 1
+                    return entry.response
+            remaining = deadline - time.monotonic()
+            # 等待首个请求完成；abort() 后记录被移除，循环回去由本请求接手执行
+            if remaining <= 0 or not entry.done.wait(remaining):
+                with self._lock:
+                    self._stats['conflicts'] += 1
+                raise IdempotencyConflict(key)
+
+    def complete(self, key, response, conn=None):
+        """记录请求结果并唤醒等待中的重复请求"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.response = response
+            entry.expires_at = time.monotonic() + self.ttl
+        entry.done.set()
+
+    def abort(self, key, conn=None):
+        """请求失败（不应缓存）时释放幂等键，允许客户端重试"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.done.set()
+
+    def _maybe_sweep(self):
+        self._ops += 1
+        if self._ops % 1000 and len(self._entries) < self.max_entries:
+            return
+        now = time.monotonic()
+        expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+        for k in expired:
+            del self._entries[k]
+        if len(self._entries) >= self.max_entries:
+            # 仍然超限时淘汰最早过期的已完成记录
+            finished = sorted((e.expires_at, k) for k, e in self._entries.items() if e.done.is_set())
+            for _, k in finished[:len(self._entries) - self.max_entries + 1]:
+                del self._entries[k]
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['entries'] = len(self._entries)
+        return s
+
+
+class DbIdempotencyStore:
+    """
+    数据库幂等键存储（idempotency_keys 表，键为幂等键的 SHA-256）。
+    begin 在请求连接上 INSERT IGNORE 占位但不提交：业务成功提交时占位一并提交，失败回滚时占位随之消失；
+    并发的重复请求在唯一键上等待行锁，占位期间把会话的 innodb_lock_wait_timeout 调为剩余的等待时间，
+    等锁超时（1205）视为冲突，不会占用请求线程与连接直到 MySQL 默认的 50 秒；
+    complete 在业务提交后写入响应。首个请求的事务已提交但未来得及写入响应（进程崩溃）时，
+    重复请求一直返回冲突直到记录过期，不会再次执行。
+    pool：清理过期记录使用的连接池（独立于请求事务）
+    ttl：记录保留时长（秒）
+    poll_interval：重复请求等待首个请求写入响应时的轮询间隔（秒）
+    """
+
+    def __init__(self, pool, ttl=86400, poll_interval=0.05, purge_every=1000):
+        self.pool = pool
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.purge_every = purge_every
+        self._ops = 0
+        self._lock = threading.Lock()
+        self._stats = {'executed': 0, 'replayed': 0, 'conflicts': 0, 'mismatches': 0, 'purged': 0}
+
+    # MySQL 等锁超时的错误码
+    LOCK_WAIT_TIMEOUT = 1205
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def _is_lock_wait_timeout(cls, error):
+        return bool(error.args) and error.args[0] == cls.LOCK_WAIT_TIMEOUT
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def begin(self, key, fingerprint, wait_timeout=5.0, conn=None):
+        """返回 None 表示已占位、调用方执行请求；返回缓存的 (body, status, mimetype) 表示重放"""
+        self._maybe_purge()
+        key_hash = self._hash(key)
+        deadline = time.monotonic() + wait_timeout
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT @@SESSION.innodb_lock_wait_timeout AS timeout")
+            session_timeout = cursor.fetchone()['timeout']
+            try:
+                return self._claim(conn, cursor, key, key_hash, fingerprint, deadline)
+            finally:
+                cursor.execute("SET SESSION innodb_lock_wait_timeout = %s", (session_timeout,))
+
+    def _claim(self, conn, cursor, key, key_hash, fingerprint, deadline):
+        while True:
+            # 首个请求的事务未结束时，这里会在唯一键上等待其提交或回滚，最多等到 deadline
+            lock_wait = max(1, math.ceil(deadline - time.monotonic()))
+            cursor.execute("SET SESSION innodb_lock_wait_timeout = %s", (lock_wait,))
+            try:
+                cursor.execute("""
+                    INSERT IGNORE INTO idempotency_keys (key_hash, fingerprint, status, expires_at)
+                    VALUES (%s, %s, 'pending', NOW() + INTERVAL %s SECOND)
+                """, (key_hash, fingerprint, self.ttl))
+            except Exception as e:
+                if not self._is_lock_wait_timeout(e):
+                    raise
+                conn.rollback()
+                self._count('conflicts')
+                raise IdempotencyConflict(key)
+            if cursor.rowcount == 1:
+                self._count('executed')
+                return None
+            cursor.execute("""
+                SELECT fingerprint, status, response_body, response_status, response_mimetype,
+                       expires_at <= NOW() AS expired
+                FROM idempotency_keys WHERE key_hash = %s
+            """, (key_hash,))
+            row = cursor.fetchone()
+            if row is not None and row['expired']:
+                cursor.execute("DELETE FROM idempotency_keys WHERE key_hash = %s AND expires_at <= NOW()",
+                               (key_hash,))
+                conn.commit()
+                continue
+            if row is not None:
+                if row['fingerprint'] != fingerprint:
+                    conn.rollback()
+                    self._count('mismatches')
+                    raise IdempotencyMismatch(key)
+                if row['status'] == 'done':
+                    conn.rollback()
+                    self._count('replayed')
+                    return bytes(row['response_body']), row['response_status'], row['response_mimetype']
+            # 已提交但尚未写入响应：结束当前快照后再查
+            conn.rollback()
+            if time.monotonic() >= deadline:
+                self._count('conflicts')
+                raise IdempotencyConflict(key)
+            time.sleep(self.poll_interval)
+
+    def complete(self, key, response, conn=None):
+        """业务提交后写入响应"""
+        body, status, mimetype = response
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE idempotency_keys
+                SET status = 'done', response_body = %s, response_status = %s, response_mimetype = %s,
+                    expires_at = NOW() + INTERVAL %s SECOND
+                WHERE key_hash = %s
+            """, (body, status, mimetype, self.ttl, self._hash(key)))
+        conn.commit()
+
+    def abort(self, key, conn=None):
+        """请求失败：回滚未提交的业务与占位；占位已随业务提交时删除，允许客户端重试"""
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM idempotency_keys WHERE key_hash = %s", (self._hash(key),))
+        conn.commit()
+
+    def _maybe_purge(self):
+        with self._lock:
+            self._ops += 1
+            if self._ops % self.purge_every:
+                return
+        try:
+            purge_conn = self.pool.connection()
+            try:
+                with purge_conn.cursor() as cursor:
+                    cursor.execute("DELETE FROM idempotency_keys WHERE expires_at <= NOW() LIMIT 1000")
+                    purged = cursor.rowcount
+                purge_conn.commit()
+            finally:
+                purge_conn.close()
+            self._count('purged', purged)
+        except Exception as e:
+            print(f"⚠️  清理过期幂等键失败: {e}")
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s['backend'] = 'db'
+        return s
@@ -0,0 +1,133 @@
+"""
+宠物平台 - 商品列表排序索引
+文件名：listing_index.py
+
+为每个 (分类, sortType) 维护一个有序数组，元素为升序可比较的排序键，末位是 -id（相同值按 id 降序，
+同时可从键中取回 id）。翻页就是数组切片；商品变更时用 bisect 定位后删除旧键、插入新键，
+不需要整体重排。分类为 None 的数组包含全部在售商品。
+
+逐条 update 每次 del/insort 都是 O(n) 的内存搬移，批量变更（如批量改价）时改用 updated：
+在锁外为受影响的数组生成新数组（过滤删除 + 归并插入，每个数组一趟），调用方在锁内只替换引用。
+"""
+
+import heapq
+from bisect import bisect_left, insort
+from datetime import datetime
+from operator import itemgetter
+
+
+def _ts(value):
+    return value.timestamp() if isinstance(value, datetime) else 0.0
+
+
+# sortType -> 主排序值（升序；降序字段取负），与 get_products 的 SQL 排序一致，相同值按 id 降序。
+# DECIMAL 转为 float 比较：两位小数的金额/评分转换后顺序不变，比较速度快得多
+PRIMARY_KEYS = {
+    'price_asc': lambda r: float(r.price or 0),
+    'price_desc': lambda r: -float(r.price or 0),
+    'sales': lambda r: -(r.sales or 0),
+    'rating': lambda r: -float(r.rating or 0),
+    'default': lambda r: -_ts(r.created_at),
+}
+
+
+def _sort_key(primary):
+    return lambda r: (primary(r), -r.id)
+
+
+# 数组中存放的完整排序键：(主排序值, -id)
+SORT_KEY_FUNCS = {sort_type: _sort_key(primary) for sort_type, primary in PRIMARY_KEYS.items()}
+
+
+def _listed(record):
+    return record is not None and record.status == 1
+
+
+def _groups(record):
+    """记录所属的数组：全部商品 + 自身分类"""
+    return (None, record.category) if record.category else (None,)
+
+
+class ListingIndex:
+    def __init__(self):
+        # (分类或 None, sortType) -> 有序排序键列表
+        self._arrays = {}
+
+    @classmethod
+    def build(cls, records):
+        """由全部商品一次性构建（全量加载时使用）"""
+        index = cls()
+        # 先按 id 降序排好，之后每种排序只按主排序值做一次稳定排序，相同值自然保持 id 降序；
+        # 比直接按 (主排序值, -id) 元组排序快数倍
+        by_id_desc = sorted((r for r in records if _listed(r)), key=lambda r: r.id, reverse=True)
+        for sort_type, primary in PRIMARY_KEYS.items():
+            decorated = [(primary(r), -r.id, r.category) for r in by_id_desc]
+            decorated.sort(key=itemgetter(0))
+            index._arrays[(None, sort_type)] = [(p, neg_id) for p, neg_id, _ in decorated]
+            for p, neg_id, category in decorated:
+                if category:
+                    array = index._arrays.get((category, sort_type))
+                    if array is None:
+                        array = index._arrays[(category, sort_type)] = []
+                    array.append((p, neg_id))
+        return index
+
+    def update(self, old, new):
+        """
+        商品从 old 变为 new（新增时 old 为 None，物理删除时 new 为 None），每个数组 O(log n) 定位。
+        调用方应在排序相关字段未变时跳过调用，并保证与读取之间的互斥。
+        """
+        if _listed(old):
+            for group in _groups(old):
+                for sort_type, key in SORT_KEY_FUNCS.items():
+                    array = self._arrays.get((group, sort_type))
+                    if array is None:
+                        continue
+                    k = key(old)
+                    i = bisect_left(array, k)
+                    if i < len(array) and array[i] == k:
+                        del array[i]
+        if _listed(new):
+            for group in _groups(new):
+                for sort_type, key in SORT_KEY_FUNCS.items():
+                    insort(self._arrays.setdefault((group, sort_type), []), key(new))
+
+    def updated(self, changes):
+        """
+        返回应用了 changes（[(old, new)]，含义同 update）的新索引，不修改当前索引，可在锁外执行；
+        未受影响的数组与当前索引共用。
+        """
+        removed = {}
+        added = {}
+        for old, new in changes:
+            if _listed(old):
+                for group in _groups(old):
+                    for sort_type, key in SORT_KEY_FUNCS.items():
+                        removed.setdefault((group, sort_type), set()).add(key(old))
+            if _listed(new):
+                for group in _groups(new):
+                    for sort_type, key in SORT_KEY_FUNCS.items():
+                        added.setdefault((group, sort_type), []).append(key(new))
+
+        index = ListingIndex()
+        index._arrays = dict(self._arrays)
+        for array_key in removed.keys() | added.keys():
+            array = self._arrays.get(array_key, [])
+            drop = removed.get(array_key)
+            if drop:
+                array = [k for k in array if k not in drop]
+            inserts = added.get(array_key)
+            if inserts:
+                array = list(heapq.merge(array, sorted(inserts)))
+            elif not drop:
+                array = list(array)
+            index._arrays[array_key] = array
+        return index
+
+    def page(self, category=None, sort_type='default', offset=0, limit=20):
+        """返回 (本页商品 ID 列表, 总数)"""
+        array = self._arrays.get((category or None, sort_type if sort_type in SORT_KEY_FUNCS else 'default'), [])
+        return [-k[-1] for k in array[offset:offset + limit]], len(array)
+
+    def size(self):
+        return len(self._arrays.get((None, 'default'), []))
@@ -0,0 +1,145 @@
+"""
+宠物平台 - 登录限流
+文件名：login_throttle.py
+
+原实现每次密码错误都 UPDATE users.login_attempts，登录成功再清零，撞库时变成对最热的 users 表连续加行锁写入。
+这里把失败计数放在内存的滑动窗口中：
+- 按手机号：窗口内失败 max_failures 次即锁定 lock_seconds 秒，只有真正锁定时才写一次 users.locked_until（跨进程/重启可见）
+- 按客户端 IP：窗口内失败过多（含不存在的手机号）直接拒绝，防止换号撞库
+- 已锁定的手机号/IP 在查库之前就拒绝
+计数存储可替换：实现 MemoryThrottleStore 同样的 hit / reset / set_lock / get_lock 方法即可换成共享存储（如 Redis），
+使多进程共享计数；默认的内存存储为每进程独立计数。
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class MemoryThrottleStore:
+    """
+    进程内存储。hit(key, window) 记一次并返回窗口内的次数（滑动窗口：保存每次的时间戳，过期的丢弃）；
+    max_keys 为记录的键数上限，超过时按各键自己的窗口清理已过期的键。
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._hits = {}
+        # key -> 该键的窗口（秒）；手机号与 IP 的窗口不同，清理时不能用调用方的窗口
+        self._windows = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, window, now=None):
+        now = now or time.time()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if len(self._hits) >= self.max_keys:
+                    self._sweep(now)
+                hits = self._hits[key] = deque()
+            self._windows[key] = window
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            hits.append(now)
+            return len(hits)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+            self._windows.pop(key, None)
+            self._locks.pop(key, None)
+
+    def set_lock(self, key, until):
+        with self._lock:
+            self._locks[key] = until
+
+    def get_lock(self, key, now=None):
+        """未锁定或已过期时返回 None，否则返回解锁时间戳"""
+        now = now or time.time()
+        with self._lock:
+            until = self._locks.get(key)
+            if until is None:
+                return None
+            if until <= now:
+                del self._locks[key]
+                return None
+            return until
+
+    def _sweep(self, now):
+        self._hits = {k: v for k, v in self._hits.items() if v and v[-1] > now - self._windows[k]}
+        self._windows = {k: self._windows[k] for k in self._hits}
+        self._locks = {k: v for k, v in self._locks.items() if v > now}
+        if len(self._hits) >= self.max_keys:
+            # 仍然过多（大规模攻击）：清空计数，宁可放过少量尝试也不让内存无限增长
+            self._hits.clear()
+            self._windows.clear()
+
+    def size(self):
+        with self._lock:
+            return len(self._hits)
+
+
+class LoginThrottle:
+    """
+    max_failures / window：同一手机号 window 秒内允许的失败次数，达到后锁定 lock_seconds 秒
+    ip_max_failures / ip_window：同一 IP 的失败上限，达到后该 IP 锁定 lock_seconds 秒
+    """
+
+    def __init__(self, store=None, max_failures=5, window=1800, lock_seconds=1800,
+                 ip_max_failures=50, ip_window=900):
+        self.store = store or MemoryThrottleStore()
+        self.max_failures = max_failures
+        self.window = window
+        self.lock_seconds = lock_seconds
+        self.ip_max_failures = ip_max_failures
+        self.ip_window = ip_window
+        self._stats = {'blocked_phone': 0, 'blocked_ip': 0, 'failures': 0, 'locks': 0}
+
+    def check(self, phone, ip=None):
+        """返回 ('phone' | 'ip', 解锁时间戳) 或 None；在查库之前调用"""
+        until = self.store.get_lock(f'phone:{phone}')
+        if until is not None:
+            self._stats['blocked_phone'] += 1
+            return 'phone', until
+        if ip:
+            until = self.store.get_lock(f'ip:{ip}')
+            if until is not None:
+                self._stats['blocked_ip'] += 1
+                return 'ip', until
+        return None
+
+    def record_failure(self, phone, ip=None, count_phone=True):
+        """
+        记一次失败，返回 (手机号剩余次数, 本次是否触发手机号锁定)。
+        count_phone=False 用于手机号不存在的情况：只计入 IP。
+        """
+        self._stats['failures'] += 1
+        now = time.time()
+        if ip:
+            ip_failures = self.store.hit(f'ip:{ip}', self.ip_window, now)
+            if ip_failures >= self.ip_max_failures:
+                self.store.set_lock(f'ip:{ip}', now + self.lock_seconds)
+                if ip_failures == self.ip_max_failures:
+                    self._stats['locks'] += 1
+        if not count_phone:
+            return self.max_failures, False
+        failures = self.store.hit(f'phone:{phone}', self.window, now)
+        if failures >= self.max_failures:
+            self.lock(phone, now + self.lock_seconds)
+            self._stats['locks'] += 1
+            return 0, True
+        return self.max_failures - failures, False
+
+    def record_success(self, phone):
+        self.store.reset(f'phone:{phone}')
+
+    def lock(self, phone, until):
+        """记下手机号的锁定（包括从 users.locked_until 读到的、由其他进程写入的锁定），之后的尝试不再查库"""
+        self.store.set_lock(f'phone:{phone}', until)
+
+    def stats(self):
+        s = dict(self._stats)
+        if isinstance(self.store, MemoryThrottleStore):
+            s['tracked_keys'] = self.store.size()
+        return s
@@ -0,0 +1,325 @@
+"""
+宠物平台 - 数据库结构迁移
+文件名：migrations.py
+
+用法：
+    python migrations.py            执行所有未执行的迁移（部署时运行一次）
+    python migrations.py status     查看当前结构版本
+"""
+
+import os
+import sys
+
+import pymysql
+from dotenv import load_dotenv
+
+from passwords import hash_password
+
+
+MIGRATIONS = []
+
+# 多个进程同时执行迁移时，用 MySQL 命名锁保证只有一个在跑
+MIGRATION_LOCK_NAME = 'pet_platform_schema_migration'
+
+
+def migration(version, description):
+    """注册迁移：被装饰函数接收 cursor，应当可重复执行（对已存在的字段/索引跳过）"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+# ==================== 工具函数 ====================
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def _table_exists(cursor, table):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone() is not None
+
+
+def _index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        LIMIT 1
+    """, (table, index))
+    return cursor.fetchone() is not None
+
+
+def _add_index(cursor, table, index, columns, unique=False):
+    if not _index_exists(cursor, table, index):
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        cursor.execute(f"ALTER TABLE {table} ADD {kind} {index} ({columns})")
+        print(f"  ✅ {table} 添加索引: {index}({columns})")
+
+
+def _add_column(cursor, table, column, definition):
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        print(f"  ✅ {table} 添加字段: {column}")
+
+
+# ==================== 迁移列表 ====================
+
+@migration(1, '用户表增加密码与登录锁定字段')
+def _m001_user_password_columns(cursor):
+    _add_column(cursor, 'users', 'password', "VARCHAR(255) DEFAULT ''")
+    _add_column(cursor, 'users', 'login_attempts', "INT DEFAULT 0")
+    _add_column(cursor, 'users', 'locked_until', "TIMESTAMP NULL")
+
+
+@migration(2, '为未设置密码的用户设置默认密码 123456')
+def _m002_default_passwords(cursor):
+    # 带盐 KDF 哈希（见 passwords.py）；早期执行过本迁移的库中为旧 sha256 哈希，登录时自动升级
+    default_password = hash_password('123456')
+    cursor.execute("UPDATE users SET password = %s WHERE password IS NULL OR password = ''", (default_password,))
+    if cursor.rowcount > 0:
+        print(f"  ✅ 已为{cursor.rowcount}个用户设置默认密码: 123456")
+
+
+@migration(3, '热点查询复合索引（购物车/订单/笔记/地址/收藏/商品）')
+def _m003_hot_query_indexes(cursor):
+    # 索引列顺序与 app.py 中的 WHERE 等值条件 + ORDER BY 保持一致，校验见 query_plans.py
+    _add_index(cursor, 'cart', 'idx_cart_user_product', 'user_id, product_id')
+    _add_index(cursor, 'orders', 'idx_orders_user_created', 'user_id, created_at')
+    _add_index(cursor, 'orders', 'idx_orders_user_status_created', 'user_id, status, created_at')
+    _add_index(cursor, 'order_items', 'idx_order_items_order', 'order_id')
+    _add_index(cursor, 'pet_notes', 'idx_notes_user_status_created', 'user_id, status, created_at')
+    _add_index(cursor, 'addresses', 'idx_addresses_user_status', 'user_id, status')
+    _add_index(cursor, 'favorites', 'idx_favorites_user_product', 'user_id, product_id')
+    _add_index(cursor, 'products', 'idx_products_status_category_sales', 'status, category, sales')
+    _add_index(cursor, 'pet_categories', 'idx_pet_categories_name', 'name')
+
+
+@migration(4, '库存预占表 stock_reservations')
+def _m004_stock_reservations(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL COMMENT '订单ID',
+            product_id INT NOT NULL COMMENT '商品ID',
+            quantity INT NOT NULL COMMENT '预占数量',
+            status VARCHAR(20) NOT NULL DEFAULT 'reserved' COMMENT 'reserved预占中 confirmed已支付 released已释放',
+            expires_at DATETIME NOT NULL COMMENT '预占过期时间',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_reservations_order (order_id, status),
+            INDEX idx_reservations_status_expires (status, expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT '库存预占'
+    """)
+
+
+@migration(5, '订单按状态与创建时间索引（超时自动取消加载待支付订单）')
+def _m005_orders_status_created(cursor):
+    _add_index(cursor, 'orders', 'idx_orders_status_created', 'status, created_at')
+
+
+@migration(6, '游标分页索引（反馈/资讯/资讯评论）')
+def _m006_keyset_pagination_indexes(cursor):
+    # InnoDB 二级索引隐含主键，(…, created_at) 即可按 (created_at, id) 游标定位
+    _add_index(cursor, 'feedback', 'idx_feedback_user_created', 'user_id, created_at')
+    # news / news_comments 不由 db_init.py 创建，部分环境可能没有
+    if _table_exists(cursor, 'news'):
+        _add_index(cursor, 'news', 'idx_news_status_created', 'status, created_at')
+        _add_index(cursor, 'news', 'idx_news_status_type_created', 'status, type, created_at')
+    if _table_exists(cursor, 'news_comments'):
+        _add_index(cursor, 'news_comments', 'idx_news_comments_news_status_created', 'news_id, status, created_at')
+
+
+@migration(7, '商品表增加 updated_at（商品目录缓存按更新时间增量刷新）')
+def _m007_products_updated_at(cursor):
+    _add_column(cursor, 'products', 'updated_at',
+                "TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'")
+    _add_index(cursor, 'products', 'idx_products_updated', 'updated_at')
+
+
+@migration(8, '笔记按更新时间索引（笔记搜索索引增量刷新）')
+def _m008_notes_updated_at(cursor):
+    _add_index(cursor, 'pet_notes', 'idx_notes_updated', 'updated_at')
+
+
+@migration(9, '搜索历史去重：(user_id, keyword) 唯一，增加搜索次数字段（批量写入改为 upsert）')
+def _m009_search_history_dedupe(cursor):
+    _add_column(cursor, 'search_history', 'search_count',
+                "INT NOT NULL DEFAULT 1 COMMENT '搜索次数'")
+    if _index_exists(cursor, 'search_history', 'uk_search_history_user_keyword'):
+        return
+    # 每组保留 id 最大的一行，记上合并前的次数与最近搜索时间，再删除其余行
+    cursor.execute("""
+        UPDATE search_history h
+        JOIN (
+            SELECT MAX(id) AS keep_id, SUM(search_count) AS cnt, MAX(created_at) AS last_at
+            FROM search_history
+            GROUP BY user_id, keyword
+            HAVING COUNT(*) > 1
+        ) d ON h.id = d.keep_id
+        SET h.search_count = d.cnt, h.created_at = d.last_at
+    """)
+    cursor.execute("""
+        DELETE h FROM search_history h
+        JOIN (
+            SELECT user_id, keyword, MAX(id) AS keep_id
+            FROM search_history
+            GROUP BY user_id, keyword
+            HAVING COUNT(*) > 1
+        ) d ON h.user_id = d.user_id AND h.keyword = d.keyword AND h.id < d.keep_id
+    """)
+    _add_index(cursor, 'search_history', 'uk_search_history_user_keyword', 'user_id, keyword', unique=True)
+
+
+@migration(10, '用户表增加 token_generation（退出登录/修改密码时加一，吊销此前签发的 token）')
+def _m010_user_token_generation(cursor):
+    _add_column(cursor, 'users', 'token_generation',
+                "INT NOT NULL DEFAULT 0 COMMENT 'token 代数'")
+
+
+@migration(11, '订单号机器号租约表 worker_id_leases（每个进程租用唯一的 Snowflake 机器号）')
+def _m011_worker_id_leases(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS worker_id_leases (
+            worker_id SMALLINT UNSIGNED PRIMARY KEY COMMENT '机器号 0~1023',
+            owner VARCHAR(128) NOT NULL COMMENT '持有者（主机名:进程号:随机串）',
+            expires_at DATETIME NOT NULL COMMENT '租约过期时间',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT '订单号机器号租约'
+    """)
+
+
+@migration(12, '幂等键表 idempotency_keys（多进程共享的 Idempotency-Key 记录）')
+def _m012_idempotency_keys(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key_hash CHAR(64) PRIMARY KEY COMMENT '用户+接口+幂等键的 SHA-256',
+            fingerprint CHAR(64) NOT NULL COMMENT '请求体的 SHA-256',
+            status VARCHAR(10) NOT NULL DEFAULT 'pending' COMMENT 'pending处理中 done已完成',
+            response_body MEDIUMBLOB NULL COMMENT '首次响应内容',
+            response_status SMALLINT NULL COMMENT '首次响应状态码',
+            response_mimetype VARCHAR(100) NULL,
+            expires_at DATETIME NOT NULL COMMENT '过期时间',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_idempotency_expires (expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT '幂等键'
+    """)
+
+
+@migration(13, 'refresh token 表 refresh_tokens（每个 refresh token 只能使用一次）')
+def _m013_refresh_tokens(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS refresh_tokens (
+            jti CHAR(32) PRIMARY KEY COMMENT 'refresh token 的随机 ID',
+            user_id INT NOT NULL COMMENT '用户ID',
+            expires_at DATETIME NOT NULL COMMENT '过期时间（UTC）',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_refresh_tokens_user (user_id, expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT 'refresh token'
+    """)
+
+
+# ==================== 执行器 ====================
+
+def ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY COMMENT '结构版本号',
+            description VARCHAR(255) NOT NULL COMMENT '迁移说明',
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '执行时间'
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT '数据库结构版本'
+    """)
+
+
+def get_schema_version(conn):
+    """读取当前结构版本；尚未执行过任何迁移时返回 0"""
+    with conn.cursor() as cursor:
+        if not _table_exists(cursor, 'schema_version'):
+            return 0
+        cursor.execute("SELECT MAX(version) AS version FROM schema_version")
+        row = cursor.fetchone()
+    return (row or {}).get('version') or 0
+
+
+def run_migrations(conn, target=None):
+    """执行所有版本号大于当前版本（且不超过 target）的迁移，返回执行的迁移数"""
+    target = latest_version() if target is None else target
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT GET_LOCK(%s, 60) AS locked", (MIGRATION_LOCK_NAME,))
+        if not (cursor.fetchone() or {}).get('locked'):
+            raise RuntimeError('获取迁移锁超时，可能有其他进程正在执行迁移')
+        try:
+            ensure_version_table(cursor)
+            conn.commit()
+            current = get_schema_version(conn)
+            applied = 0
+            for version, description, func in MIGRATIONS:
+                if version <= current or version > target:
+                    continue
+                print(f"🔧 执行迁移 {version}: {description}")
+                try:
+                    func(cursor)
+                    cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                                   (version, description))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied += 1
+            return applied
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+
+
+def connect_from_env():
+    """按 app.py 相同的环境变量连接数据库（供命令行使用）"""
+    load_dotenv()
+    return pymysql.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=int(os.getenv('DB_PORT', 3306)),
+        user=os.getenv('DB_USER', 'root'),
+        password=os.getenv('DB_PASSWORD', '123456'),
+        database=os.getenv('DB_NAME', 'pet_platform'),
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else 'migrate'
+    conn = connect_from_env()
+    try:
+        if command == 'status':
+            current = get_schema_version(conn)
+            print(f"📊 当前结构版本: {current}，最新版本: {latest_version()}")
+            for version, description, _ in MIGRATIONS:
+                mark = '✅' if version <= current else '⏳'
+                print(f"   {mark} {version}: {description}")
+            return 0
+        if command == 'migrate':
+            applied = run_migrations(conn)
+            print(f"🎉 迁移完成，本次执行 {applied} 个，当前版本: {get_schema_version(conn)}")
+            return 0
+        print(__doc__)
+        return 1
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
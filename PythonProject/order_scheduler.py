@@ -0,0 +1,236 @@
+"""
+宠物平台 - 待支付订单超时自动取消
+文件名：order_scheduler.py
+
+下单时按 创建时间 + 支付时限 登记到期时间，单个后台线程按最小堆依次处理到期订单，
+每批经订单状态机（order_state.py）的 expire 流转取消仍为 pending 的订单，订阅方（如库存回补）在同一事务中执行。
+进程启动后首次运行时从 orders 表重新加载所有待支付订单，重启不会漏掉。
+
+多进程部署时配置 leader_lock：各进程用 MySQL 命名锁（GET_LOCK）选出一个主节点，只有主节点加载与取消订单，
+其余进程的 schedule 直接忽略，避免同一订单在每个进程各执行一次取消事务。主节点借用一条连接持有命名锁，
+每 leader_check_interval 秒确认锁仍在；每 rehydrate_interval 秒重新扫描待支付订单，纳入其他进程创建的订单。
+主节点退出或连接断开时锁自动释放，其他进程在下一次检查时接手。
+"""
+
+import heapq
+import threading
+import time
+
+
+class OrderAutoCancelScheduler:
+    """
+    pool：执行取消使用的连接池
+    state_machine：订单状态机，取消经其 expire 流转执行
+    payment_window：支付时限（秒）
+    batch_size：每批最多取消的订单数
+    retry_delay：批次执行失败后重试的延迟（秒）
+    leader_lock：主节点命名锁的名称，None 表示不选主（单进程部署）
+    leader_check_interval：竞选/确认主节点的间隔（秒）
+    rehydrate_interval：主节点重新扫描待支付订单的间隔（秒）
+    """
+
+    def __init__(self, pool, state_machine, payment_window=1800, batch_size=200, retry_delay=30,
+                 leader_lock=None, leader_check_interval=10, rehydrate_interval=60):
+        self.pool = pool
+        self.state_machine = state_machine
+        self.payment_window = payment_window
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.leader_lock = leader_lock
+        self.leader_check_interval = leader_check_interval
+        self.rehydrate_interval = rehydrate_interval
+        self._leader = leader_lock is None
+        # 持有命名锁的连接
+        self._lock_conn = None
+        self._heap = []
+        # order_id -> 到期时间；支付/手动取消后移除，堆中对应条目到期时直接跳过
+        self._scheduled = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {'canceled': 0, 'skipped': 0, 'batches': 0, 'failures': 0,
+                       'rehydrated': 0, 'last_lag_seconds': 0.0, 'max_lag_seconds': 0.0}
+
+    # ---------- 登记 ----------
+
+    def schedule(self, order_id, created_at=None):
+        """登记订单的超时取消；created_at 为 datetime，缺省为当前时间。非主节点忽略（由主节点扫描到）"""
+        if not self._leader:
+            return
+        created = created_at.timestamp() if created_at is not None else time.time()
+        due = created + self.payment_window
+        with self._cond:
+            self._scheduled[order_id] = due
+            heapq.heappush(self._heap, (due, order_id))
+            if self._heap[0][1] == order_id:
+                self._cond.notify()
+
+    def discard(self, order_id):
+        """订单已支付或已取消，不再需要超时处理"""
+        with self._cond:
+            self._scheduled.pop(order_id, None)
+
+    # ---------- 后台线程 ----------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='order-auto-cancel', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        next_rehydrate = 0
+        while True:
+            if not self._hold_leadership():
+                next_rehydrate = 0
+                time.sleep(self.leader_check_interval)
+                continue
+            if time.monotonic() >= next_rehydrate:
+                try:
+                    self.rehydrate()
+                except Exception as e:
+                    print(f"⚠️  加载待支付订单失败，{self.retry_delay} 秒后重试: {e}")
+                    time.sleep(self.retry_delay)
+                    continue
+                # 不选主时只在启动时加载一次，之后的订单都经 schedule 登记
+                next_rehydrate = (time.monotonic() + self.rehydrate_interval if self.leader_lock
+                                  else float('inf'))
+            batch = self._next_batch(self.leader_check_interval if self.leader_lock else None)
+            try:
+                self._cancel_batch(batch)
+            except Exception as e:
+                self._stats['failures'] += 1
+                print(f"⚠️  自动取消订单失败，{self.retry_delay} 秒后重试: {e}")
+                retry_at = time.time() + self.retry_delay
+                with self._cond:
+                    for _, order_id in batch:
+                        if order_id in self._scheduled:
+                            self._scheduled[order_id] = retry_at
+                            heapq.heappush(self._heap, (retry_at, order_id))
+
+    def _next_batch(self, timeout=None):
+        """阻塞到有订单到期，返回最多 batch_size 个 (到期时间, 订单ID)；最多等待 timeout 秒，超时返回空列表"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                now = time.time()
+                while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+                    # 已移除或已被重新登记的过期条目
+                    heapq.heappop(self._heap)
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                if deadline is not None and now >= deadline:
+                    return []
+                wait = self._heap[0][0] - now if self._heap else None
+                if deadline is not None:
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._cond.wait(wait)
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                due, order_id = heapq.heappop(self._heap)
+                if self._scheduled.get(order_id) == due:
+                    batch.append((due, order_id))
+            return batch
+
+    def _cancel_batch(self, batch):
+        if not batch:
+            return
+        order_ids = [order_id for _, order_id in batch]
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                pending = self.state_machine.transition_many(cursor, order_ids, 'expire')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        lag = max(0.0, time.time() - min(due for due, _ in batch))
+        with self._cond:
+            for order_id in order_ids:
+                self._scheduled.pop(order_id, None)
+            self._stats['batches'] += 1
+            self._stats['canceled'] += len(pending)
+            self._stats['skipped'] += len(order_ids) - len(pending)
+            self._stats['last_lag_seconds'] = round(lag, 3)
+            self._stats['max_lag_seconds'] = round(max(self._stats['max_lag_seconds'], lag), 3)
+        if pending:
+            print(f"⏰ 已自动取消 {len(pending)} 个超时未支付订单")
+
+    # ---------- 选主 ----------
+
+    def _hold_leadership(self):
+        """竞选或确认主节点，返回本进程当前是否为主节点"""
+        if self.leader_lock is None:
+            return True
+        try:
+            if self._lock_conn is None:
+                conn = self.pool.connection()
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT GET_LOCK(%s, 0) AS locked", (self.leader_lock,))
+                    locked = (cursor.fetchone() or {}).get('locked')
+                conn.commit()
+                if not locked:
+                    conn.close()
+                    return False
+                self._lock_conn = conn
+                self._leader = True
+                print("⏰ 本进程成为订单超时取消的主节点")
+                return True
+            with self._lock_conn.cursor() as cursor:
+                cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID() AS held", (self.leader_lock,))
+                held = (cursor.fetchone() or {}).get('held')
+            self._lock_conn.commit()
+            if not held:
+                raise RuntimeError('命名锁已不在本连接上')
+            return True
+        except Exception as e:
+            if self._lock_conn is not None:
+                print(f"⚠️  订单超时取消主节点失效，停止处理: {e}")
+            self._step_down()
+            return False
+
+    def _step_down(self):
+        conn, self._lock_conn = self._lock_conn, None
+        self._leader = False
+        if conn is not None:
+            # 断开连接即释放命名锁；不放回连接池，避免锁随连接被其他借用方持有
+            conn.discard()
+        with self._cond:
+            self._heap = []
+            self._scheduled = {}
+
+    def rehydrate(self):
+        """从数据库加载所有待支付订单（含已超时的，下一轮立即取消）"""
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id, created_at FROM orders WHERE status = 'pending'")
+                rows = cursor.fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+        with self._cond:
+            for row in rows:
+                due = row['created_at'].timestamp() + self.payment_window
+                if self._scheduled.get(row['id']) is None:
+                    self._scheduled[row['id']] = due
+                    heapq.heappush(self._heap, (due, row['id']))
+            self._stats['rehydrated'] += len(rows)
+            self._cond.notify()
+        return len(rows)
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s['queue_depth'] = len(self._scheduled)
+            overdue = [due for due in self._scheduled.values() if due <= time.time()]
+            s['overdue'] = len(overdue)
+            s['oldest_overdue_seconds'] = round(time.time() - min(overdue), 3) if overdue else 0.0
+            s['running'] = self._thread is not None and self._thread.is_alive()
+            s['leader'] = self._leader
+        return s
@@ -0,0 +1,132 @@
+"""
+宠物平台 - 订单状态机
+文件名：order_state.py
+
+订单状态流转统一在这里执行：每次流转是一条带状态条件的 UPDATE（WHERE id AND user_id AND status IN 允许的源状态），
+由 rowcount 判断是否成功，不再先 SELECT 再判断，并发请求中只有一个能完成同一次流转。
+流转成功后在同一事务内通知订阅方（库存确认/回补等），订阅方的写入与状态变更一起提交或回滚。
+
+    pending --pay--> paid --confirm--> completed
+    pending/paid --cancel--> canceled
+    pending --expire--> canceled（超时未支付自动取消）
+"""
+
+
+# 动作 -> (允许的源状态, 目标状态)
+TRANSITIONS = {
+    'pay': (('pending',), 'paid'),
+    'cancel': (('pending', 'paid'), 'canceled'),
+    'confirm': (('paid',), 'completed'),
+    'expire': (('pending',), 'canceled'),
+}
+
+# 流转时允许同时更新的字段
+UPDATABLE_FIELDS = ('payment_method', 'payment_status')
+
+
+class OrderTransition:
+    """流转事件：传给订阅方"""
+    __slots__ = ('action', 'order_ids', 'from_statuses', 'to_status', 'user_id')
+
+    def __init__(self, action, order_ids, from_statuses, to_status, user_id=None):
+        self.action = action
+        self.order_ids = order_ids
+        self.from_statuses = from_statuses
+        self.to_status = to_status
+        self.user_id = user_id
+
+
+class TransitionResult:
+    """
+    流转结果：ok 为 True 表示已流转；
+    否则 reason 为 not_found（订单不存在或不属于该用户）或 invalid_state（当前状态不允许该操作），current_status 为当前状态
+    """
+    __slots__ = ('ok', 'order_id', 'reason', 'current_status')
+
+    def __init__(self, ok, order_id, reason=None, current_status=None):
+        self.ok = ok
+        self.order_id = order_id
+        self.reason = reason
+        self.current_status = current_status
+
+
+class OrderStateMachine:
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback=None, actions=None):
+        """
+        订阅流转事件：callback(cursor, transition) 在流转所在事务内调用，抛出异常会使整个事务回滚。
+        actions 为关注的动作列表，缺省关注全部；可作装饰器使用：@order_states.subscribe(actions=['cancel'])
+        """
+        def register(cb):
+            self._subscribers.append((cb, set(actions) if actions else None))
+            return cb
+        return register(callback) if callback is not None else register
+
+    def _emit(self, cursor, transition):
+        for callback, actions in self._subscribers:
+            if actions is None or transition.action in actions:
+                callback(cursor, transition)
+
+    def transition(self, cursor, order_id, action, user_id=None, **fields):
+        """对单个订单执行流转（需由调用方提交事务），返回 TransitionResult"""
+        from_statuses, to_status = TRANSITIONS[action]
+        try:
+            order_id = int(order_id)
+        except (TypeError, ValueError):
+            return TransitionResult(False, order_id, 'not_found')
+
+        unknown = set(fields) - set(UPDATABLE_FIELDS)
+        if unknown:
+            raise ValueError(f'不允许在流转中更新字段: {", ".join(sorted(unknown))}')
+        assignments = ['status = %s'] + [f'{name} = %s' for name in fields]
+        params = [to_status] + list(fields.values()) + [order_id]
+        where = 'id = %s'
+        if user_id is not None:
+            where += ' AND user_id = %s'
+            params.append(user_id)
+        params.extend(from_statuses)
+
+        cursor.execute(
+            f"UPDATE orders SET {', '.join(assignments)} "
+            f"WHERE {where} AND status IN ({', '.join(['%s'] * len(from_statuses))})",
+            params
+        )
+        if cursor.rowcount == 1:
+            self._emit(cursor, OrderTransition(action, [order_id], from_statuses, to_status, user_id))
+            return TransitionResult(True, order_id)
+
+        # 只在失败时多查一次，用于区分“不存在”与“状态不允许”
+        if user_id is not None:
+            cursor.execute("SELECT status FROM orders WHERE id = %s AND user_id = %s", (order_id, user_id))
+        else:
+            cursor.execute("SELECT status FROM orders WHERE id = %s", (order_id,))
+        row = cursor.fetchone()
+        if not row:
+            return TransitionResult(False, order_id, 'not_found')
+        return TransitionResult(False, order_id, 'invalid_state', row['status'])
+
+    def transition_many(self, cursor, order_ids, action):
+        """批量流转（后台任务使用），返回实际流转的订单 ID 列表"""
+        from_statuses, to_status = TRANSITIONS[action]
+        order_ids = list(order_ids)
+        if not order_ids:
+            return []
+        status_placeholders = ', '.join(['%s'] * len(from_statuses))
+        # 先锁住仍处于源状态的订单，得到确切的流转集合，与并发的单个流转串行
+        cursor.execute(
+            f"SELECT id FROM orders WHERE id IN ({', '.join(['%s'] * len(order_ids))}) "
+            f"AND status IN ({status_placeholders}) FOR UPDATE",
+            order_ids + list(from_statuses)
+        )
+        matched = [row['id'] for row in cursor.fetchall()]
+        if not matched:
+            return []
+        cursor.execute(
+            f"UPDATE orders SET status = %s WHERE id IN ({', '.join(['%s'] * len(matched))}) "
+            f"AND status IN ({status_placeholders})",
+            [to_status] + matched + list(from_statuses)
+        )
+        self._emit(cursor, OrderTransition(action, matched, from_statuses, to_status))
+        return matched
@@ -0,0 +1,55 @@
+"""
+宠物平台 - 游标分页
+文件名：pagination.py
+
+列表按 (created_at DESC, id DESC) 排序时，用上一页最后一条记录的 (created_at, id) 作为游标，
+下一页查询条件为 “排在它之后”，直接沿索引定位，翻到多深都不需要扫描并丢弃前面的记录（LIMIT/OFFSET 的问题）。
+游标对客户端是不透明的字符串（base64 编码的 JSON）。
+"""
+
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """游标格式错误"""
+
+
+def encode_cursor(created_at, row_id):
+    payload = json.dumps([created_at.strftime('%Y-%m-%d %H:%M:%S.%f'), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (created_at, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S.%f'), int(row_id)
+    except Exception:
+        raise InvalidCursor('无效的分页游标')
+
+
+def keyset_condition(cursor, created_column='created_at', id_column='id'):
+    """
+    生成 “排在游标之后” 的 WHERE 片段及参数，配合 ORDER BY created_column DESC, id_column DESC 使用。
+    cursor 为空时返回 (None, [])。
+    """
+    if not cursor:
+        return None, []
+    created_at, row_id = decode_cursor(cursor)
+    sql = f"({created_column} < %s OR ({created_column} = %s AND {id_column} < %s))"
+    return sql, [created_at, created_at, row_id]
+
+
+def paginate(rows, limit, created_key='created_at', id_key='id'):
+    """
+    rows 为按 LIMIT limit + 1 查回的记录：多出的一条只用于判断是否还有下一页。
+    返回 (本页记录, nextCursor)，没有下一页时 nextCursor 为 None。
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last[created_key], last[id_key])
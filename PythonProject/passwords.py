@@ -0,0 +1,178 @@
+"""
+宠物平台 - 密码哈希
+文件名：passwords.py
+
+原实现对密码做一次不加盐的 sha256，这里改为带盐、可调成本的 KDF：
+    scrypt$<n>$<r>$<p>$<salt>$<hash>                 默认（需要 OpenSSL 1.1+ 的 hashlib.scrypt）
+    pbkdf2_sha256$<iterations>$<salt>$<hash>          scrypt 不可用时或显式配置时使用
+salt 与 hash 为 Base64；每个哈希自带算法与成本参数，调高成本后旧哈希仍可验证，登录成功时按新参数重新哈希。
+64 位十六进制的旧 sha256 哈希同样可验证（needs_rehash 为真，登录时透明升级）。
+
+KDF 是刻意设计的 CPU 密集计算，PasswordHasher 把它放到有界的进程池中执行，登录高峰时不占满处理请求的线程与 GIL；
+排队超过上限时抛出 PasswordHasherBusy，由接口返回 503。
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+
+SCRYPT_AVAILABLE = hasattr(hashlib, 'scrypt')
+
+DEFAULT_ALGORITHM = os.getenv('PASSWORD_HASH_ALGORITHM') or ('scrypt' if SCRYPT_AVAILABLE else 'pbkdf2_sha256')
+# scrypt 成本：内存约 128 * n * r 字节（默认 16MB），单次约数十毫秒
+SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.getenv('PASSWORD_SCRYPT_R', 8))
+SCRYPT_P = int(os.getenv('PASSWORD_SCRYPT_P', 1))
+PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 600000))
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+_LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+class PasswordHasherBusy(Exception):
+    """哈希任务排队已满或等待超时"""
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=HASH_BYTES)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, dklen=HASH_BYTES)
+
+
+def hash_password(password, algorithm=None):
+    """按当前配置的算法与成本生成哈希（每次随机盐）"""
+    algorithm = algorithm or DEFAULT_ALGORITHM
+    salt = os.urandom(SALT_BYTES)
+    if algorithm == 'scrypt':
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}'
+    if algorithm == 'pbkdf2_sha256':
+        digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f'pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}'
+    raise ValueError(f'不支持的密码哈希算法: {algorithm}')
+
+
+def verify_password(password, stored):
+    """校验密码；stored 为空或格式无法识别时返回 False"""
+    if not stored:
+        return False
+    try:
+        if _LEGACY_SHA256.match(stored):
+            return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        parts = stored.split('$')
+        if parts[0] == 'scrypt' and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            return hmac.compare_digest(_scrypt(password, _unb64(parts[4]), n, r, p), _unb64(parts[5]))
+        if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+            return hmac.compare_digest(_pbkdf2(password, _unb64(parts[2]), int(parts[1])), _unb64(parts[3]))
+    except (ValueError, TypeError):
+        return False
+    return False
+
+
+def needs_rehash(stored):
+    """旧 sha256 哈希、非当前算法或成本低于当前配置时需要重新哈希"""
+    if not stored or _LEGACY_SHA256.match(stored):
+        return True
+    parts = stored.split('$')
+    if parts[0] != DEFAULT_ALGORITHM:
+        return True
+    try:
+        if parts[0] == 'scrypt':
+            # 逐项比较：任一参数低于当前配置即需升级（元组按字典序比较会漏掉 n 更大而 r 更小的情况）
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            return n < SCRYPT_N or r < SCRYPT_R or p < SCRYPT_P
+        if parts[0] == 'pbkdf2_sha256':
+            return int(parts[1]) < PBKDF2_ITERATIONS
+    except (ValueError, IndexError):
+        return True
+    return True
+
+
+class PasswordHasher:
+    """
+    workers：进程池大小，0 表示在调用线程内直接计算（开发环境/单测）
+    max_pending：同时排队+执行的任务上限，超过时等待 wait_timeout 秒后抛出 PasswordHasherBusy
+    进程池在首次使用时创建，使用 spawn 方式启动子进程（不从多线程的服务进程 fork）
+    """
+
+    def __init__(self, workers=2, max_pending=None, wait_timeout=5, task_timeout=10):
+        self.workers = workers
+        self.max_pending = max_pending or max(1, workers) * 8
+        self.wait_timeout = wait_timeout
+        self.task_timeout = task_timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected_busy': 0}
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+        return self._executor
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            self._stats['rejected_busy'] += 1
+            raise PasswordHasherBusy('密码校验排队已满')
+        try:
+            future = self._pool().submit(func, *args)
+        except BaseException as e:
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard_pool()
+            raise
+        # 名额在任务真正结束时归还：等待超时后任务仍在子进程中执行，不能提前放行新的任务
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.task_timeout)
+        except FutureTimeout:
+            self._stats['rejected_busy'] += 1
+            raise PasswordHasherBusy('密码校验超时')
+        except BrokenProcessPool:
+            self._discard_pool()
+            raise
+
+    def _discard_pool(self):
+        # 子进程异常退出后进程池不可再用，丢弃后下次调用重新创建
+        with self._lock:
+            self._executor = None
+
+    def hash(self, password):
+        self._stats['hashed'] += 1
+        return self._run(hash_password, password)
+
+    def verify(self, password, stored):
+        self._stats['verified'] += 1
+        if not stored:
+            return False
+        return self._run(verify_password, password, stored)
+
+    def stats(self):
+        s = dict(self._stats)
+        s['workers'] = self.workers
+        s['algorithm'] = DEFAULT_ALGORITHM
+        return s
@@ -0,0 +1,170 @@
+"""
+宠物平台 - 热点查询执行计划检查
+文件名：query_plans.py
+
+对 app.py 中的热点查询逐条执行 EXPLAIN，出现没有可用索引的全表扫描即视为失败。
+请在执行迁移并灌入示例/压测数据后运行：
+    python query_plans.py            无可用索引的全表扫描视为失败
+    python query_plans.py --strict   在足量压测数据上运行：任何全表扫描都视为失败
+"""
+
+import sys
+
+from migrations import connect_from_env
+
+
+# (名称, SQL, 示例参数)；SQL 需与 app.py 中对应处理函数的查询形状保持一致
+REGISTERED_QUERIES = [
+    ('get_cart', """
+        SELECT c.id, c.product_id, c.quantity, c.selected, p.name, p.price
+        FROM cart c
+        LEFT JOIN products p ON c.product_id = p.id
+        WHERE c.user_id = %s
+        ORDER BY c.created_at DESC
+    """, (1,)),
+    ('add_to_cart.existing', """
+        SELECT id, quantity FROM cart
+        WHERE user_id = %s AND product_id = %s
+    """, (1, 1)),
+    ('get_cart_count', """
+        SELECT COALESCE(SUM(quantity), 0) AS count
+        FROM cart WHERE user_id = %s
+    """, (1,)),
+    ('get_orders', """
+        SELECT id, order_number, total_amount, status, created_at
+        FROM orders
+        WHERE user_id = %s
+        ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s
+    """, (1, 11, 0)),
+    ('get_orders.status', """
+        SELECT id, order_number, total_amount, status, created_at
+        FROM orders
+        WHERE user_id = %s AND status = %s
+        ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s
+    """, (1, 'pending', 11, 0)),
+    ('get_orders.cursor', """
+        SELECT id, order_number, total_amount, status, created_at
+        FROM orders
+        WHERE user_id = %s AND (created_at < %s OR (created_at = %s AND id < %s))
+        ORDER BY created_at DESC, id DESC LIMIT %s
+    """, (1, '2030-01-01 00:00:00', '2030-01-01 00:00:00', 1000000, 11)),
+    ('get_feedback_list.cursor', """
+        SELECT id, type, content, contact, images, status, reply, reply_at, created_at
+        FROM feedback
+        WHERE user_id = %s AND (created_at < %s OR (created_at = %s AND id < %s))
+        ORDER BY created_at DESC, id DESC LIMIT %s
+    """, (1, '2030-01-01 00:00:00', '2030-01-01 00:00:00', 1000000, 11)),
+    ('get_orders.items', """
+        SELECT order_id, id, product_id, product_name, spec, price, quantity, image_url
+        FROM order_items
+        WHERE order_id IN (%s, %s)
+        ORDER BY order_id, id
+    """, (1, 2)),
+    ('get_notes', """
+        SELECT id, title, content, category, images, tags, created_at
+        FROM pet_notes
+        WHERE user_id = %s AND status = 1
+        ORDER BY created_at DESC
+    """, (1,)),
+    ('get_notes.category', """
+        SELECT id, title, content, category, images, tags, created_at
+        FROM pet_notes
+        WHERE user_id = %s AND status = 1 AND category = %s
+        ORDER BY created_at DESC
+    """, (1, 'daily')),
+    ('get_addresses', """
+        SELECT id, name, phone, province, city, district, detail, is_default
+        FROM addresses
+        WHERE user_id = %s AND status = 1
+        ORDER BY is_default DESC, created_at DESC
+    """, (1,)),
+    ('get_favorites', """
+        SELECT f.id, f.product_id, f.created_at, p.name, p.price
+        FROM favorites f
+        LEFT JOIN products p ON f.product_id = p.id
+        WHERE f.user_id = %s
+        ORDER BY f.created_at DESC
+    """, (1,)),
+    ('add_favorite.existing', """
+        SELECT id FROM favorites
+        WHERE user_id = %s AND product_id = %s
+    """, (1, 1)),
+    ('get_products.category', """
+        SELECT p.*, pc.icon as categoryIcon FROM products p
+        LEFT JOIN pet_categories pc ON p.category = pc.name
+        WHERE p.status = 1 AND p.category = %s
+        ORDER BY p.sales DESC
+        LIMIT %s OFFSET %s
+    """, ('狗粮', 20, 0)),
+    ('catalog.incremental', """
+        SELECT p.*, pc.icon AS categoryIcon
+        FROM products p
+        LEFT JOIN pet_categories pc ON p.category = pc.name
+        WHERE p.updated_at >= %s ORDER BY p.updated_at
+    """, ('2030-01-01 00:00:00',)),
+    ('note_search.incremental', """
+        SELECT id, user_id, title, content, category, images, tags, status, created_at, updated_at
+        FROM pet_notes
+        WHERE updated_at >= %s ORDER BY updated_at
+    """, ('2030-01-01 00:00:00',)),
+    ('order_scheduler.rehydrate', """
+        SELECT id, created_at FROM orders WHERE status = 'pending'
+    """, ()),
+    ('get_products', """
+        SELECT p.*, pc.icon as categoryIcon FROM products p
+        LEFT JOIN pet_categories pc ON p.category = pc.name
+        WHERE p.status = 1
+        ORDER BY p.sales DESC
+        LIMIT %s OFFSET %s
+    """, (20, 0)),
+]
+
+
+def explain(cursor, sql, params):
+    cursor.execute("EXPLAIN " + sql, params)
+    return cursor.fetchall()
+
+
+def check_query_plans(conn, queries=None):
+    """
+    返回 (failures, warnings)：
+    - failures：全表扫描且没有任何可用索引（possible_keys 为空），说明缺索引
+    - warnings：存在可用索引但优化器仍选择了全表扫描，通常是表数据太少，灌入更多数据后复查
+    """
+    failures, warnings = [], []
+    with conn.cursor() as cursor:
+        for name, sql, params in (queries or REGISTERED_QUERIES):
+            for row in explain(cursor, sql, params):
+                if row.get('type') != 'ALL':
+                    continue
+                item = (name, row.get('table'), row.get('rows'))
+                if row.get('possible_keys'):
+                    warnings.append(item)
+                else:
+                    failures.append(item)
+    return failures, warnings
+
+
+def main(argv):
+    strict = '--strict' in argv[1:]
+    conn = connect_from_env()
+    try:
+        failures, warnings = check_query_plans(conn)
+    finally:
+        conn.close()
+
+    if strict:
+        failures, warnings = failures + warnings, []
+    for name, table, rows in warnings:
+        print(f"⚠️  {name}: 表 {table} 有可用索引但走了全表扫描（约 {rows} 行），数据量过小时可忽略")
+    for name, table, rows in failures:
+        print(f"❌ {name}: 表 {table} 全表扫描且无可用索引（约 {rows} 行）")
+    if failures:
+        print(f"❌ {len(failures)} 条查询缺少索引")
+        return 1
+    print(f"✅ {len(REGISTERED_QUERIES)} 条热点查询均命中索引")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,35 @@
+"""
+宠物平台 - refresh token 一次性使用
+文件名：refresh_tokens.py
+
+refresh token 有效期长（JWT_EXPIRE_DAYS），只靠用户代数吊销时，泄露的 refresh token 在退出登录前可以无限次换新。
+这里让每个 refresh token 只能使用一次：签发时生成随机 jti 写入 refresh_tokens 表（迁移 13），
+刷新时在同一事务中删除旧 jti 并登记新 jti，删除影响 0 行（已使用过或不存在）即为重放，拒绝。
+每个设备的 refresh token 各有 jti，一台设备刷新不影响其他设备；退出登录/修改密码仍通过代数使全部 token 失效。
+所有函数接收调用方的 cursor，与签发/刷新的其他写入在同一事务中提交。
+"""
+
+import secrets
+
+
+def new_jti():
+    return secrets.token_hex(16)
+
+
+def register(cursor, user_id, jti, expires_at):
+    """登记新签发的 refresh token（expires_at 为 UTC 时间），顺带清理该用户已过期的记录"""
+    cursor.execute("DELETE FROM refresh_tokens WHERE user_id = %s AND expires_at < UTC_TIMESTAMP()", (user_id,))
+    cursor.execute("INSERT INTO refresh_tokens (jti, user_id, expires_at) VALUES (%s, %s, %s)",
+                   (jti, user_id, expires_at))
+
+
+def consume(cursor, user_id, jti):
+    """使用 refresh token：记录存在则删除并返回 True；已被使用过（重放）或不存在时返回 False"""
+    if not jti:
+        return False
+    return cursor.execute("DELETE FROM refresh_tokens WHERE jti = %s AND user_id = %s", (jti, user_id)) == 1
+
+
+def revoke_user(cursor, user_id):
+    """删除用户全部 refresh token（退出登录、修改密码）"""
+    cursor.execute("DELETE FROM refresh_tokens WHERE user_id = %s", (user_id,))
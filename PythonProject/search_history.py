@@ -0,0 +1,186 @@
+"""
+宠物平台 - 搜索历史批量写入
+文件名：search_history.py
+
+统一搜索原来每次请求都同步 INSERT 一行并提交，表无限增长，也没有做承诺的去重。这里改为写后缓冲（write-behind）：
+- 请求只把 (user_id, keyword) 记进内存，同一用户同一关键词在两次刷新之间合并为一条（次数累加、时间取最近）
+- 后台线程每 flush_interval 秒用一条多行 INSERT ... ON DUPLICATE KEY UPDATE 批量写入
+  （依赖迁移 9 的 UNIQUE(user_id, keyword)），并把本批涉及的用户裁剪到最近 keep_per_user 条
+- 写入失败时把本批并回缓冲，下次重试；进程异常退出会丢失最多一个刷新间隔的记录（搜索历史可接受）
+"""
+
+import threading
+from datetime import datetime
+
+
+class SearchHistoryBuffer:
+    """
+    pool：写入使用的（主库）连接池
+    flush_interval：刷新间隔（秒）；缓冲条数达到 batch_size 时提前刷新
+    keep_per_user：每个用户保留的历史条数
+    max_pending：缓冲上限，超过时丢弃新记录（数据库长时间不可用时保护内存）
+    """
+
+    UPSERT_SQL = """
+        INSERT INTO search_history (user_id, keyword, search_count, created_at)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE
+            search_count = search_count + VALUES(search_count),
+            created_at = GREATEST(created_at, VALUES(created_at))
+    """
+
+    TRIM_SQL = """
+        DELETE h FROM search_history h
+        JOIN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC, id DESC) AS rn
+                FROM search_history
+                WHERE user_id IN ({users})
+            ) ranked
+            WHERE rn > %s
+        ) stale ON h.id = stale.id
+    """
+
+    def __init__(self, pool, flush_interval=2, batch_size=500, keep_per_user=50, max_pending=100000):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.keep_per_user = keep_per_user
+        self.max_pending = max_pending
+        # user_id -> {keyword: [次数, 最近搜索时间]}
+        self._pending = {}
+        self._pending_count = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stats = {'recorded': 0, 'coalesced': 0, 'dropped': 0, 'flushes': 0,
+                       'rows_written': 0, 'rows_trimmed': 0, 'errors': 0}
+
+    def record(self, user_id, keyword, searched_at=None):
+        keyword = (keyword or '').strip()[:100]
+        if not keyword:
+            return
+        searched_at = searched_at or datetime.now()
+        with self._cond:
+            keywords = self._pending.setdefault(user_id, {})
+            entry = keywords.get(keyword)
+            if entry is not None:
+                entry[0] += 1
+                entry[1] = max(entry[1], searched_at)
+                self._stats['coalesced'] += 1
+            elif self._pending_count >= self.max_pending:
+                self._stats['dropped'] += 1
+                return
+            else:
+                keywords[keyword] = [1, searched_at]
+                self._pending_count += 1
+            self._stats['recorded'] += 1
+            if self._pending_count >= self.batch_size:
+                self._cond.notify()
+
+    def pending_for(self, user_id):
+        """该用户尚未落库的记录：[(keyword, 最近搜索时间)]，新的在前"""
+        with self._cond:
+            keywords = self._pending.get(user_id) or {}
+            items = [(keyword, entry[1]) for keyword, entry in keywords.items()]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return items
+
+    def discard_user(self, user_id):
+        """清空历史时丢弃该用户尚未落库的记录"""
+        with self._cond:
+            keywords = self._pending.pop(user_id, None)
+            if keywords:
+                self._pending_count -= len(keywords)
+
+    def clear_user(self, user_id, delete):
+        """
+        清空用户历史：丢弃尚未落库的记录并调用 delete() 删除库中的记录。
+        与 flush 互斥，避免刷新线程已取走、尚未写入的记录在删除之后落库
+        """
+        with self._flush_lock:
+            self.discard_user(user_id)
+            delete()
+
+    def flush(self):
+        """把当前缓冲写入数据库，返回写入的条数"""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending, self._pending_count = self._pending, {}, 0
+            rows = [(user_id, keyword, entry[0], entry[1])
+                    for user_id, keywords in batch.items() for keyword, entry in keywords.items()]
+            if not rows:
+                return 0
+            try:
+                trimmed = self._write(rows, list(batch))
+            except Exception:
+                self._requeue(batch)
+                raise
+            self._stats['flushes'] += 1
+            self._stats['rows_written'] += len(rows)
+            self._stats['rows_trimmed'] += trimmed
+            return len(rows)
+
+    def _write(self, rows, user_ids):
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                for i in range(0, len(rows), self.batch_size):
+                    chunk = rows[i:i + self.batch_size]
+                    sql = self.UPSERT_SQL.format(values=', '.join(['(%s, %s, %s, %s)'] * len(chunk)))
+                    cursor.execute(sql, [value for row in chunk for value in row])
+                trimmed = 0
+                for i in range(0, len(user_ids), self.batch_size):
+                    chunk = user_ids[i:i + self.batch_size]
+                    trimmed += cursor.execute(self.TRIM_SQL.format(users=', '.join(['%s'] * len(chunk))),
+                                              chunk + [self.keep_per_user])
+            conn.commit()
+            return trimmed
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _requeue(self, batch):
+        with self._cond:
+            for user_id, keywords in batch.items():
+                pending = self._pending.setdefault(user_id, {})
+                for keyword, (count, searched_at) in keywords.items():
+                    entry = pending.get(keyword)
+                    if entry is not None:
+                        entry[0] += count
+                        entry[1] = max(entry[1], searched_at)
+                    elif self._pending_count < self.max_pending:
+                        pending[keyword] = [count, searched_at]
+                        self._pending_count += 1
+                    else:
+                        self._stats['dropped'] += 1
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='search-history-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._pending_count < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"⚠️  搜索历史写入失败，稍后重试: {e}")
+                with self._cond:
+                    self._cond.wait(self.flush_interval)
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s['pending'] = self._pending_count
+        return s
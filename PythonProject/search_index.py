@@ -0,0 +1,333 @@
+"""
+宠物平台 - 商品/笔记倒排索引
+文件名：search_index.py
+
+替代 LIKE '%关键词%' 全表扫描：
+- 分词：中文按字切分为单字 + 相邻二元组（bigram），英文/数字按连续的词切分，统一转小写
+- 检索：由关键词的词项求倒排表交集得到候选，再逐条做子串校验，结果集与 LIKE '%kw%' 一致
+- 排序：调用方按 完全匹配 > 前缀匹配 > 包含 分档，档内按 BM25 相关度，再按销量/时间
+索引常驻内存，商品随商品目录（catalog.py）的变更增量更新，笔记按 pet_notes.updated_at 水位增量拉取；
+索引就绪前调用方仍走 SQL。
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _is_cjk(ch):
+    return '一' <= ch <= '鿿' or '㐀' <= ch <= '䶿' or '豈' <= ch <= '﫿'
+
+
+def _runs(text):
+    """把文本切成 (类型, 片段)：cjk 为连续汉字，word 为连续字母数字，其余字符作为分隔"""
+    runs, buf, kind = [], [], None
+    for ch in text:
+        k = 'cjk' if _is_cjk(ch) else ('word' if ch.isalnum() else None)
+        if k != kind and buf:
+            runs.append((kind, ''.join(buf)))
+            buf = []
+        kind = k
+        if k is not None:
+            buf.append(ch)
+    if buf:
+        runs.append((kind, ''.join(buf)))
+    return runs
+
+
+def tokenize(text):
+    """文档分词，返回词项列表（可重复，用于词频）"""
+    terms = []
+    for kind, run in _runs((text or '').lower()):
+        if kind == 'cjk':
+            terms.extend(run)
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
+
+
+def query_terms(keyword):
+    """
+    关键词分解为检索条件：('term', 词项) 必须出现在文档中；('fragment', 片段) 为英文/数字片段，
+    文档中需存在包含该片段的词（对应 LIKE 的子串语义，如 "og" 可命中 "dog"）
+    """
+    conditions = []
+    for kind, run in _runs((keyword or '').lower()):
+        if kind == 'cjk':
+            if len(run) == 1:
+                conditions.append(('term', run))
+            else:
+                conditions.extend(('term', run[i:i + 2]) for i in range(len(run) - 1))
+        else:
+            conditions.append(('fragment', run))
+    return list(dict.fromkeys(conditions))
+
+
+class _Doc:
+    __slots__ = ('texts', 'length', 'scope', 'terms')
+
+    def __init__(self, texts, length, scope, terms):
+        self.texts = texts
+        self.length = length
+        self.scope = scope
+        self.terms = terms
+
+
+class InvertedIndex:
+    """
+    fields：{字段名: 权重}，BM25 词频按字段权重累加
+    scope：文档的归属范围（如笔记的 user_id），检索时可限定
+    """
+
+    def __init__(self, fields):
+        self.fields = dict(fields)
+        self._docs = {}
+        self._postings = {}
+        # 英文/数字词项单独记录，片段检索时只需扫描这部分词表
+        self._word_terms = set()
+        self._total_length = 0
+        self._lock = threading.RLock()
+        self.ready = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id, texts, scope=None):
+        """新增或替换文档；texts 为 {字段名: 文本}"""
+        with self._lock:
+            self._remove(doc_id)
+            lowered = {field: (texts.get(field) or '').lower() for field in self.fields}
+            tf = {}
+            length = 0
+            for field, weight in self.fields.items():
+                terms = tokenize(lowered[field])
+                length += len(terms)
+                for term in terms:
+                    tf[term] = tf.get(term, 0) + weight
+            for term, freq in tf.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    if not _is_cjk(term[0]):
+                        self._word_terms.add(term)
+                postings[doc_id] = freq
+            self._docs[doc_id] = _Doc(lowered, length, scope, tuple(tf))
+            self._total_length += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc.length
+        for term in doc.terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                self._word_terms.discard(term)
+
+    def search(self, keyword, scope=None):
+        """
+        返回 [(doc_id, bm25 分数)]：任一字段包含 keyword（不区分大小写）的文档，顺序不定。
+        scope 不为 None 时只返回该范围的文档。
+        """
+        needle = (keyword or '').lower()
+        if not needle:
+            return []
+        with self._lock:
+            term_postings = []
+            for kind, value in query_terms(needle):
+                if kind == 'term':
+                    term_postings.append([value])
+                else:
+                    term_postings.append([t for t in self._word_terms if value in t])
+
+            if term_postings:
+                candidate_sets = []
+                for terms in term_postings:
+                    ids = set()
+                    for term in terms:
+                        ids.update(self._postings.get(term, ()))
+                    candidate_sets.append(ids)
+                candidate_sets.sort(key=len)
+                candidates = candidate_sets[0].intersection(*candidate_sets[1:])
+            else:
+                # 关键词只含标点等未索引字符：退化为逐条校验
+                candidates = set(self._docs)
+
+            n = len(self._docs) or 1
+            avg_length = (self._total_length / n) or 1
+            idf = {}
+            for terms in term_postings:
+                for term in terms:
+                    df = len(self._postings.get(term, ()))
+                    idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+            results = []
+            for doc_id in candidates:
+                doc = self._docs[doc_id]
+                if scope is not None and doc.scope != scope:
+                    continue
+                if not any(needle in text for text in doc.texts.values()):
+                    continue
+                score = 0.0
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc.length / avg_length)
+                for term, weight in idf.items():
+                    freq = self._postings[term].get(doc_id) if term in self._postings else None
+                    if freq:
+                        score += weight * freq * (BM25_K1 + 1) / (freq + norm)
+                results.append((doc_id, score))
+            return results
+
+    def match_tier(self, doc_id, field, keyword, contains=None):
+        """
+        完全匹配 0 / 前缀匹配 1 / 其他 2，对应原 SQL 的 (f = kw) DESC, (f LIKE 'kw%') DESC；
+        给出 contains（字段名列表）时，这些字段都不包含关键词的文档为 3，对应 (f1 LIKE '%kw%' OR ...) DESC
+        """
+        texts = self._docs[doc_id].texts
+        text = texts[field]
+        needle = (keyword or '').lower()
+        if text == needle:
+            return 0
+        if text.startswith(needle):
+            return 1
+        if contains and not any(needle in texts[f] for f in contains):
+            return 3
+        return 2
+
+    def stats(self):
+        with self._lock:
+            return {'ready': self.ready, 'docs': len(self._docs), 'terms': len(self._postings)}
+
+
+class ProductSearchIndex:
+    """
+    商品索引：订阅商品目录的变更（ProductCatalog.subscribe(index.apply)），只收录在售商品；
+    名称、描述与上架状态均未变化的记录（如仅库存/销量变化）不重建倒排表。
+    """
+
+    FIELDS = {'name': 3.0, 'description': 1.0}
+
+    def __init__(self):
+        self.index = InvertedIndex(self.FIELDS)
+
+    @property
+    def ready(self):
+        return self.index.ready
+
+    def apply(self, changes):
+        for old, new in changes:
+            if new is None or new.status != 1:
+                if old is not None:
+                    self.index.remove(old.id)
+                continue
+            if (old is not None and old.status == 1 and old.name == new.name
+                    and old.description == new.description):
+                continue
+            self.index.add(new.id, {'name': new.name, 'description': new.description})
+        self.index.ready = True
+
+    def stats(self):
+        return self.index.stats()
+
+
+class NoteSearchIndex:
+    """
+    笔记索引：首次全量加载在售笔记（status = 1），之后按 pet_notes.updated_at 水位增量拉取；
+    新增/删除笔记的接口在提交后直接调用 upsert/remove，使本进程的变更立即可搜。
+    """
+
+    FIELDS = {'title': 3.0, 'content': 1.0, 'tags': 1.0}
+    LOAD_SQL = """
+        SELECT id, user_id, title, content, category, images, tags, status, created_at, updated_at
+        FROM pet_notes
+    """
+
+    def __init__(self, pool, poll_interval=5, lookback_seconds=5):
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.lookback_seconds = lookback_seconds
+        self.index = InvertedIndex(self.FIELDS)
+        self._notes = {}
+        self._watermark = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'refreshes': 0, 'rows_applied': 0, 'errors': 0}
+
+    @property
+    def ready(self):
+        return self.index.ready
+
+    def get(self, note_id):
+        return self._notes.get(note_id)
+
+    def upsert(self, row):
+        """row 需包含 LOAD_SQL 中的字段；非在售状态等同删除"""
+        if row.get('status') != 1:
+            self.remove(row['id'])
+            return
+        self._notes[row['id']] = row
+        self.index.add(row['id'], {f: row.get(f) for f in self.FIELDS}, scope=row['user_id'])
+
+    def remove(self, note_id):
+        self._notes.pop(note_id, None)
+        self.index.remove(note_id)
+
+    def refresh(self):
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                if self._watermark is None:
+                    cursor.execute(self.LOAD_SQL + " WHERE status = 1")
+                else:
+                    since = self._watermark - timedelta(seconds=self.lookback_seconds)
+                    cursor.execute(self.LOAD_SQL + " WHERE updated_at >= %s ORDER BY updated_at", (since,))
+                rows = cursor.fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+        watermark = self._watermark or datetime(1970, 1, 2)
+        for row in rows:
+            self.upsert(row)
+            if row.get('updated_at') and row['updated_at'] > watermark:
+                watermark = row['updated_at']
+        self._watermark = watermark
+        self.index.ready = True
+        self._stats['refreshes'] += 1
+        self._stats['rows_applied'] += len(rows)
+        return len(rows)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='note-search-index', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"⚠️  笔记索引刷新失败: {e}")
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        s = dict(self._stats)
+        s.update(self.index.stats())
+        return s
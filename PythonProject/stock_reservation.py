@@ -0,0 +1,279 @@
+"""
+宠物平台 - 库存预占
+文件名：stock_reservation.py
+
+下单时按订单行条件扣减 products.stock（stock >= 数量才扣），并写入 stock_reservations 预占记录；
+取消订单或超时未支付时释放预占、回补库存，支付后预占转为确认。
+
+热门商品（hot SKU）模式：秒杀时大量订单同时扣同一行库存，行锁会在订单事务里排成长队。
+热门商品的扣减改为投递到该商品的进程内队列，由专门的线程合并成短事务执行，不再占用订单事务的行锁。
+"""
+
+import queue
+import threading
+from datetime import datetime, timedelta
+
+
+class StockReservationError(Exception):
+    """库存不足"""
+
+    def __init__(self, product_id, message='库存不足'):
+        super().__init__(message)
+        self.product_id = product_id
+
+
+def _case_by_id(lines):
+    """生成 CASE id WHEN .. THEN .. END 片段及参数"""
+    sql = 'CASE id ' + ' '.join(['WHEN %s THEN %s'] * len(lines)) + ' END'
+    params = []
+    for product_id, quantity in lines.items():
+        params.extend([product_id, quantity])
+    return sql, params
+
+
+class _HotSkuRequest:
+    __slots__ = ('quantity', 'done', 'ok', 'state')
+
+    PENDING, CLAIMED, CANCELLED = 'pending', 'claimed', 'cancelled'
+
+    def __init__(self, quantity):
+        self.quantity = quantity
+        self.done = threading.Event()
+        self.ok = False
+        self.state = self.PENDING
+
+
+class _HotSkuQueue:
+    """单个热门商品的扣减队列：一个线程按到达顺序处理，库存充足时把一批请求合并成一条 UPDATE"""
+
+    def __init__(self, product_id, pool, batch_size=64):
+        self.product_id = product_id
+        self.pool = pool
+        self.batch_size = batch_size
+        self.requests = queue.Queue()
+        self.processed = 0
+        self.batches = 0
+        self.cancelled = 0
+        # 保护请求状态：worker 认领与调用方超时取消互斥，已取消的请求不会再扣库存
+        self._state_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name=f'hot-sku-{product_id}', daemon=True)
+        self.thread.start()
+
+    def submit(self, quantity, timeout):
+        """
+        排队扣减，返回是否扣减成功。排队超过 timeout 仍未被处理时取消该请求并抛出 StockReservationError；
+        已被 worker 认领（正在执行 UPDATE）的请求等待其结果，保证返回值与实际扣减一致。
+        """
+        req = _HotSkuRequest(quantity)
+        self.requests.put(req)
+        if not req.done.wait(timeout):
+            with self._state_lock:
+                cancelled = req.state == req.PENDING
+                if cancelled:
+                    req.state = req.CANCELLED
+                    self.cancelled += 1
+            if cancelled:
+                raise StockReservationError(self.product_id, '抢购排队超时')
+            req.done.wait()
+        return req.ok
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            with self._state_lock:
+                live = [req for req in batch if req.state == req.PENDING]
+                for req in live:
+                    req.state = req.CLAIMED
+            try:
+                if live:
+                    self._apply(live)
+            except Exception as e:
+                print(f"⚠️  热门商品 {self.product_id} 扣减失败: {e}")
+            finally:
+                for req in batch:
+                    req.done.set()
+                self.processed += len(batch)
+                self.batches += 1
+
+    def _apply(self, batch):
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                total = sum(r.quantity for r in batch)
+                cursor.execute("UPDATE products SET stock = stock - %s WHERE id = %s AND stock >= %s",
+                               (total, self.product_id, total))
+                if cursor.rowcount == 1:
+                    for req in batch:
+                        req.ok = True
+                else:
+                    # 库存不够整批扣减：按到达顺序逐个尝试，先到先得
+                    for req in batch:
+                        cursor.execute("UPDATE products SET stock = stock - %s WHERE id = %s AND stock >= %s",
+                                       (req.quantity, self.product_id, req.quantity))
+                        req.ok = cursor.rowcount == 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            for req in batch:
+                req.ok = False
+            raise
+        finally:
+            conn.close()
+
+
+class StockReservations:
+    """
+    库存预占服务。
+    pool：热门商品队列与补偿回补使用的连接池（独立于订单事务的短事务）
+    hold_seconds：预占保留时长，与订单支付时限一致，超时未支付的订单取消时释放
+    """
+
+    def __init__(self, pool, hold_seconds=1800, hot_product_ids=(), hot_queue_timeout=3.0):
+        self.pool = pool
+        self.hold_seconds = hold_seconds
+        self.hot_queue_timeout = hot_queue_timeout
+        self._hot_ids = set(hot_product_ids)
+        self._hot_queues = {}
+        self._lock = threading.Lock()
+
+    # ---------- 热门商品 ----------
+
+    def set_hot(self, product_id, hot=True):
+        with self._lock:
+            if hot:
+                self._hot_ids.add(product_id)
+            else:
+                self._hot_ids.discard(product_id)
+
+    def is_hot(self, product_id):
+        return product_id in self._hot_ids
+
+    def _hot_queue(self, product_id):
+        with self._lock:
+            q = self._hot_queues.get(product_id)
+            if q is None:
+                q = self._hot_queues[product_id] = _HotSkuQueue(product_id, self.pool)
+            return q
+
+    # ---------- 预占 / 释放 ----------
+
+    def reserve(self, cursor, order_id, lines):
+        """
+        在订单事务内预占库存，lines 为 {商品ID: 数量}。
+        普通商品用一条条件 UPDATE 批量扣减，随订单事务提交或回滚；
+        热门商品经队列在独立事务中扣减，返回值为已扣减的热门商品明细，
+        订单事务失败时调用方必须把它交给 compensate() 回补。
+        库存不足或热门商品排队超时时抛出 StockReservationError（已扣减的热门商品会先自动回补）。
+        """
+        lines = {int(pid): int(qty) for pid, qty in lines.items() if int(qty) > 0}
+        normal = {pid: qty for pid, qty in lines.items() if not self.is_hot(pid)}
+        hot = {pid: qty for pid, qty in lines.items() if self.is_hot(pid)}
+
+        if normal:
+            case_sql, case_params = _case_by_id(normal)
+            ids = list(normal)
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(
+                f"UPDATE products SET stock = stock - {case_sql} "
+                f"WHERE id IN ({placeholders}) AND stock >= {case_sql}",
+                case_params + ids + case_params
+            )
+            if cursor.rowcount != len(normal):
+                cursor.execute(f"SELECT id, stock FROM products WHERE id IN ({placeholders})", ids)
+                stock = {row['id']: row['stock'] for row in cursor.fetchall()}
+                short = next((pid for pid in ids if (stock.get(pid) or 0) < normal[pid]), ids[0])
+                raise StockReservationError(short)
+
+        taken = {}
+        for pid in sorted(hot):
+            try:
+                ok = self._hot_queue(pid).submit(hot[pid], self.hot_queue_timeout)
+            except Exception:
+                self.compensate(taken)
+                raise
+            if not ok:
+                self.compensate(taken)
+                raise StockReservationError(pid)
+            taken[pid] = hot[pid]
+
+        expires_at = datetime.now() + timedelta(seconds=self.hold_seconds)
+        cursor.executemany("""
+            INSERT INTO stock_reservations (order_id, product_id, quantity, status, expires_at)
+            VALUES (%s, %s, %s, 'reserved', %s)
+        """, [(order_id, pid, qty, expires_at) for pid, qty in lines.items()])
+        return taken
+
+    def compensate(self, taken):
+        """订单事务回滚后，回补已在独立事务中扣减的热门商品库存"""
+        if not taken:
+            return
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                case_sql, case_params = _case_by_id(taken)
+                ids = list(taken)
+                cursor.execute(
+                    f"UPDATE products SET stock = stock + {case_sql} "
+                    f"WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                    case_params + ids
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def release(self, cursor, order_ids):
+        """在调用方事务内释放订单的预占（含已支付确认的）并回补库存，返回回补的商品数量明细；重复释放无副作用"""
+        order_ids = list(order_ids)
+        if not order_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(order_ids))
+        # 先锁住预占行，并发的取消/过期清理只会有一方真正回补
+        cursor.execute(f"""
+            SELECT id, product_id, quantity FROM stock_reservations
+            WHERE order_id IN ({placeholders}) AND status IN ('reserved', 'confirmed')
+            FOR UPDATE
+        """, order_ids)
+        rows = cursor.fetchall()
+        if not rows:
+            return {}
+        restock = {}
+        for row in rows:
+            restock[row['product_id']] = restock.get(row['product_id'], 0) + row['quantity']
+        reservation_ids = [row['id'] for row in rows]
+        cursor.execute(
+            f"UPDATE stock_reservations SET status = 'released' "
+            f"WHERE id IN ({', '.join(['%s'] * len(reservation_ids))})",
+            reservation_ids
+        )
+        case_sql, case_params = _case_by_id(restock)
+        ids = sorted(restock)
+        cursor.execute(
+            f"UPDATE products SET stock = stock + {case_sql} "
+            f"WHERE id IN ({', '.join(['%s'] * len(ids))})",
+            case_params + ids
+        )
+        return restock
+
+    def confirm(self, cursor, order_ids):
+        """订单支付后预占转为确认，不再参与过期释放"""
+        order_ids = list(order_ids)
+        if not order_ids:
+            return 0
+        cursor.execute(
+            f"UPDATE stock_reservations SET status = 'confirmed' "
+            f"WHERE order_id IN ({', '.join(['%s'] * len(order_ids))}) AND status = 'reserved'",
+            order_ids
+        )
+        return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            queues = {pid: {'pending': q.requests.qsize(), 'processed': q.processed, 'batches': q.batches,
+                            'cancelled': q.cancelled}
+                      for pid, q in self._hot_queues.items()}
+        return {'hot_products': sorted(self._hot_ids), 'hot_queues': queues}
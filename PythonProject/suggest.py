@@ -0,0 +1,427 @@
+"""
+宠物平台 - 搜索联想
+文件名：suggest.py
+
+搜索页每次输入变化都会请求 /api/search/suggest，原实现每次执行最多三条 LIKE 查询。这里改为常驻内存：
+- CompletionTrie：压缩前缀树（相同前缀的单字链合并为一条边），每个节点缓存子树内权重最高的 top_k 个词，
+  查询只需沿输入走到对应节点直接返回，与词库大小无关；增删词时只把变化的词合并进路径上各节点的 top，
+  只有 top 已满且其中的词被删除/降权时才扫描子节点重算
+- SuggestEngine：商品名（权重为销量，随商品目录变更更新）与热门搜索词（权重为搜索次数）两棵前缀树；
+  大批量变更（首次加载、全量重载）在锁外构建新树后整体替换
+- RecentQueries：按用户的最近搜索记录 LRU，未命中时由调用方从库中加载一次（搜索历史列表与联想共用）
+"""
+
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+
+# 每个文本最多登记的后缀数：除整句外，从每个词首与每个汉字处开始的后缀也能被前缀命中（如“狗粮”可联想出“皇家狗粮”）
+MAX_KEYS_PER_TEXT = 12
+
+
+def _is_cjk(ch):
+    return '一' <= ch <= '鿿' or '㐀' <= ch <= '䶿' or '豈' <= ch <= '﫿'
+
+
+def completion_keys(text):
+    """文本登记到前缀树的键：规范化（小写、去首尾空白）后的整句，以及从词首/汉字处开始的后缀"""
+    key = (text or '').strip().lower()
+    if not key:
+        return []
+    keys = [key]
+    for i in range(1, len(key)):
+        ch, prev = key[i], key[i - 1]
+        if ch.isspace():
+            continue
+        if _is_cjk(ch) or not prev.isalnum() or _is_cjk(prev):
+            keys.append(key[i:])
+            if len(keys) >= MAX_KEYS_PER_TEXT:
+                break
+    return keys
+
+
+class _Node:
+    __slots__ = ('children', 'entries', 'top')
+
+    def __init__(self):
+        # 首字符 -> [边标签, 子节点]
+        self.children = {}
+        # 以此节点结尾的键对应的 {文本: 权重}
+        self.entries = None
+        # 子树内权重最高的 top_k 个 (权重, 文本)，按权重降序
+        self.top = []
+
+
+class CompletionTrie:
+    """
+    set(text, weight) 新增或更新（weight 为 None 时删除），complete(prefix, limit) 返回按权重降序的文本。
+    非线程安全，由 SuggestEngine 加锁。
+    """
+
+    def __init__(self, top_k=20):
+        self.top_k = top_k
+        self._root = _Node()
+        self._weights = {}
+
+    def __len__(self):
+        return len(self._weights)
+
+    def set(self, text, weight):
+        if weight is None:
+            if self._weights.pop(text, None) is None:
+                return
+        else:
+            if self._weights.get(text) == weight:
+                return
+            self._weights[text] = weight
+        for key in completion_keys(text):
+            path = self._path(key, create=weight is not None)
+            if path is None:
+                continue
+            node = path[-1]
+            if weight is None:
+                if node.entries:
+                    node.entries.pop(text, None)
+            else:
+                if node.entries is None:
+                    node.entries = {}
+                node.entries[text] = weight
+            for n in reversed(path):
+                self._update_top(n, text, weight)
+            if weight is None:
+                self._prune(key)
+
+    def complete(self, prefix, limit=10):
+        node = self._find((prefix or '').strip().lower())
+        if node is None:
+            return []
+        return [text for _, text in node.top[:limit]]
+
+    def _path(self, key, create):
+        """返回从根到键所在节点的节点列表；create 时按需插入/分裂边"""
+        node, path, i = self._root, [self._root], 0
+        while i < len(key):
+            edge = node.children.get(key[i])
+            if edge is None:
+                if not create:
+                    return None
+                child = _Node()
+                node.children[key[i]] = [key[i:], child]
+                path.append(child)
+                return path
+            label, child = edge
+            common = 0
+            limit = min(len(label), len(key) - i)
+            while common < limit and label[common] == key[i + common]:
+                common += 1
+            if common < len(label):
+                if not create:
+                    return None
+                # 分裂：原边拆成 label[:common] -> mid -> label[common:]
+                mid = _Node()
+                mid.children[label[common]] = [label[common:], child]
+                mid.top = list(child.top)
+                edge[0], edge[1] = label[:common], mid
+                child = mid
+            node = child
+            path.append(node)
+            i += common
+        return path
+
+    def _find(self, prefix):
+        node, i = self._root, 0
+        while i < len(prefix):
+            edge = node.children.get(prefix[i])
+            if edge is None:
+                return None
+            label, child = edge
+            rest = prefix[i:i + len(label)]
+            if not label.startswith(rest):
+                return None
+            node = child
+            i += len(label)
+        return node
+
+    def _update_top(self, node, text, weight):
+        """把 text 的新权重（None 为删除）合并进 node.top；top 已满且 text 被删除/降权时，未入选的词可能补上，需重算"""
+        top = node.top
+        full = len(top) >= self.top_k
+        index = next((i for i, entry in enumerate(top) if entry[1] == text), None)
+        if index is not None:
+            if top[index][0] == weight:
+                return
+            if full and (weight is None or weight < top[index][0]):
+                self._recompute(node)
+                return
+            del top[index]
+        if weight is None:
+            return
+        if full and index is None and (weight, text) <= top[-1]:
+            return
+        top.append((weight, text))
+        top.sort(reverse=True)
+        del top[self.top_k:]
+
+    def _recompute(self, node):
+        best = {}
+        if node.entries:
+            best.update(node.entries)
+        for _, child in node.children.values():
+            for weight, text in child.top:
+                if best.get(text, weight - 1) < weight:
+                    best[text] = weight
+        node.top = heapq.nlargest(self.top_k, ((w, t) for t, w in best.items()))
+
+    def _prune(self, key):
+        """删除后自下而上去掉不再含任何词的边，只剩一个子节点的空节点与子边合并，保持树的压缩"""
+        node, i, edges = self._root, 0, []
+        while i < len(key):
+            edge = node.children.get(key[i])
+            if edge is None:
+                return
+            edges.append((node, key[i], edge))
+            node = edge[1]
+            i += len(edge[0])
+        for parent, first, edge in reversed(edges):
+            child = edge[1]
+            if child.entries:
+                return
+            if not child.children:
+                del parent.children[first]
+                continue
+            if len(child.children) == 1:
+                label, grandchild = next(iter(child.children.values()))
+                edge[0], edge[1] = edge[0] + label, grandchild
+            return
+
+
+class SuggestEngine:
+    """
+    商品名前缀树随商品目录变更更新（ProductCatalog.subscribe(engine.apply_products)），同名商品取最高销量；
+    热门搜索词每 popular_refresh_interval 秒从 search_history 全量重建，期间本进程的搜索实时累加。
+    """
+
+    # 一次变更的商品数超过该值时在锁外构建新的商品名前缀树再替换，避免长时间阻塞联想与搜索
+    BULK_REBUILD_LIMIT = 256
+
+    POPULAR_SQL = """
+        SELECT keyword, SUM(search_count) AS cnt FROM search_history
+        GROUP BY keyword
+        ORDER BY cnt DESC
+        LIMIT %s
+    """
+
+    def __init__(self, pool, top_k=20, popular_refresh_interval=300, popular_limit=5000):
+        self.pool = pool
+        self.top_k = top_k
+        self.popular_refresh_interval = popular_refresh_interval
+        self.popular_limit = popular_limit
+        self._products = CompletionTrie(top_k)
+        self._queries = CompletionTrie(top_k)
+        # 商品名 -> {商品ID: 销量}
+        self._names = {}
+        self._query_counts = {}
+        self._products_ready = False
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {'lookups': 0, 'popular_refreshes': 0, 'errors': 0}
+
+    @property
+    def products_ready(self):
+        return self._products_ready
+
+    def apply_products(self, changes):
+        """
+        商品目录变更回调。只有名称、销量、上架状态变化的商品影响联想；
+        _names 只在商品目录的刷新线程中（本方法内）修改，锁外读取是安全的
+        """
+        changes = [(old, new) for old, new in changes
+                   if old is None or new is None
+                   or (old.name, old.sales, old.status) != (new.name, new.sales, new.status)]
+        if not self._products_ready or len(changes) > self.BULK_REBUILD_LIMIT:
+            names = {name: dict(ids) for name, ids in self._names.items()}
+            for old, new in changes:
+                if old is not None:
+                    self._drop_name(names, old)
+                if new is not None:
+                    self._add_name(names, new)
+            trie = CompletionTrie(self.top_k)
+            for name, ids in names.items():
+                trie.set(name, max(ids.values()))
+            with self._lock:
+                self._products, self._names = trie, names
+                self._products_ready = True
+            return
+        with self._lock:
+            for old, new in changes:
+                touched = set()
+                if old is not None and self._drop_name(self._names, old):
+                    touched.add(old.name)
+                if new is not None and self._add_name(self._names, new):
+                    touched.add(new.name)
+                for name in touched:
+                    ids = self._names.get(name)
+                    self._products.set(name, max(ids.values()) if ids else None)
+
+    @staticmethod
+    def _add_name(names, record):
+        if record.status != 1 or not record.name:
+            return False
+        names.setdefault(record.name, {})[record.id] = record.sales or 0
+        return True
+
+    @staticmethod
+    def _drop_name(names, record):
+        ids = names.get(record.name)
+        if not ids or ids.pop(record.id, None) is None:
+            return False
+        if not ids:
+            del names[record.name]
+        return True
+
+    def complete_products(self, prefix, limit=10):
+        with self._lock:
+            self._stats['lookups'] += 1
+            return self._products.complete(prefix, limit)
+
+    def complete_queries(self, prefix, limit=10):
+        with self._lock:
+            return self._queries.complete(prefix, limit)
+
+    def record_query(self, keyword):
+        keyword = (keyword or '').strip()[:100]
+        if not keyword:
+            return
+        with self._lock:
+            count = self._query_counts.get(keyword, 0) + 1
+            self._query_counts[keyword] = count
+            self._queries.set(keyword, count)
+
+    def refresh_popular(self):
+        conn = self.pool.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(self.POPULAR_SQL, (self.popular_limit,))
+                rows = cursor.fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+        trie = CompletionTrie(self.top_k)
+        counts = {}
+        for row in rows:
+            counts[row['keyword']] = row['cnt']
+            trie.set(row['keyword'], row['cnt'])
+        with self._lock:
+            self._queries, self._query_counts = trie, counts
+            self._stats['popular_refreshes'] += 1
+        return len(rows)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='search-suggest', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh_popular()
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"⚠️  热门搜索词加载失败: {e}")
+            time.sleep(self.popular_refresh_interval)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['products_ready'] = self._products_ready
+            s['product_names'] = len(self._products)
+            s['popular_queries'] = len(self._queries)
+        return s
+
+
+class RecentQueries:
+    """
+    按用户缓存最近的搜索记录 {'id', 'keyword', 'createdAt'}（新的在前，按关键词去重），供搜索联想使用；
+    最多缓存 max_users 个用户，按最近使用淘汰。get() 未命中时调用 loader(user_id) 加载，
+    loader 返回同样格式的记录列表；尚未落库的记录 id 为 None。
+    缓存只反映本进程的记录，加载超过 ttl 秒后重新加载，以纳入其他进程的搜索与清空。
+    """
+
+    def __init__(self, max_users=10000, per_user=50, ttl=30):
+        self.max_users = max_users
+        self.per_user = per_user
+        self.ttl = ttl
+        self._users = OrderedDict()
+        # user_id -> 加载时间
+        self._loaded_at = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, user_id, loader=None):
+        with self._lock:
+            items = self._users.get(user_id)
+            if items is not None and time.monotonic() - self._loaded_at.get(user_id, 0) >= self.ttl:
+                items = None
+            if items is not None:
+                self._users.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return list(items)
+            self._stats['misses'] += 1
+        if loader is None:
+            return []
+        loaded_at = time.monotonic()
+        items = self._dedupe(loader(user_id))
+        with self._lock:
+            # 加载期间本进程清空了历史时，加载结果已过时，以缓存中的为准
+            current = self._users.get(user_id)
+            if current is not None and self._loaded_at.get(user_id, 0) >= loaded_at:
+                return list(current)
+            self._put(user_id, items)
+            self._loaded_at[user_id] = loaded_at
+        return list(items)
+
+    def keywords(self, user_id, loader=None):
+        return [item['keyword'] for item in self.get(user_id, loader)]
+
+    def record(self, user_id, keyword, searched_at):
+        with self._lock:
+            items = self._users.get(user_id)
+            if items is None:
+                # 未加载过的用户不在此时补全，等首次读取时再加载
+                return
+            items[:] = [item for item in items if item['keyword'] != keyword]
+            items.insert(0, {'id': None, 'keyword': keyword, 'createdAt': searched_at})
+            del items[self.per_user:]
+            self._users.move_to_end(user_id)
+
+    def _dedupe(self, items):
+        seen, result = set(), []
+        for item in items:
+            if item['keyword'] not in seen:
+                seen.add(item['keyword'])
+                result.append(item)
+        return result[:self.per_user]
+
+    def clear(self, user_id):
+        with self._lock:
+            self._put(user_id, [])
+            self._loaded_at[user_id] = time.monotonic()
+
+    def _put(self, user_id, items):
+        self._users[user_id] = items
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            evicted, _ = self._users.popitem(last=False)
+            self._loaded_at.pop(evicted, None)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['users'] = len(self._users)
+        return s
@@ -0,0 +1,11 @@
+"""
+宠物平台 - 单元测试公共配置
+文件名：tests/conftest.py
+
+被测模块位于上一级目录（与 app.py 同级），不依赖数据库与 Flask。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
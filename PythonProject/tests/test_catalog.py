@@ -0,0 +1,79 @@
+"""
+宠物平台 - 商品目录缓存测试
+文件名：tests/test_catalog.py
+"""
+
+from datetime import datetime
+
+from catalog import ProductCatalog
+
+
+class FakePool:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def connection(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        pass
+
+    def fetchall(self):
+        return [dict(row) for row in self.pool.rows]
+
+
+def row(id, name, sales=0, stock=10):
+    return {'id': id, 'name': name, 'category': '狗粮', 'price': 10, 'sales': sales, 'rating': 5,
+            'stock': stock, 'status': 1, 'created_at': datetime(2026, 1, 1), 'updated_at': datetime(2026, 1, id),
+            'categoryIcon': '🐶'}
+
+
+def test_full_reload_notifies_only_changed_products():
+    pool = FakePool([row(1, '狗粮'), row(2, '狗绳'), row(3, '猫砂')])
+    catalog = ProductCatalog(pool)
+    received = []
+    catalog.subscribe(received.append)
+
+    catalog._full_reload()
+    assert [(old, new.id) for old, new in received[0]] == [(None, 1), (None, 2), (None, 3)]
+
+    pool.rows = [row(1, '狗粮'), row(2, '狗绳', stock=5)]
+    catalog._full_reload()
+    changes = received[1]
+    assert sorted((old.id if old else None, new.id if new else None) for old, new in changes) == [(2, 2), (3, None)]
+
+    catalog._full_reload()
+    assert len(received) == 2
+
+
+def test_first_load_of_empty_catalog_still_notifies():
+    catalog = ProductCatalog(FakePool([]))
+    received = []
+    catalog.subscribe(received.append)
+    catalog._full_reload()
+    assert received == [[]]
@@ -0,0 +1,189 @@
+"""
+宠物平台 - 订单号生成测试
+文件名：tests/test_id_generator.py
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from id_generator import SnowflakeGenerator, WorkerIdLease, WorkerIdUnavailable, parse_id
+
+
+class FakeLeaseTable:
+    """模拟 worker_id_leases 表：worker_id -> (owner, 过期时间)"""
+
+    def __init__(self):
+        self.rows = {}
+        self.now = time.time()
+
+    def connection(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self):
+        return FakeCursor(self.table)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, table):
+        self.table = table
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        sql = ' '.join(sql.split())
+        rows, now = self.table.rows, self.table.now
+        if sql.startswith('SELECT worker_id FROM worker_id_leases'):
+            self.result = [{'worker_id': wid} for wid, (_, exp) in rows.items() if exp > now]
+        elif sql.startswith('INSERT INTO worker_id_leases'):
+            wid, owner, ttl = params
+            if wid not in rows or rows[wid][1] <= now:
+                rows[wid] = (owner, now + ttl)
+        elif sql.startswith('SELECT owner FROM worker_id_leases'):
+            row = rows.get(params[0])
+            self.result = [{'owner': row[0]}] if row else []
+        elif sql.startswith('UPDATE worker_id_leases'):
+            ttl, wid, owner = params
+            if wid in rows and rows[wid][0] == owner:
+                rows[wid] = (owner, now + ttl)
+        elif sql.startswith('DELETE FROM worker_id_leases'):
+            wid, owner = params
+            if wid in rows and rows[wid][0] == owner:
+                del rows[wid]
+        else:
+            raise AssertionError(f'unexpected sql: {sql}')
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+
+class CounterLease:
+    """跨 fork 共享的计数器充当租约：每个进程租到不同的机器号"""
+
+    def __init__(self):
+        self.counter = multiprocessing.Value('i', 0)
+        self.worker_id = None
+        self._pid = None
+
+    def valid(self):
+        return self.worker_id is not None and self._pid == os.getpid()
+
+    def acquire(self):
+        with self.counter.get_lock():
+            self.worker_id = self.counter.value
+            self.counter.value += 1
+        self._pid = os.getpid()
+        return self.worker_id
+
+
+def ids_in_child(generator, count):
+    """fork 子进程生成 ID，返回子进程生成的 ID 列表或异常类名"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            payload = ','.join(str(generator.next_id()) for _ in range(count))
+        except Exception as e:
+            payload = type(e).__name__
+        with os.fdopen(write_fd, 'w') as f:
+            f.write(payload)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        payload = f.read()
+    os.waitpid(pid, 0)
+    return [int(x) for x in payload.split(',')] if payload[:1].isdigit() else payload
+
+
+def test_ids_unique_and_increasing_across_threads():
+    generator = SnowflakeGenerator(worker_id=7)
+    results = []
+    lock = threading.Lock()
+
+    def work():
+        ids = [generator.next_id() for _ in range(5000)]
+        with lock:
+            results.extend(ids)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(results)) == len(results) == 20000
+    assert {parse_id(i)[1] for i in results} == {7}
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='需要 fork')
+def test_fixed_worker_id_refuses_after_fork():
+    generator = SnowflakeGenerator(worker_id=3)
+    generator.next_id()
+    assert ids_in_child(generator, 10) == 'WorkerIdUnavailable'
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='需要 fork')
+def test_forked_processes_lease_distinct_worker_ids():
+    generator = SnowflakeGenerator(lease=CounterLease())
+    parent_ids = [generator.next_id() for _ in range(2000)]
+    child_ids = ids_in_child(generator, 2000)
+    parent_ids += [generator.next_id() for _ in range(2000)]
+
+    assert isinstance(child_ids, list) and len(child_ids) == 2000
+    assert not set(parent_ids) & set(child_ids)
+    assert {parse_id(i)[1] for i in parent_ids} == {0}
+    assert {parse_id(i)[1] for i in child_ids} == {1}
+
+
+def test_lease_prefers_configured_id_and_skips_taken_ones():
+    table = FakeLeaseTable()
+    first = WorkerIdLease(table, ttl=60, preferred=5)
+    second = WorkerIdLease(table, ttl=60, preferred=5)
+    assert first.acquire() == 5
+    assert second.acquire() == 6
+
+    first.release()
+    third = WorkerIdLease(table, ttl=60, preferred=5)
+    assert third.acquire() == 5
+    assert second.renew() and third.renew()
+
+
+def test_expired_lease_can_be_taken_over_and_old_holder_loses_it():
+    table = FakeLeaseTable()
+    old = WorkerIdLease(table, ttl=60, preferred=1)
+    assert old.acquire() == 1
+
+    table.now += 61
+    new = WorkerIdLease(table, ttl=60, preferred=1)
+    assert new.acquire() == 1
+    assert not old.renew()
+
+
+def test_no_free_worker_id_raises():
+    table = FakeLeaseTable()
+    for wid in range(1024):
+        table.rows[wid] = ('other', table.now + 60)
+    with pytest.raises(WorkerIdUnavailable):
+        WorkerIdLease(table, ttl=60).acquire()
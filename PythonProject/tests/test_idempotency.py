@@ -0,0 +1,239 @@
+"""
+宠物平台 - 幂等键存储测试
+文件名：tests/test_idempotency.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from idempotency import DbIdempotencyStore, MemoryIdempotencyStore, IdempotencyConflict, IdempotencyMismatch
+
+
+class FakeKeyTable:
+    """
+    模拟 idempotency_keys 表与 InnoDB 的行为：每个连接的写入在提交前对其他连接不可见，
+    其他连接对同一键的 INSERT IGNORE 会等待持有者提交或回滚。
+    """
+
+    def __init__(self):
+        self.committed = {}
+        self.owners = {}
+        self.cond = threading.Condition()
+        self.now = 1000.0
+
+    def connection(self):
+        return FakeConnection(self)
+
+
+class FakeLockWaitTimeout(Exception):
+    """与 pymysql 的 OperationalError 一样，args[0] 为 MySQL 错误码"""
+
+
+class FakeConnection:
+    def __init__(self, table):
+        self.table = table
+        self.local = {}
+        self.lock_wait_timeout = 50
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def _finish(self, apply):
+        with self.table.cond:
+            if apply:
+                for key, row in self.local.items():
+                    if row is None:
+                        self.table.committed.pop(key, None)
+                    else:
+                        self.table.committed[key] = row
+            self.local = {}
+            self.table.owners = {k: c for k, c in self.table.owners.items() if c is not self}
+            self.table.cond.notify_all()
+
+    def commit(self):
+        self._finish(True)
+
+    def rollback(self):
+        self._finish(False)
+
+    def close(self):
+        pass
+
+    def view(self, key):
+        if key in self.local:
+            return self.local[key]
+        return self.table.committed.get(key)
+
+    def write(self, key, row):
+        self.local[key] = row
+        self.table.owners[key] = self
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.table = conn.table
+        self.rowcount = 0
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        sql = ' '.join(sql.split())
+        table, conn = self.table, self.conn
+        with table.cond:
+            if sql.startswith('INSERT IGNORE INTO idempotency_keys'):
+                key, fingerprint, ttl = params
+                deadline = time.monotonic() + conn.lock_wait_timeout
+                while table.owners.get(key) not in (None, conn):
+                    if not table.cond.wait(deadline - time.monotonic()):
+                        raise FakeLockWaitTimeout(1205, 'Lock wait timeout exceeded')
+                if conn.view(key) is not None:
+                    self.rowcount = 0
+                else:
+                    conn.write(key, {'fingerprint': fingerprint, 'status': 'pending', 'response_body': None,
+                                     'response_status': None, 'response_mimetype': None,
+                                     'expires_at': table.now + ttl})
+                    self.rowcount = 1
+            elif sql.startswith('SELECT @@SESSION.innodb_lock_wait_timeout'):
+                self.result = {'timeout': conn.lock_wait_timeout}
+            elif sql.startswith('SET SESSION innodb_lock_wait_timeout'):
+                conn.lock_wait_timeout = params[0]
+            elif sql.startswith('SELECT fingerprint'):
+                row = conn.view(params[0])
+                self.result = dict(row, expired=row['expires_at'] <= table.now) if row else None
+            elif sql.startswith('UPDATE idempotency_keys'):
+                body, status, mimetype, ttl, key = params
+                conn.write(key, dict(conn.view(key), status='done', response_body=body, response_status=status,
+                                     response_mimetype=mimetype, expires_at=table.now + ttl))
+            elif sql.startswith('DELETE FROM idempotency_keys WHERE key_hash = %s AND expires_at'):
+                row = conn.view(params[0])
+                if row is not None and row['expires_at'] <= table.now:
+                    conn.write(params[0], None)
+            elif sql.startswith('DELETE FROM idempotency_keys WHERE key_hash'):
+                conn.write(params[0], None)
+            else:
+                raise AssertionError(f'unexpected sql: {sql}')
+
+    def fetchone(self):
+        return self.result
+
+
+RESPONSE = (b'{"code": 0}', 200, 'application/json')
+
+
+def test_db_store_replays_completed_response():
+    table = FakeKeyTable()
+    store = DbIdempotencyStore(table)
+    first = table.connection()
+    assert store.begin('u1:POST:/api/orders:k1', 'fp', conn=first) is None
+    first.commit()
+    store.complete('u1:POST:/api/orders:k1', RESPONSE, conn=first)
+
+    assert store.begin('u1:POST:/api/orders:k1', 'fp', conn=table.connection()) == RESPONSE
+    assert store.stats()['replayed'] == 1
+
+
+def test_db_store_concurrent_duplicate_waits_for_first_transaction():
+    table = FakeKeyTable()
+    store = DbIdempotencyStore(table, poll_interval=0.01)
+    first = table.connection()
+    assert store.begin('k', 'fp', conn=first) is None
+
+    result = {}
+    duplicate = threading.Thread(target=lambda: result.update(r=store.begin('k', 'fp', 2, conn=table.connection())))
+    duplicate.start()
+    time.sleep(0.05)
+    assert duplicate.is_alive()
+
+    # 业务与占位一起提交，随后写入响应
+    first.commit()
+    store.complete('k', RESPONSE, conn=first)
+    duplicate.join(2)
+    assert result['r'] == RESPONSE
+
+
+def test_db_store_rolled_back_claim_lets_duplicate_execute():
+    table = FakeKeyTable()
+    store = DbIdempotencyStore(table)
+    first = table.connection()
+    assert store.begin('k', 'fp', conn=first) is None
+
+    result = {}
+    duplicate = threading.Thread(target=lambda: result.update(r=store.begin('k', 'fp', 2, conn=table.connection())))
+    duplicate.start()
+    time.sleep(0.05)
+    first.rollback()
+    duplicate.join(2)
+    assert 'r' in result and result['r'] is None
+
+
+def test_db_store_abort_after_error_response_releases_key():
+    table = FakeKeyTable()
+    store = DbIdempotencyStore(table)
+    first = table.connection()
+    assert store.begin('k', 'fp', conn=first) is None
+    first.commit()
+    store.abort('k', conn=first)
+
+    assert store.begin('k', 'fp', conn=table.connection()) is None
+
+
+def test_db_store_rejects_different_body_and_unfinished_first_request():
+    table = FakeKeyTable()
+    store = DbIdempotencyStore(table, poll_interval=0.01)
+    first = table.connection()
+    assert store.begin('k', 'fp', conn=first) is None
+    first.commit()
+
+    with pytest.raises(IdempotencyMismatch):
+        store.begin('k', 'other', conn=table.connection())
+    # 首个请求已提交但没有写入响应（如进程崩溃）：不再执行，返回冲突
+    with pytest.raises(IdempotencyConflict):
+        store.begin('k', 'fp', 0.05, conn=table.connection())
+
+
+def test_db_store_expired_key_executes_again():
+    table = FakeKeyTable()
+    store = DbIdempotencyStore(table, ttl=60)
+    first = table.connection()
+    store.begin('k', 'fp', conn=first)
+    first.commit()
+    store.complete('k', RESPONSE, conn=first)
+
+    table.now += 61
+    assert store.begin('k', 'fp', conn=table.connection()) is None
+
+
+def test_memory_store_replay_and_abort():
+    store = MemoryIdempotencyStore(ttl=60)
+    assert store.begin('k', 'fp') is None
+    store.abort('k')
+    assert store.begin('k', 'fp') is None
+    store.complete('k', RESPONSE)
+    assert store.begin('k', 'fp') == RESPONSE
+    with pytest.raises(IdempotencyMismatch):
+        store.begin('k', 'other')
+
+
+def test_db_store_lock_wait_bounded_by_wait_timeout():
+    table = FakeKeyTable()
+    store = DbIdempotencyStore(table, poll_interval=0.01)
+    first = table.connection()
+    assert store.begin('k', 'fp', conn=first) is None
+
+    # 首个请求的事务一直未结束：重复请求等锁 ceil(wait_timeout) 秒后返回冲突，而不是等到会话默认的 50 秒
+    duplicate = table.connection()
+    started = time.monotonic()
+    with pytest.raises(IdempotencyConflict):
+        store.begin('k', 'fp', 0.2, conn=duplicate)
+    assert time.monotonic() - started < 2
+    assert duplicate.lock_wait_timeout == 50
+    assert store.stats()['conflicts'] == 1
+    first.rollback()
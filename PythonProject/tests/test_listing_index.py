@@ -0,0 +1,51 @@
+"""
+宠物平台 - 商品排序索引测试
+文件名：tests/test_listing_index.py
+"""
+
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from catalog import ProductRecord
+from listing_index import ListingIndex
+
+
+CATEGORIES = ['狗粮', '猫粮', '零食', None]
+
+
+def make_record(rnd, product_id):
+    return ProductRecord({
+        'id': product_id,
+        'name': f'商品{product_id}',
+        'category': rnd.choice(CATEGORIES),
+        'price': Decimal(rnd.randint(100, 999)) / 100,
+        'sales': rnd.randint(0, 50),
+        'rating': Decimal(rnd.randint(0, 50)) / 10,
+        'status': 1 if rnd.random() > 0.1 else 0,
+        'created_at': datetime(2024, 1, 1) + timedelta(hours=rnd.randint(0, 100)),
+    })
+
+
+def test_bulk_updated_matches_sequential_updates():
+    rnd = random.Random(7)
+    records = {i: make_record(rnd, i) for i in range(1, 501)}
+    index = ListingIndex.build(records.values())
+
+    changes = []
+    for pid in rnd.sample(sorted(records), 200):
+        changes.append((records[pid], None if rnd.random() < 0.1 else make_record(rnd, pid)))
+    for pid in range(501, 551):
+        changes.append((None, make_record(rnd, pid)))
+
+    bulk = index.updated(changes)
+    sequential = ListingIndex.build(records.values())
+    for old, new in changes:
+        sequential.update(old, new)
+
+    assert bulk._arrays.keys() >= {k for k, v in sequential._arrays.items() if v}
+    for key, array in sequential._arrays.items():
+        assert bulk._arrays.get(key, []) == array
+
+    # 原索引不受影响
+    assert index._arrays == ListingIndex.build(records.values())._arrays
@@ -0,0 +1,16 @@
+"""
+宠物平台 - 登录限流测试
+文件名：tests/test_login_throttle.py
+"""
+
+from login_throttle import MemoryThrottleStore
+
+
+def test_sweep_uses_each_keys_own_window():
+    store = MemoryThrottleStore(max_keys=2)
+    store.hit('phone:1', 1800, now=1000)
+    store.hit('ip:1', 900, now=1000)
+    # 新键触发清理：调用方窗口为 900 秒，但 phone:1 的 1800 秒窗口尚未过期，计数必须保留
+    store.hit('ip:2', 900, now=2000)
+    assert store.hit('phone:1', 1800, now=2001) == 2
+    assert store.hit('ip:1', 900, now=2001) == 1
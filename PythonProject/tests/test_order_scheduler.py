@@ -0,0 +1,167 @@
+"""
+宠物平台 - 订单超时取消调度测试
+文件名：tests/test_order_scheduler.py
+"""
+
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+from order_scheduler import OrderAutoCancelScheduler
+
+
+class FakeDb:
+    """模拟 orders 表与 MySQL 命名锁：锁归属于连接，连接断开时释放"""
+
+    def __init__(self, pending_ids=(), age_seconds=3600):
+        created = datetime.now() - timedelta(seconds=age_seconds)
+        self.pending = {order_id: created for order_id in pending_ids}
+        self.locks = {}
+        self.ids = itertools.count(1)
+        self.mutex = threading.Lock()
+
+    def connection(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.id = next(db.ids)
+        self.discarded = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def discard(self):
+        self.discarded = True
+        with self.db.mutex:
+            self.db.locks = {name: owner for name, owner in self.db.locks.items() if owner != self.id}
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        db = self.conn.db
+        with db.mutex:
+            if sql.startswith('SELECT GET_LOCK'):
+                owner = db.locks.setdefault(params[0], self.conn.id)
+                self.result = [{'locked': 1 if owner == self.conn.id else 0}]
+            elif sql.startswith('SELECT IS_USED_LOCK'):
+                self.result = [{'held': 1 if db.locks.get(params[0]) == self.conn.id else 0}]
+            elif "FROM orders WHERE status = 'pending'" in sql:
+                self.result = [{'id': order_id, 'created_at': created} for order_id, created in db.pending.items()]
+            else:
+                raise AssertionError(sql)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeStateMachine:
+    def __init__(self, db):
+        self.db = db
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def transition_many(self, cursor, order_ids, action):
+        with self.lock:
+            self.calls.append(list(order_ids))
+            expired = [order_id for order_id in order_ids if self.db.pending.pop(order_id, None) is not None]
+        return expired
+
+
+def make_scheduler(db, states, **kwargs):
+    kwargs.setdefault('leader_lock', 'order_cancel')
+    return OrderAutoCancelScheduler(db, states, payment_window=60, leader_check_interval=0.05,
+                                    rehydrate_interval=0.1, **kwargs)
+
+
+def test_only_one_process_leads():
+    db = FakeDb()
+    states = FakeStateMachine(db)
+    first, second = make_scheduler(db, states), make_scheduler(db, states)
+    assert first._hold_leadership()
+    assert not second._hold_leadership()
+
+    first.schedule(1)
+    second.schedule(2)
+    assert first.stats()['queue_depth'] == 1
+    assert second.stats()['queue_depth'] == 0
+    assert first.stats()['leader'] and not second.stats()['leader']
+
+
+def test_lost_lock_steps_down_and_other_process_takes_over():
+    db = FakeDb()
+    states = FakeStateMachine(db)
+    first, second = make_scheduler(db, states), make_scheduler(db, states)
+    assert first._hold_leadership()
+    first.schedule(1)
+    lock_conn = first._lock_conn
+
+    # 持锁连接断开（如被 MySQL 回收）：锁已释放
+    db.locks.clear()
+    assert not first._hold_leadership()
+    assert lock_conn.discarded
+    assert first.stats()['queue_depth'] == 0
+    assert second._hold_leadership()
+
+
+def test_each_expired_order_cancelled_once_across_processes():
+    db = FakeDb(pending_ids=range(1, 51))
+    states = FakeStateMachine(db)
+    schedulers = [make_scheduler(db, states) for _ in range(3)]
+    for scheduler in schedulers:
+        scheduler.start()
+    deadline = time.time() + 5
+    while db.pending and time.time() < deadline:
+        time.sleep(0.02)
+    assert not db.pending
+    cancelled = [order_id for call in states.calls for order_id in call]
+    assert sorted(cancelled) == list(range(1, 51))
+    assert sum(s.stats()['leader'] for s in schedulers) == 1
+
+
+def test_leader_picks_up_orders_created_elsewhere():
+    db = FakeDb()
+    states = FakeStateMachine(db)
+    leader = make_scheduler(db, states)
+    leader.start()
+    time.sleep(0.1)
+    # 其他进程创建、且已超时的订单：主节点下一次扫描时纳入并取消
+    db.pending[7] = datetime.now() - timedelta(seconds=120)
+    deadline = time.time() + 5
+    while db.pending and time.time() < deadline:
+        time.sleep(0.02)
+    assert not db.pending
+
+
+def test_without_leader_lock_schedules_locally():
+    db = FakeDb()
+    scheduler = make_scheduler(db, FakeStateMachine(db), leader_lock=None)
+    assert scheduler._hold_leadership()
+    scheduler.schedule(1)
+    assert scheduler.stats()['queue_depth'] == 1
+    assert scheduler._next_batch(timeout=0.01) == []
@@ -0,0 +1,44 @@
+"""
+宠物平台 - 密码哈希测试
+文件名：tests/test_passwords.py
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import passwords
+from passwords import PasswordHasher, PasswordHasherBusy, needs_rehash
+
+
+def test_needs_rehash_compares_scrypt_params_separately(monkeypatch):
+    monkeypatch.setattr(passwords, 'DEFAULT_ALGORITHM', 'scrypt')
+    monkeypatch.setattr(passwords, 'SCRYPT_N', 2 ** 14)
+    monkeypatch.setattr(passwords, 'SCRYPT_R', 8)
+    monkeypatch.setattr(passwords, 'SCRYPT_P', 1)
+    assert not needs_rehash('scrypt$16384$8$1$c2FsdA$aGFzaA')
+    assert not needs_rehash('scrypt$32768$8$1$c2FsdA$aGFzaA')
+    # n 更大但 r 更小：按元组比较会判为无需升级
+    assert needs_rehash('scrypt$32768$4$1$c2FsdA$aGFzaA')
+    assert needs_rehash('scrypt$16384$8$0$c2FsdA$aGFzaA')
+    assert needs_rehash('0' * 64)
+
+
+def test_slot_held_until_timed_out_task_finishes():
+    hasher = PasswordHasher(workers=1, max_pending=1, wait_timeout=0.05, task_timeout=0.05)
+    executor = ThreadPoolExecutor(max_workers=1)
+    hasher._executor = executor
+    release = threading.Event()
+
+    with pytest.raises(PasswordHasherBusy, match='超时'):
+        hasher._run(release.wait, 5)
+    # 超时的任务仍在执行，名额未归还
+    with pytest.raises(PasswordHasherBusy, match='排队已满'):
+        hasher._run(len, 'x')
+
+    release.set()
+    executor.shutdown(wait=True)
+    hasher._executor = ThreadPoolExecutor(max_workers=1)
+    assert hasher._run(len, 'abc') == 3
+    hasher._executor.shutdown()
@@ -0,0 +1,148 @@
+"""
+宠物平台 - 搜索历史缓冲与最近搜索缓存测试
+文件名：tests/test_search_history.py
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from search_history import SearchHistoryBuffer
+from suggest import RecentQueries
+
+
+class FakePool:
+    """记录每次提交的 UPSERT 行；fail 为真时执行失败，block 被设置时 UPSERT 等待放行"""
+
+    def __init__(self):
+        self.rows = []
+        self.fail = False
+        self.block = None
+        self.writing = threading.Event()
+
+    def connection(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.pending = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.pool.rows.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        pool = self.conn.pool
+        if 'INSERT INTO search_history' in sql:
+            pool.writing.set()
+            if pool.block is not None:
+                pool.block.wait(5)
+            if pool.fail:
+                raise RuntimeError('db down')
+            params = list(params)
+            self.conn.pending.extend(tuple(params[i:i + 4]) for i in range(0, len(params), 4))
+            return len(params) // 4
+        return 0
+
+
+def test_same_keyword_coalesced_until_flush():
+    pool = FakePool()
+    buffer = SearchHistoryBuffer(pool)
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    buffer.record(1, '猫粮', t0)
+    buffer.record(1, ' 猫粮 ', t0 + timedelta(seconds=5))
+    buffer.record(1, '狗绳', t0 + timedelta(seconds=1))
+
+    assert buffer.pending_for(1) == [('猫粮', t0 + timedelta(seconds=5)), ('狗绳', t0 + timedelta(seconds=1))]
+    assert buffer.flush() == 2
+    assert sorted(pool.rows) == [(1, '狗绳', 1, t0 + timedelta(seconds=1)), (1, '猫粮', 2, t0 + timedelta(seconds=5))]
+    assert buffer.pending_for(1) == []
+    assert buffer.stats()['coalesced'] == 1
+
+
+def test_failed_flush_requeues_batch():
+    pool = FakePool()
+    buffer = SearchHistoryBuffer(pool)
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    buffer.record(1, '猫粮', t0)
+    pool.fail = True
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    buffer.record(1, '猫粮', t0 + timedelta(seconds=3))
+
+    pool.fail = False
+    assert buffer.flush() == 1
+    assert pool.rows == [(1, '猫粮', 2, t0 + timedelta(seconds=3))]
+
+
+def test_clear_waits_for_inflight_flush():
+    pool = FakePool()
+    buffer = SearchHistoryBuffer(pool)
+    buffer.record(1, '猫粮')
+    pool.block = threading.Event()
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    assert pool.writing.wait(5)
+
+    # 刷新线程已取走该用户的记录、尚未提交；清空必须排在写入之后，否则删除后记录又会落库
+    deleted = []
+    clearer = threading.Thread(target=buffer.clear_user, args=(1, lambda: deleted.append(list(pool.rows))))
+    clearer.start()
+    time.sleep(0.05)
+    assert deleted == []
+
+    pool.block.set()
+    flusher.join(5)
+    clearer.join(5)
+    assert len(deleted) == 1 and [row[1] for row in deleted[0]] == ['猫粮']
+    assert buffer.pending_for(1) == []
+
+
+def test_recent_queries_reload_after_ttl():
+    loads = []
+
+    def loader(user_id):
+        loads.append(user_id)
+        return [{'id': len(loads), 'keyword': f'kw{len(loads)}', 'createdAt': None}]
+
+    recent = RecentQueries(ttl=0.05)
+    assert recent.keywords(1, loader) == ['kw1']
+    assert recent.keywords(1, loader) == ['kw1']
+    time.sleep(0.06)
+    assert recent.keywords(1, loader) == ['kw2']
+    assert loads == [1, 1]
+
+
+def test_recent_queries_clear_during_load_wins():
+    recent = RecentQueries(ttl=60)
+
+    def loader(user_id):
+        recent.clear(user_id)
+        return [{'id': 1, 'keyword': '猫粮', 'createdAt': None}]
+
+    assert recent.get(1, loader) == []
+    assert recent.get(1, loader) == []
@@ -0,0 +1,76 @@
+"""
+宠物平台 - 倒排索引测试
+文件名：tests/test_search_index.py
+"""
+
+from catalog import ProductRecord
+from search_index import InvertedIndex, ProductSearchIndex, query_terms, tokenize
+
+
+def product(id, name, description='', status=1, sales=0):
+    return ProductRecord({'id': id, 'name': name, 'description': description, 'status': status, 'sales': sales})
+
+
+def test_tokenize_cjk_unigrams_and_bigrams():
+    assert tokenize('皇家狗粮') == ['皇', '家', '狗', '粮', '皇家', '家狗', '狗粮']
+    assert tokenize('Royal Canin 狗粮2kg') == ['royal', 'canin', '狗', '粮', '狗粮', '2kg']
+    assert tokenize('') == []
+
+
+def test_query_terms():
+    assert query_terms('狗') == [('term', '狗')]
+    assert query_terms('狗粮狗粮') == [('term', '狗粮'), ('term', '粮狗')]
+    assert query_terms('Dog 粮') == [('fragment', 'dog'), ('term', '粮')]
+
+
+def test_search_matches_like_semantics():
+    index = InvertedIndex({'name': 3.0, 'description': 1.0})
+    index.add(1, {'name': '皇家狗粮', 'description': ''})
+    index.add(2, {'name': '猫粮', 'description': '狗也能吃'})
+    index.add(3, {'name': 'Hotdog 玩具', 'description': None})
+    assert sorted(doc_id for doc_id, _ in index.search('狗')) == [1, 2]
+    # 子串：狗粮 的两个字不相邻的文档不命中
+    assert [doc_id for doc_id, _ in index.search('狗粮')] == [1]
+    assert [doc_id for doc_id, _ in index.search('DOG')] == [3]
+    assert index.search('') == []
+
+
+def test_bm25_prefers_name_and_shorter_docs():
+    index = InvertedIndex({'name': 3.0, 'description': 1.0})
+    index.add(1, {'name': '猫砂', 'description': ''})
+    index.add(2, {'name': '宠物用品', 'description': '猫砂'})
+    index.add(3, {'name': '猫砂 豆腐猫砂 除臭结团 大包装 家庭多猫适用', 'description': ''})
+    scores = dict(index.search('猫砂'))
+    assert scores[1] > scores[2]
+    assert scores[1] > scores[3]
+
+
+def test_match_tier_with_contains_fields():
+    index = InvertedIndex({'title': 3.0, 'content': 1.0, 'tags': 1.0})
+    index.add(1, {'title': '遛狗', 'content': '', 'tags': ''})
+    index.add(2, {'title': '遛狗日记', 'content': '', 'tags': ''})
+    index.add(3, {'title': '日常', 'content': '今天遛狗', 'tags': ''})
+    index.add(4, {'title': '日常', 'content': '', 'tags': '["遛狗"]'})
+    tiers = {doc_id: index.match_tier(doc_id, 'title', '遛狗', contains=('title', 'content'))
+             for doc_id, _ in index.search('遛狗')}
+    assert tiers == {1: 0, 2: 1, 3: 2, 4: 3}
+    assert index.match_tier(4, 'title', '遛狗') == 2
+
+
+def test_product_index_applies_incremental_changes():
+    search = ProductSearchIndex()
+    search.apply([(None, product(1, '皇家狗粮')), (None, product(2, '猫砂', status=0))])
+    assert search.ready
+    assert [doc_id for doc_id, _ in search.index.search('狗粮')] == [1]
+    assert search.index.search('猫砂') == []
+
+    old = product(1, '皇家狗粮')
+    search.apply([(old, product(1, '皇家猫粮'))])
+    assert search.index.search('狗粮') == []
+    assert [doc_id for doc_id, _ in search.index.search('猫粮')] == [1]
+
+    search.apply([(product(2, '猫砂', status=0), product(2, '猫砂'))])
+    assert [doc_id for doc_id, _ in search.index.search('猫砂')] == [2]
+    search.apply([(product(1, '皇家猫粮'), None)])
+    assert search.index.search('猫粮') == []
+    assert search.stats()['docs'] == 1
@@ -0,0 +1,133 @@
+"""
+宠物平台 - 库存预占测试
+文件名：tests/test_stock_reservation.py
+"""
+
+import re
+import threading
+import time
+
+import pytest
+
+from stock_reservation import StockReservations, StockReservationError
+
+
+class FakeStockDB:
+    """只实现热门商品队列与回补用到的 UPDATE；gate 未放行时借连接会阻塞，用来卡住队列线程"""
+
+    def __init__(self, stock):
+        self.stock = dict(stock)
+        self.gate = threading.Event()
+        self.gate.set()
+        self.lock = threading.Lock()
+
+    def connection(self):
+        self.gate.wait()
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        sql = ' '.join(sql.split())
+        with self.db.lock:
+            if sql.startswith('UPDATE products SET stock = stock - %s WHERE id = %s AND stock >= %s'):
+                quantity, product_id, _ = params
+                if self.db.stock[product_id] >= quantity:
+                    self.db.stock[product_id] -= quantity
+                    self.rowcount = 1
+                else:
+                    self.rowcount = 0
+            elif sql.startswith('UPDATE products SET stock = stock + CASE id'):
+                pairs = len(re.findall('WHEN', sql))
+                for i in range(pairs):
+                    self.db.stock[params[2 * i]] += params[2 * i + 1]
+                self.rowcount = pairs
+            else:
+                raise AssertionError(f'unexpected sql: {sql}')
+
+    def executemany(self, sql, rows):
+        self.rows = list(rows)
+
+
+def wait_drained(reservations, product_id, expected):
+    queue = reservations._hot_queue(product_id)
+    deadline = time.monotonic() + 2
+    while queue.processed < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue.processed == expected
+
+
+def test_hot_queue_timeout_does_not_leak_stock():
+    db = FakeStockDB({1: 10})
+    reservations = StockReservations(db, hot_product_ids=[1], hot_queue_timeout=0.05)
+
+    # 第一个请求被 worker 认领后卡在借连接上，第二个请求只能在队列里等到超时
+    db.gate.clear()
+    first = {}
+    blocker = threading.Thread(target=lambda: first.update(ok=reservations._hot_queue(1).submit(2, 0.05)))
+    blocker.start()
+    time.sleep(0.1)
+
+    with pytest.raises(StockReservationError) as info:
+        reservations.reserve(FakeCursor(db), 1001, {1: 3})
+    assert info.value.product_id == 1
+
+    db.gate.set()
+    blocker.join(2)
+    wait_drained(reservations, 1, 2)
+
+    # 已认领的请求超时后仍等待真实结果；被取消的请求没有扣库存
+    assert first['ok'] is True
+    assert db.stock[1] == 8
+    assert reservations.stats()['hot_queues'][1]['cancelled'] == 1
+
+
+def test_hot_shortage_compensates_taken_skus():
+    db = FakeStockDB({1: 10, 2: 1})
+    reservations = StockReservations(db, hot_product_ids=[1, 2])
+
+    with pytest.raises(StockReservationError) as info:
+        reservations.reserve(FakeCursor(db), 1002, {1: 4, 2: 5})
+    assert info.value.product_id == 2
+    assert db.stock == {1: 10, 2: 1}
+
+
+def test_hot_reserve_success_records_reservations():
+    db = FakeStockDB({1: 10})
+    reservations = StockReservations(db, hot_product_ids=[1])
+    cursor = FakeCursor(db)
+
+    taken = reservations.reserve(cursor, 1003, {1: 4})
+    assert taken == {1: 4}
+    assert db.stock[1] == 6
+    assert [(row[0], row[1], row[2]) for row in cursor.rows] == [(1003, 1, 4)]
+
+    reservations.compensate(taken)
+    assert db.stock[1] == 10
@@ -0,0 +1,137 @@
+"""
+宠物平台 - 搜索联想测试
+文件名：tests/test_suggest.py
+"""
+
+import random
+
+from suggest import CompletionTrie, SuggestEngine, completion_keys
+
+
+class Product:
+    def __init__(self, id, name, sales=0, status=1):
+        self.id = id
+        self.name = name
+        self.sales = sales
+        self.status = status
+
+
+def brute_complete(weights, prefix, limit):
+    prefix = prefix.strip().lower()
+    matched = [(w, t) for t, w in weights.items() if any(k.startswith(prefix) for k in completion_keys(t))]
+    return [t for _, t in sorted(matched, reverse=True)[:limit]]
+
+
+def test_completion_keys_include_word_and_cjk_suffixes():
+    assert completion_keys(' Royal Canin ') == ['royal canin', 'canin']
+    assert completion_keys('皇家狗粮') == ['皇家狗粮', '家狗粮', '狗粮', '粮']
+    assert completion_keys('') == []
+
+
+def test_set_update_and_suffix_match():
+    trie = CompletionTrie(top_k=3)
+    trie.set('皇家狗粮', 10)
+    trie.set('狗粮试吃装', 30)
+    trie.set('猫砂', 5)
+    assert trie.complete('狗粮') == ['狗粮试吃装', '皇家狗粮']
+    assert trie.complete('皇') == ['皇家狗粮']
+    trie.set('皇家狗粮', 50)
+    assert trie.complete('狗') == ['皇家狗粮', '狗粮试吃装']
+    assert trie.complete('royal') == []
+    assert len(trie) == 3
+
+
+def test_delete_prunes_empty_edges():
+    trie = CompletionTrie()
+    trie.set('狗粮', 1)
+    trie.set('狗绳', 2)
+    trie.set('狗粮', None)
+    assert trie.complete('狗') == ['狗绳']
+    assert trie.complete('粮') == []
+    assert '粮' not in trie._root.children
+    trie.set('狗绳', None)
+    assert trie._root.children == {}
+    assert len(trie) == 0
+
+
+def test_full_top_refills_after_delete_and_decrease():
+    trie = CompletionTrie(top_k=2)
+    for text, weight in (('猫粮a', 3), ('猫粮b', 2), ('猫粮c', 1)):
+        trie.set(text, weight)
+    assert trie.complete('猫') == ['猫粮a', '猫粮b']
+    trie.set('猫粮a', None)
+    assert trie.complete('猫') == ['猫粮b', '猫粮c']
+    trie.set('猫粮b', 0)
+    assert trie.complete('猫') == ['猫粮c', '猫粮b']
+
+
+def test_random_operations_match_brute_force():
+    rng = random.Random(7)
+    chars = '狗猫粮砂绳玩具'
+    texts = [''.join(rng.choice(chars) for _ in range(rng.randint(1, 4))) for _ in range(60)]
+    trie, weights = CompletionTrie(top_k=5), {}
+    for _ in range(2000):
+        text = rng.choice(texts)
+        weight = None if rng.random() < 0.3 else rng.randint(0, 20)
+        trie.set(text, weight)
+        if weight is None:
+            weights.pop(text, None)
+        else:
+            weights[text] = weight
+    for prefix in [''] + list(chars) + [a + b for a in chars for b in chars]:
+        assert trie.complete(prefix, 5) == brute_complete(weights, prefix, 5), prefix
+    # 删除后保持压缩：除根外每个节点要么有词，要么至少有两个子节点
+    stack = [edge[1] for edge in trie._root.children.values()]
+    while stack:
+        node = stack.pop()
+        assert node.entries or len(node.children) >= 2
+        stack.extend(edge[1] for edge in node.children.values())
+
+
+def test_engine_applies_incremental_changes():
+    engine = SuggestEngine(pool=None)
+    a, b = Product(1, '狗粮', 10), Product(2, '狗绳', 5)
+    engine.apply_products([(None, a), (None, b)])
+    assert engine.products_ready
+    assert engine.complete_products('狗') == ['狗粮', '狗绳']
+
+    engine.apply_products([(b, Product(2, '狗绳', 50))])
+    assert engine.complete_products('狗') == ['狗绳', '狗粮']
+    # 下架与改名
+    engine.apply_products([(a, Product(1, '狗粮', 10, status=0))])
+    assert engine.complete_products('狗') == ['狗绳']
+    engine.apply_products([(Product(2, '狗绳', 50), Product(2, '牵引绳', 50))])
+    assert engine.complete_products('狗') == []
+    assert engine.complete_products('绳') == ['牵引绳']
+
+
+def test_engine_same_name_keeps_highest_sales():
+    engine = SuggestEngine(pool=None)
+    engine.apply_products([(None, Product(1, '猫砂', 3)), (None, Product(2, '猫砂', 9))])
+    engine.apply_products([(Product(2, '猫砂', 9), None)])
+    assert engine.complete_products('猫') == ['猫砂']
+    assert engine._products._weights['猫砂'] == 3
+
+
+def test_engine_skips_unchanged_and_rebuilds_bulk_off_lock():
+    engine = SuggestEngine(pool=None)
+    products = [Product(i, f'商品{i}', i) for i in range(1, 400)]
+    engine.apply_products([(None, p) for p in products])
+    first = engine._products
+
+    # 全量重载带来的未变化记录不触碰前缀树
+    engine.apply_products([(p, Product(p.id, p.name, p.sales)) for p in products])
+    assert engine._products is first
+
+    # 大批量变化：整体替换为新树
+    engine.apply_products([(p, Product(p.id, p.name, p.sales + 1000)) for p in products])
+    assert engine._products is not first
+    assert engine.complete_products('商品', 2) == ['商品399', '商品398']
+
+
+def test_record_query():
+    engine = SuggestEngine(pool=None)
+    engine.record_query('狗粮')
+    engine.record_query('狗绳')
+    engine.record_query('狗绳')
+    assert engine.complete_queries('狗') == ['狗绳', '狗粮']
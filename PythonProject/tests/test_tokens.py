@@ -0,0 +1,91 @@
+"""
+宠物平台 - token 缓存与 refresh token 测试
+文件名：tests/test_tokens.py
+"""
+
+import time
+
+import refresh_tokens
+from token_cache import TokenCache
+
+
+class FakeRefreshTable:
+    """模拟 refresh_tokens 表的 cursor：jti -> (user_id, expires_at)，execute 返回影响行数"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def execute(self, sql, params=()):
+        if sql.startswith('INSERT INTO refresh_tokens'):
+            jti, user_id, expires_at = params
+            self.rows[jti] = (user_id, expires_at)
+            return 1
+        if 'WHERE jti = %s AND user_id = %s' in sql:
+            jti, user_id = params
+            if self.rows.get(jti, (None,))[0] == user_id:
+                del self.rows[jti]
+                return 1
+            return 0
+        if sql.startswith('DELETE FROM refresh_tokens WHERE user_id = %s'):
+            user_id = params[0]
+            # 过期清理：测试中的记录都未过期，只有不带过期条件的删除生效
+            if 'expires_at' in sql:
+                return 0
+            stale = [jti for jti, row in self.rows.items() if row[0] == user_id]
+            for jti in stale:
+                del self.rows[jti]
+            return len(stale)
+        raise AssertionError(sql)
+
+
+def test_token_cache_hit_and_expiry():
+    cache = TokenCache()
+    assert cache.get('t1') is None
+    assert cache.put('t1', 7, exp=time.time() + 60)
+    assert cache.get('t1') == 7
+    cache.put('t2', 7, exp=time.time() - 1)
+    assert cache.get('t2') is None
+
+
+def test_token_cache_rejects_stale_generation():
+    cache = TokenCache()
+    cache.put('old', 7, exp=time.time() + 60, gen=0)
+    cache.set_generation(7, 1)
+    # 代数变大后已缓存的旧 token 被清除，重新验证时拒绝
+    assert cache.get('old') is None
+    assert not cache.put('old', 7, exp=time.time() + 60, gen=0)
+    assert cache.put('new', 7, exp=time.time() + 60, gen=1)
+    # 代数只增不减
+    cache.set_generation(7, 0)
+    assert cache.generation(7) == 1
+
+
+def test_refresh_token_single_use():
+    cursor = FakeRefreshTable()
+    jti = refresh_tokens.new_jti()
+    refresh_tokens.register(cursor, 7, jti, None)
+    assert refresh_tokens.consume(cursor, 7, jti)
+    # 重放
+    assert not refresh_tokens.consume(cursor, 7, jti)
+
+
+def test_refresh_token_rejects_other_user_and_legacy():
+    cursor = FakeRefreshTable()
+    jti = refresh_tokens.new_jti()
+    refresh_tokens.register(cursor, 7, jti, None)
+    assert not refresh_tokens.consume(cursor, 8, jti)
+    # 升级前签发的 refresh token 没有 jti
+    assert not refresh_tokens.consume(cursor, 7, None)
+    assert refresh_tokens.consume(cursor, 7, jti)
+
+
+def test_refresh_tokens_per_device_and_revoke():
+    cursor = FakeRefreshTable()
+    phone, tablet = refresh_tokens.new_jti(), refresh_tokens.new_jti()
+    refresh_tokens.register(cursor, 7, phone, None)
+    refresh_tokens.register(cursor, 7, tablet, None)
+    # 一台设备刷新不影响另一台
+    assert refresh_tokens.consume(cursor, 7, phone)
+    assert tablet in cursor.rows
+    refresh_tokens.revoke_user(cursor, 7)
+    assert not refresh_tokens.consume(cursor, 7, tablet)
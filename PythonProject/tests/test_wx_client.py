@@ -0,0 +1,115 @@
+"""
+宠物平台 - 微信接口客户端测试（对接 wx_fake_server.py 启动的本地假服务）
+文件名：tests/test_wx_client.py
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+
+import wx_fake_server
+from wx_client import CircuitBreaker, WeChatClient
+from wx_fake_server import FakeWeChatHandler, start_fake_server
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server, url = start_fake_server()
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def reset_calls(monkeypatch):
+    FakeWeChatHandler.calls = 0
+    monkeypatch.setattr(wx_fake_server, 'SLOW_SECONDS', 0.3)
+
+
+def make_client(base_url, **kwargs):
+    return WeChatClient('appid', 'secret', base_url=base_url, **kwargs)
+
+
+def test_success_is_cached(base_url):
+    client = make_client(base_url)
+    data, error = client.code2session('code-1')
+    assert error is None and data['openid'].startswith('fake_openid_')
+    assert client.code2session('code-1') == (data, None)
+    assert FakeWeChatHandler.calls == 1
+    assert client.stats()['cache_hits'] == 1
+
+
+def test_errors_are_not_cached(base_url):
+    client = make_client(base_url)
+    assert client.code2session('invalid-1') == (None, 'invalid code')
+    assert client.code2session('invalid-1') == (None, 'invalid code')
+    assert FakeWeChatHandler.calls == 2
+    # 非临时性错误码不计入熔断
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_concurrent_same_code_calls_once(base_url):
+    client = make_client(base_url)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.code2session('slow-1'))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert len(results) == 5 and all(error is None for _, error in results)
+    assert len({data['openid'] for data, _ in results}) == 1
+    assert FakeWeChatHandler.calls == 1
+    assert client.stats()['coalesced'] == 4
+
+
+def test_breaker_opens_probes_and_closes(base_url):
+    client = make_client(base_url, failure_threshold=2, reset_timeout=0.2)
+    client.code2session('busy-1')
+    client.code2session('error-1')
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # 熔断期间直接失败，不外呼
+    assert client.code2session('code-2') == (None, '微信服务暂不可用（熔断中）')
+    assert FakeWeChatHandler.calls == 2
+
+    # 到期后探测失败：重新熔断
+    time.sleep(0.25)
+    client.code2session('busy-2')
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # 再次到期后探测成功：恢复
+    time.sleep(0.25)
+    data, error = client.code2session('code-3')
+    assert error is None
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.stats()['rejected_open'] == 1
+
+
+def test_bulkhead_rejects_when_full(base_url):
+    client = make_client(base_url, max_concurrent=1, acquire_timeout=0.05)
+    slow = threading.Thread(target=client.code2session, args=('slow-2',))
+    slow.start()
+    time.sleep(0.1)
+    assert client.code2session('code-4') == (None, '微信服务繁忙')
+    slow.join(5)
+    assert client.stats()['rejected_busy'] == 1
+    assert client.code2session('code-4')[1] is None
+
+
+def test_bulkhead_rejection_does_not_consume_half_open_probe(base_url):
+    client = make_client(base_url, max_concurrent=1, acquire_timeout=0.05, failure_threshold=1, reset_timeout=0.1)
+    client.code2session('busy-3')
+    assert client.breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.15)
+
+    # 熔断已到期但名额已满：本次拿不到名额，不能把熔断器推进到半开（否则探测永远不会发出）
+    client._slots.acquire()
+    assert client.code2session('code-5') == (None, '微信服务繁忙')
+    assert client.breaker.state == CircuitBreaker.OPEN
+    client._slots.release()
+
+    data, error = client.code2session('code-5')
+    assert error is None
+    assert client.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,118 @@
+"""
+宠物平台 - 已验证 token 缓存
+文件名：token_cache.py
+
+同一个 token 在一次会话中会被反复携带，每次都做完整的 jwt.decode（Base64 + JSON + HMAC-SHA256）是浪费。
+这里缓存验证通过的 access token：键为 token 的 SHA-256 摘要（不在内存中保存 token 原文），值为 (user_id, exp, gen)，
+到期前直接返回 user_id；容量有限，按最近使用淘汰。
+
+吊销使用按用户的代数（generation）：token 中携带签发时用户的 users.token_generation，
+退出登录、修改密码时该值加一，代数小于当前值的 token 一律拒绝。内存中只记录代数大于 0 且最近变更过的用户：
+access token 有效期很短（token_lifetime），变更超过 token_lifetime 后旧代数的 access token 已全部过期，记录即可清理。
+多进程部署时其他进程要到 refresh（查库）时才得知新代数，旧 access token 在其有效期内仍可能被接受。
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenCache:
+    """
+    max_entries：缓存的 token 数上限
+    max_generations：代数记录上限，超过时清理变更早于 token_lifetime 的记录
+    token_lifetime：access token 的有效期（秒）
+    """
+
+    def __init__(self, max_entries=50000, max_generations=100000, token_lifetime=1800):
+        self.max_entries = max_entries
+        self.max_generations = max_generations
+        self.token_lifetime = token_lifetime
+        # 摘要 -> (user_id, exp, gen)
+        self._entries = OrderedDict()
+        # user_id -> 该用户缓存中的摘要集合，用于代数变更时清除
+        self._by_user = {}
+        # user_id -> (当前代数, 变更时间)
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'revoked_rejects': 0, 'revocations': 0}
+
+    def get(self, token):
+        """缓存命中且未过期时返回 user_id，否则返回 None（调用方需完整验证后调用 put）"""
+        digest = token_digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if entry[1] is None or entry[1] > now:
+                    self._entries.move_to_end(digest)
+                    self._stats['hits'] += 1
+                    return entry[0]
+                self._remove(digest)
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, token, user_id, exp=None, gen=0):
+        """登记验证通过的 token；token 的代数已过时返回 False（调用方应拒绝）"""
+        digest = token_digest(token)
+        with self._lock:
+            if gen < self._generation(user_id):
+                self._stats['revoked_rejects'] += 1
+                return False
+            self._entries[digest] = (user_id, exp, gen)
+            self._entries.move_to_end(digest)
+            self._by_user.setdefault(user_id, set()).add(digest)
+            while len(self._entries) > self.max_entries:
+                old_digest = next(iter(self._entries))
+                self._remove(old_digest)
+                self._stats['evictions'] += 1
+            return True
+
+    def _generation(self, user_id):
+        entry = self._generations.get(user_id)
+        return entry[0] if entry else 0
+
+    def _remove(self, digest):
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+        digests = self._by_user.get(entry[0])
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[entry[0]]
+
+    def generation(self, user_id):
+        with self._lock:
+            return self._generation(user_id)
+
+    def set_generation(self, user_id, gen):
+        """
+        记下用户的当前代数（退出登录/修改密码后的新值，或 refresh 时从数据库读到的值），
+        代数变大时清除该用户已缓存的旧 token；代数只增不减，更小的值忽略
+        """
+        now = time.time()
+        with self._lock:
+            if gen <= self._generation(user_id):
+                return
+            for digest in list(self._by_user.get(user_id, ())):
+                if self._entries[digest][2] < gen:
+                    self._remove(digest)
+            if len(self._generations) >= self.max_generations:
+                self._generations = {u: e for u, e in self._generations.items() if e[1] > now - self.token_lifetime}
+            self._generations[user_id] = (gen, now)
+            self._stats['revocations'] += 1
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            lookups = s['hits'] + s['misses']
+            s['hit_rate'] = round(s['hits'] / lookups, 4) if lookups else None
+            s['entries'] = len(self._entries)
+            s['generations'] = len(self._generations)
+        return s
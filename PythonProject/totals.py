@@ -0,0 +1,116 @@
+"""
+宠物平台 - 列表总数
+文件名：totals.py
+
+列表接口的 COUNT(*) 与分页查询使用相同的过滤条件，每次请求都要再扫一遍。这里提供三种取总数的方式：
+    exact      精确计数，结果按规范化后的过滤条件缓存 ttl 秒，相关写入后按标签失效
+    estimated  用优化器的行数估算（EXPLAIN），不执行计数，适合只需展示“约 N 条”的场景
+    none       不取总数，由分页查询多取一条判断 hasMore
+客户端通过 withTotal=0 跳过总数，totalMode=estimated 使用估算值。
+"""
+
+import re
+import threading
+import time
+
+
+TOTAL_MODES = ('exact', 'estimated', 'none')
+
+
+def parse_total_mode(args, default='exact'):
+    """从查询参数解析总数模式：withTotal=0 -> none；totalMode=exact/estimated/none"""
+    if str(args.get('withTotal', '1')).lower() in ('0', 'false'):
+        return 'none'
+    mode = (args.get('totalMode') or default).lower()
+    return mode if mode in TOTAL_MODES else default
+
+
+def _normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class TotalsCache:
+    """
+    ttl：精确计数的缓存时长（秒）
+    标签（tag）用于失效：计数时声明依赖的标签（如 'products'、'pet_notes:12'），
+    写入后调用 invalidate(tag) 使依赖该标签的缓存全部失效（通过标签版本号实现，不需要遍历缓存）
+    """
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'estimated': 0, 'skipped': 0, 'invalidations': 0}
+
+    def _key(self, count_sql, params, tags):
+        generations = tuple(self._generations.get(tag, 0) for tag in tags)
+        return (_normalize(count_sql), tuple(params), tuple(tags), generations)
+
+    def total(self, cursor, count_sql, params=(), tags=(), mode='exact'):
+        """
+        按模式返回总数；count_sql 形如 "SELECT COUNT(*) AS total FROM ... WHERE ..."。
+        mode 为 none 时返回 None。
+        """
+        if mode == 'none':
+            self._count('skipped')
+            return None
+        if mode == 'estimated':
+            self._count('estimated')
+            return self.estimate(cursor, count_sql, params)
+
+        with self._lock:
+            key = self._key(count_sql, params, tags)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+
+        cursor.execute(count_sql, params)
+        row = cursor.fetchone() or {}
+        total = row.get('total', 0) or 0
+
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (total, time.monotonic() + self.ttl)
+        return total
+
+    @staticmethod
+    def estimate(cursor, count_sql, params=()):
+        """用 EXPLAIN 的行数估算代替计数：取驱动表的 rows × filtered%"""
+        cursor.execute("EXPLAIN " + count_sql, params)
+        plan = cursor.fetchall()
+        if not plan:
+            return 0
+        row = plan[0]
+        rows = row.get('rows') or 0
+        filtered = row.get('filtered')
+        if filtered is not None:
+            rows = rows * float(filtered) / 100
+        return int(round(rows))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            if len(self._generations) >= self.max_entries * 10:
+                # 按用户等细粒度标签会不断增多：版本号表过大时连同缓存一起清空，避免旧缓存被误用
+                self._generations.clear()
+                self._entries.clear()
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            self._stats['invalidations'] += len(tags)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['entries'] = len(self._entries)
+        return s
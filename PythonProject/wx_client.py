@@ -0,0 +1,181 @@
+"""
+宠物平台 - 微信接口客户端
+文件名：wx_client.py
+
+原实现每次登录都裸调 requests.get，每次都新建 TCP + TLS 连接；微信接口变慢时每个登录请求占住 worker 最长 5 秒。
+WeChatClient：
+- requests.Session + HTTPAdapter 连接池，保持长连接复用
+- 舱壁（bulkhead）：同时进行的外呼不超过 max_concurrent，拿不到名额的请求等待 acquire_timeout 后直接失败
+- 熔断器：连续 failure_threshold 次网络错误/超时/5xx/系统繁忙后熔断 reset_timeout 秒，期间直接失败；
+  到期后放行一个探测请求，成功则恢复
+- code -> session 结果短期缓存（微信的 code 只能用一次，前端重复提交同一 code 时直接返回首次结果），
+  同一 code 的并发请求只外呼一次
+测试/开发时配置 WX_API_BASE 指向 wx_fake_server.py 启动的本地假服务。
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# 计入熔断的微信错误码：-1 系统繁忙
+_TRANSIENT_ERRCODES = (-1,)
+
+
+class WeChatUnavailable(Exception):
+    """熔断中或外呼名额已满"""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否放行本次调用；熔断到期后只放行一个探测请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class WeChatClient:
+    """
+    timeout：(连接超时, 读取超时) 秒
+    pool_size：连接池大小
+    max_concurrent / acquire_timeout：舱壁并发上限与等待名额的秒数
+    cache_ttl：code -> session 结果缓存秒数
+    """
+
+    def __init__(self, app_id, app_secret, base_url='https://api.weixin.qq.com', timeout=(2, 3),
+                 pool_size=10, max_concurrent=10, acquire_timeout=0.5,
+                 failure_threshold=5, reset_timeout=30, cache_ttl=300, max_cache_entries=10000):
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.cache_ttl = cache_ttl
+        self.max_cache_entries = max_cache_entries
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        # code -> (过期时间, 结果)
+        self._cache = {}
+        # code -> Event，同一 code 的并发请求等待首个请求的结果
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'cache_hits': 0, 'coalesced': 0, 'errors': 0,
+                       'rejected_open': 0, 'rejected_busy': 0}
+
+    def code2session(self, code):
+        """返回 (会话数据, None) 或 (None, 错误信息)，与原 wx_code2session 一致"""
+        with self._lock:
+            cached = self._cached(code)
+            if cached is not None:
+                self._stats['cache_hits'] += 1
+                return cached
+            event = self._inflight.get(code)
+            leader = event is None
+            if leader:
+                event = self._inflight[code] = threading.Event()
+        if not leader:
+            self._stats['coalesced'] += 1
+            event.wait(self.timeout[0] + self.timeout[1] + self.acquire_timeout)
+            with self._lock:
+                cached = self._cached(code)
+            return cached if cached is not None else (None, '微信登录处理中，请重试')
+
+        try:
+            result = self._call(code)
+            if result[0] is not None:
+                with self._lock:
+                    if len(self._cache) >= self.max_cache_entries:
+                        now = time.monotonic()
+                        self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+                        if len(self._cache) >= self.max_cache_entries:
+                            self._cache.clear()
+                    self._cache[code] = (time.monotonic() + self.cache_ttl, result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(code, None)
+            event.set()
+
+    def _cached(self, code):
+        entry = self._cache.get(code)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._cache[code]
+            return None
+        return entry[1]
+
+    def _call(self, code):
+        # 先拿名额再问熔断器：半开状态只放行一个探测请求，放行后必须真正外呼并记录结果，否则会一直停在半开
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._stats['rejected_busy'] += 1
+            return None, '微信服务繁忙'
+        if not self.breaker.allow():
+            self._slots.release()
+            self._stats['rejected_open'] += 1
+            return None, '微信服务暂不可用（熔断中）'
+        try:
+            self._stats['calls'] += 1
+            response = self._session.get(f'{self.base_url}/sns/jscode2session', params={
+                'appid': self.app_id,
+                'secret': self.app_secret,
+                'js_code': code,
+                'grant_type': 'authorization_code'
+            }, timeout=self.timeout)
+            if response.status_code >= 500:
+                raise requests.HTTPError(f'HTTP {response.status_code}')
+            data = response.json()
+        except Exception as e:
+            self._stats['errors'] += 1
+            self.breaker.record_failure()
+            return None, str(e)
+        finally:
+            self._slots.release()
+
+        if data.get('errcode'):
+            if data['errcode'] in _TRANSIENT_ERRCODES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return None, data.get('errmsg', '微信登录失败')
+        self.breaker.record_success()
+        return data, None
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['cached'] = len(self._cache)
+        s['breaker'] = self.breaker.state
+        return s
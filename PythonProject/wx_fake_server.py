@@ -0,0 +1,85 @@
+"""
+宠物平台 - 本地微信接口假服务
+文件名：wx_fake_server.py
+
+模拟 /sns/jscode2session，供开发与测试时代替 api.weixin.qq.com（不需要网络与真实 AppID）。
+用法：
+    python wx_fake_server.py [端口]        默认 8765，然后设置 WX_API_BASE=http://127.0.0.1:8765
+在脚本中使用：
+    server, base_url = start_fake_server()  # 随机端口，后台线程运行；用完 server.shutdown()
+
+按 js_code 返回不同结果：
+    以 invalid 开头   errcode 40029（code 无效）
+    以 busy 开头      errcode -1（系统繁忙，客户端计入熔断）
+    以 error 开头     HTTP 500
+    以 slow 开头      延迟 FAKE_WX_SLOW_SECONDS 秒（默认 5）后正常返回
+    其他              返回由 code 推导的固定 openid 与 session_key
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+SLOW_SECONDS = float(os.getenv('FAKE_WX_SLOW_SECONDS', 5))
+
+
+class FakeWeChatHandler(BaseHTTPRequestHandler):
+    calls = 0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/sns/jscode2session':
+            self._send(404, {'errcode': 404, 'errmsg': 'not found'})
+            return
+        FakeWeChatHandler.calls += 1
+        code = (parse_qs(url.query).get('js_code') or [''])[0]
+        if not code or code.startswith('invalid'):
+            self._send(200, {'errcode': 40029, 'errmsg': 'invalid code'})
+        elif code.startswith('busy'):
+            self._send(200, {'errcode': -1, 'errmsg': 'system error'})
+        elif code.startswith('error'):
+            self._send(500, {'errmsg': 'internal error'})
+        else:
+            if code.startswith('slow'):
+                time.sleep(SLOW_SECONDS)
+            digest = hashlib.sha1(code.encode()).hexdigest()
+            self._send(200, {'openid': f'fake_openid_{digest[:16]}', 'session_key': digest[16:40]})
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server(host='127.0.0.1', port=0):
+    """后台线程启动假服务，返回 (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), FakeWeChatHandler)
+    threading.Thread(target=server.serve_forever, name='fake-wechat', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main(argv):
+    port = int(argv[1]) if len(argv) > 1 else 8765
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeWeChatHandler)
+    print(f"🧪 微信接口假服务已启动: http://127.0.0.1:{port}（设置 WX_API_BASE 指向此地址）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))